@@ -0,0 +1,275 @@
+"""
+assemble_forms.py — Pre-built adaptive test forms for the session page
+=========================================================
+The session page used to `select('*')` four times the module length on
+every module load, shuffle client-side and pad with placeholders, ignoring
+the difficulty mix scoring-logic.ts assumes. This job builds the forms
+ahead of time instead:
+
+  • Blueprints   Module 1 is 30/40/30 Easy/Medium/Hard, Module 2 is 15/35/50
+                 (higher path) or 45/40/15 (lower path), as in
+                 scoring-logic.ts. Domains follow the official section weights.
+                 Both margins are hit exactly (largest-remainder, as in
+                 scheduler.py) and every (domain, difficulty) cell gets
+                 its own count.
+  • Families     A family is one section's Module 1 plus both Module 2
+                 forms. The three never share an item. Across families,
+                 the least-used items are preferred so exposure stays even.
+  • Shortfalls   A cell the bank can't fill borrows from the nearest
+                 difficulty in the same domain first, then from other
+                 domains. Every borrowed item is counted in the form's blueprint.
+  • Storage      One compact row per form in `sat_test_forms` (only the
+                 fields the page renders, no raw source text). A new batch
+                 is written inactive, then switched active per section. The
+                 previous batch is kept so sessions already in progress can
+                 still load their Module 2.
+
+Starting a test is then one indexed fetch of one small row
+(section, path, active, pick) instead of a 4x over-fetch of full rows.
+
+Usage:
+  python assemble_forms.py                       # rebuild FORM_FAMILIES families per section
+  python assemble_forms.py --families 40 --seed 7
+  python assemble_forms.py --snapshot forms.json # also write the forms as a static JSON snapshot
+"""
+
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import random
+from collections import Counter
+from typing import Optional
+
+from backends import DRY_RUN, make_supabase
+from scheduler import largest_remainder
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+log = logging.getLogger(__name__)
+
+FORM_FAMILIES = int(os.environ.get("FORM_FAMILIES", "20"))   # per section
+POOL_PAGE_SIZE = 1000
+PUBLISH_CHUNK = 50
+
+# Must match STAGE_CONFIG in src/app/test/session/page.tsx
+MODULE_LENGTHS = {"rw": 27, "math": 22}
+SECTION_MODULE = {"rw": "Reading_Writing", "math": "Math"}
+PATHS = ("m1", "m2_higher", "m2_lower")
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+# Must match the distributions behind MAX_*_RAW_WEIGHTED in src/lib/scoring-logic.ts
+DIFFICULTY_BLUEPRINTS = {
+    "m1":        {"Easy": 0.30, "Medium": 0.40, "Hard": 0.30},
+    "m2_higher": {"Easy": 0.15, "Medium": 0.35, "Hard": 0.50},
+    "m2_lower":  {"Easy": 0.45, "Medium": 0.40, "Hard": 0.15},
+}
+DOMAIN_BLUEPRINTS = {
+    "rw": {"Information_Ideas": 0.26, "Craft_Structure": 0.28,
+           "Expression_Ideas": 0.20, "Standard_English": 0.26},
+    "math": {"Heart_of_Algebra": 0.35, "Advanced_Math": 0.35,
+             "Problem_Solving_Data": 0.15, "Geometry_Trigonometry": 0.15},
+}
+# Where a short (domain, difficulty) cell borrows from, nearest first
+_NEAREST_DIFFICULTY = {"Easy": ("Medium", "Hard"), "Medium": ("Easy", "Hard"), "Hard": ("Medium", "Easy")}
+
+# The only columns the session page renders
+ITEM_FIELDS = ("id", "question_text", "options", "correct_answer", "rationale", "domain", "difficulty", "is_spr")
+
+# ─────────────────────────────────────────────────────────────
+# BLUEPRINTS
+# ─────────────────────────────────────────────────────────────
+def cell_targets(section: str, path: str) -> dict:
+    """
+    {(domain, difficulty): count} for one form. Domain and difficulty totals
+    are apportioned exactly; cells are then filled domain by domain against
+    the difficulty counts still open, so both margins hold.
+    """
+    n = MODULE_LENGTHS[section]
+    by_diff = largest_remainder(DIFFICULTY_BLUEPRINTS[path], n)
+    by_domain = largest_remainder(DOMAIN_BLUEPRINTS[section], n)
+    open_diff = dict(by_diff)
+    cells = {}
+    for domain, count in by_domain.items():
+        share = largest_remainder({d: float(open_diff[d]) for d in DIFFICULTIES}, count, caps=open_diff)
+        for d, k in share.items():
+            if k:
+                cells[(domain, d)] = k
+                open_diff[d] -= k
+    return cells
+
+# ─────────────────────────────────────────────────────────────
+# ITEM POOL
+# ─────────────────────────────────────────────────────────────
+def _usable(row: dict) -> bool:
+    if not row.get("question_text") or not row.get("correct_answer") or row.get("difficulty") not in DIFFICULTIES:
+        return False
+    opts = row.get("options")
+    return bool(row.get("is_spr")) or (isinstance(opts, list) and len(opts) == 4)
+
+
+def fetch_pool(supabase, section: str, page_size: int = POOL_PAGE_SIZE) -> dict:
+    """{(domain, difficulty): [item, …]} for one section, keyset-paginated by id."""
+    domains = list(DOMAIN_BLUEPRINTS[section])
+    pool: dict = {}
+    last_id, skipped = None, 0
+    while True:
+        q = supabase.table("sat_question_bank").select(", ".join(ITEM_FIELDS)) \
+            .eq("module", SECTION_MODULE[section]).in_("domain", domains).order("id").limit(page_size)
+        if last_id:
+            q = q.gt("id", last_id)
+        rows = q.execute().data or []
+        for row in rows:
+            if _usable(row):
+                pool.setdefault((row["domain"], row["difficulty"]), []).append({k: row.get(k) for k in ITEM_FIELDS})
+            else:
+                skipped += 1
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1]["id"]
+    log.info(f"Pool {section}: {sum(len(v) for v in pool.values())} usable items "
+             f"in {len(pool)} cells ({skipped} incomplete rows skipped)")
+    return pool
+
+# ─────────────────────────────────────────────────────────────
+# ASSEMBLY
+# ─────────────────────────────────────────────────────────────
+def _fallback_cells(domain: str, difficulty: str, domains: list) -> list:
+    same_domain = [(domain, d) for d in _NEAREST_DIFFICULTY[difficulty]]
+    other_domains = [(o, d) for d in (difficulty,) + _NEAREST_DIFFICULTY[difficulty] for o in domains if o != domain]
+    return same_domain + other_domains
+
+
+def pick_form(pool: dict, targets: dict, exclude: set, usage: Counter, rng: random.Random) -> tuple:
+    """
+    Fills one form. Least-exposed items first (random among ties), never an
+    id in `exclude`. Returns (items, substitutions) where substitutions
+    counts items taken from a different cell than the blueprint asked for.
+    """
+    def take(cell: tuple, k: int) -> list:
+        candidates = [it for it in pool.get(cell, ()) if it["id"] not in exclude]
+        candidates.sort(key=lambda it: (usage[it["id"]], rng.random()))
+        chosen = candidates[:k]
+        for it in chosen:
+            exclude.add(it["id"])
+            usage[it["id"]] += 1
+        return chosen
+
+    domains = sorted({domain for domain, _ in targets} | {domain for domain, _ in pool})
+    # Every cell takes its own items before any short cell borrows.
+    filled = {cell: take(cell, k) for cell, k in sorted(targets.items())}
+    items, substitutions = [], 0
+    for (domain, difficulty), k in sorted(targets.items()):
+        chosen = filled[(domain, difficulty)]
+        for cell in _fallback_cells(domain, difficulty, domains):
+            if len(chosen) >= k:
+                break
+            borrowed = take(cell, k - len(chosen))
+            substitutions += len(borrowed)
+            chosen += borrowed
+        items += chosen
+    order = {d: i for i, d in enumerate(DIFFICULTIES)}
+    rng.shuffle(items)
+    items.sort(key=lambda it: order[it["difficulty"]])   # stable: easy → hard, shuffled within a level
+    return items, substitutions
+
+
+def _mix(items: list) -> dict:
+    counts = Counter(it["difficulty"] for it in items)
+    return {d: counts.get(d, 0) for d in DIFFICULTIES}
+
+
+def _target_mix(targets: dict) -> dict:
+    return {d: sum(k for (_, diff), k in targets.items() if diff == d) for d in DIFFICULTIES}
+
+
+def assemble(pools: dict, families: int, batch: str, seed: Optional[int] = None) -> list:
+    """
+    Builds `families` families per section. Returns one row per complete
+    form. A family is dropped if any of its three forms comes up short.
+    """
+    rng = random.Random(seed)
+    forms = []
+    for section, pool in pools.items():
+        usage: Counter = Counter()
+        built, dropped, substituted = 0, 0, 0
+        for n in range(families):
+            family = f"{batch}-{section}-{n:03d}"
+            exclude: set = set()
+            rows = []
+            for path in PATHS:
+                targets = cell_targets(section, path)
+                items, subs = pick_form(pool, targets, exclude, usage, rng)
+                substituted += subs
+                rows.append({
+                    "id": f"{family}-{path}", "batch": batch, "section": section, "path": path,
+                    "family": family, "pick": rng.random(), "active": False, "items": items,
+                    "blueprint": {"target": _target_mix(targets),
+                                  "actual": _mix(items), "substitutions": subs},
+                })
+            if all(len(r["items"]) == MODULE_LENGTHS[section] for r in rows):
+                forms += rows
+                built += 1
+            else:
+                dropped += 1
+                for r in rows:
+                    for it in r["items"]:
+                        usage[it["id"]] -= 1
+        exposure = max(usage.values()) if usage else 0
+        log.info(f"Section {section}: {built} families built, {dropped} dropped (pool too small), "
+                 f"{substituted} off-blueprint items, {sum(1 for v in usage.values() if v > 0)} distinct items "
+                 f"(max exposure {exposure} forms)")
+    return forms
+
+# ─────────────────────────────────────────────────────────────
+# PUBLISH
+# ─────────────────────────────────────────────────────────────
+def publish(supabase, forms: list, batch: str) -> None:
+    """
+    Writes the batch inactive, then per section: activates it, retires the
+    previously live batch and deletes anything older. A section with no
+    forms in this batch keeps its current ones.
+    """
+    table = lambda: supabase.table("sat_test_forms")
+    for i in range(0, len(forms), PUBLISH_CHUNK):
+        table().upsert(forms[i:i + PUBLISH_CHUNK], on_conflict="id").execute()
+    for section in sorted({f["section"] for f in forms}):
+        previous = table().select("batch").eq("section", section).eq("active", True).limit(1).execute().data or []
+        table().update({"active": True}).eq("section", section).eq("batch", batch).execute()
+        table().update({"active": False}).eq("section", section).neq("batch", batch).execute()
+        if previous and previous[0]["batch"] != batch:
+            # The batch live until now stays: sessions mid-test fetch their Module 2 by family.
+            table().delete().eq("section", section).lt("batch", previous[0]["batch"]).execute()
+    log.info(f"Published batch {batch}: {len(forms)} forms" + (" (dry run — nothing written)" if DRY_RUN else ""))
+
+
+def write_snapshot(forms: list, path: str) -> None:
+    snapshot = {}
+    for f in forms:
+        snapshot.setdefault(f["section"], {}).setdefault(f["family"], {})[f["path"]] = f["items"]
+    with open(path, "w") as fh:
+        json.dump(snapshot, fh, separators=(",", ":"))
+    log.info(f"Snapshot written to {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Assemble adaptive test forms into sat_test_forms")
+    parser.add_argument("--families", type=int, default=FORM_FAMILIES, help="form families per section")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--snapshot", default=None, help="also write the forms to this JSON file")
+    args = parser.parse_args()
+
+    supabase = make_supabase()
+    batch = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%S")
+    pools = {section: fetch_pool(supabase, section) for section in MODULE_LENGTHS}
+    forms = assemble(pools, args.families, batch, args.seed)
+    if not forms:
+        log.error("No complete form could be assembled — keeping the current batch.")
+        return
+    if args.snapshot:
+        write_snapshot(forms, args.snapshot)
+    publish(supabase, forms, batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+backends.py — Client factory for the harvester and repair scripts
+=========================================================
+Every script gets its Supabase and Groq clients from make_clients(), so the
+backend can be swapped without touching pipeline code:
+
+  SUPABASE_BACKEND = live    supabase-py client (NEXT_PUBLIC_SUPABASE_URL + key)
+                   = sqlite  fakes.SQLiteSupabase at FAKE_SUPABASE_PATH
+  GROQ_BACKEND     = live    groq.Groq (GROQ_API_KEY)
+                   = fake    fakes.FakeGroq (FAKE_GROQ_LATENCY / _429_RATE / _MALFORMED_RATE / _BAD_FIELD_RATE,
+                             FAKE_GROQ_RPM_LIMIT / _TPM_LIMIT for header-reported rate limits)
+                   = record  live Groq, every response appended to GROQ_RECORDING_PATH
+                   = replay  answers served from GROQ_RECORDING_PATH, no network
+  DRY_RUN          = true    reads hit the real backend, writes are logged and dropped
+
+The supabase / groq packages are imported only when a live backend is
+selected, so the offline backends need neither installed.
+
+Live, fake and record clients are wrapped in groq_client.AdaptiveGroq, which
+owns pacing, retries and the circuit breaker for every Groq call. The groq
+SDK's own retries are turned off so a 429 isn't retried twice. Replay is not
+wrapped; it has no rate limits.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import deque
+from types import SimpleNamespace
+from typing import Optional
+
+from fakes import FakeGroq, SQLiteSupabase, completion, prompt_kind
+from groq_client import AdaptiveGroq
+
+log = logging.getLogger(__name__)
+
+_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+SUPABASE_BACKEND = os.environ.get("SUPABASE_BACKEND", "live")
+GROQ_BACKEND = os.environ.get("GROQ_BACKEND", "live")
+DRY_RUN = os.environ.get("DRY_RUN", "false").strip().lower() in ("1", "true", "yes")
+FAKE_SUPABASE_PATH = os.environ.get("FAKE_SUPABASE_PATH", os.path.join(_CACHE_DIR, "fake_supabase.sqlite3"))
+GROQ_RECORDING_PATH = os.environ.get("GROQ_RECORDING_PATH", os.path.join(_CACHE_DIR, "groq_recording.jsonl"))
+
+# RPCs that modify data (suppressed under DRY_RUN)
+WRITE_RPCS = {"bulk_update_tags"}
+
+# ─────────────────────────────────────────────────────────────
+# RECORD / REPLAY
+# ─────────────────────────────────────────────────────────────
+def request_key(model: str, messages: list) -> str:
+    return hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RecordingGroq:
+    """Wraps a live client; appends each successful completion to a JSONL file."""
+
+    def __init__(self, inner, path: str = GROQ_RECORDING_PATH):
+        self._inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: list, **kwargs):
+        response = self._inner.chat.completions.create(model=model, messages=messages, **kwargs)
+        usage = getattr(response, "usage", None)
+        entry = {
+            "key": request_key(model, messages),
+            "kind": prompt_kind(messages[-1]["content"]),
+            "model": model,
+            "content": response.choices[0].message.content,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return response
+
+
+class ReplayGroq:
+    """
+    Serves recorded completions. An identical request gets its own recording;
+    otherwise the next unused recording of the same prompt kind is returned
+    (generation prompts embed random seeds and passages, so exact matches
+    are the exception). Raises once the recording is exhausted.
+    """
+
+    def __init__(self, path: str = GROQ_RECORDING_PATH):
+        self.path = path
+        self.requests = 0
+        self._by_key: dict = {}
+        self._by_kind: dict = {}
+        self._used: set = set()
+        self._lock = threading.Lock()
+        with open(path) as f:
+            for n, line in enumerate(f):
+                if line.strip():
+                    entry = json.loads(line)
+                    self._by_key.setdefault(entry["key"], deque()).append(n)
+                    self._by_kind.setdefault(entry["kind"], deque()).append((n, entry))
+        self._entries = {n: e for q in self._by_kind.values() for n, e in q}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _take(self, key: str, kind: str) -> Optional[dict]:
+        exact = self._by_key.get(key)
+        while exact:
+            n = exact.popleft()
+            if n not in self._used:
+                self._used.add(n)
+                return self._entries[n]
+        queue = self._by_kind.get(kind)
+        while queue:
+            n, entry = queue.popleft()
+            if n not in self._used:
+                self._used.add(n)
+                return entry
+        return None
+
+    def create(self, model: str, messages: list, **kwargs):
+        with self._lock:
+            self.requests += 1
+            entry = self._take(request_key(model, messages), prompt_kind(messages[-1]["content"]))
+        if entry is None:
+            raise RuntimeError(f"Replay exhausted: no recorded response left in {self.path}")
+        return completion(entry["content"], entry["model"], entry["prompt_tokens"], entry["completion_tokens"])
+
+# ─────────────────────────────────────────────────────────────
+# DRY RUN
+# ─────────────────────────────────────────────────────────────
+class _DroppedWrite:
+    """Absorbs filters chained onto a write and returns what a real write would."""
+
+    def __init__(self, table: str, verb: str, payload):
+        self._table = table
+        self._verb = verb
+        self._payload = payload
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        rows = self._payload if isinstance(self._payload, list) else [self._payload] if self._payload else []
+        log.info(f"[dry-run] {self._verb} on {self._table} dropped ({len(rows)} rows)")
+        data = rows if self._verb in ("insert", "upsert") else []
+        return SimpleNamespace(data=data, count=None)
+
+
+class _DryRunTable:
+    def __init__(self, inner, name: str):
+        self._inner = inner
+        self._name = name
+
+    def __getattr__(self, name):
+        if name in ("insert", "upsert", "update", "delete"):
+            return lambda payload=None, *args, **kwargs: _DroppedWrite(self._name, name, payload)
+        return getattr(self._inner, name)
+
+
+class DryRunSupabase:
+    """Pass-through for reads; inserts, updates and write RPCs are logged and dropped."""
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    def table(self, name: str):
+        return _DryRunTable(self._inner.table(name), name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None):
+        if fn not in WRITE_RPCS:
+            return self._inner.rpc(fn, params)
+        payload = (params or {}).get("payload") or []
+        log.info(f"[dry-run] rpc {fn} dropped ({len(payload)} rows)")
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data={"updated": len(payload), "failed": []}, count=None))
+
+# ─────────────────────────────────────────────────────────────
+# FACTORY
+# ─────────────────────────────────────────────────────────────
+def make_supabase():
+    if SUPABASE_BACKEND == "sqlite":
+        os.makedirs(os.path.dirname(FAKE_SUPABASE_PATH) or ".", exist_ok=True)
+        client = SQLiteSupabase(FAKE_SUPABASE_PATH)
+    elif SUPABASE_BACKEND == "live":
+        url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
+        key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+        if not all([url, key]):
+            raise ValueError("Missing required environment variables: NEXT_PUBLIC_SUPABASE_URL, "
+                             "SUPABASE_SERVICE_ROLE_KEY (or ANON)")
+        from supabase import create_client
+        client = create_client(url, key)
+    else:
+        raise ValueError(f"Unknown SUPABASE_BACKEND: {SUPABASE_BACKEND!r} (live | sqlite)")
+    return DryRunSupabase(client) if DRY_RUN else client
+
+
+def _live_groq():
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("Missing required environment variable: GROQ_API_KEY")
+    from groq import Groq
+    return Groq(api_key=api_key, max_retries=0)     # AdaptiveGroq retries
+
+
+def make_groq():
+    if GROQ_BACKEND == "live":
+        return AdaptiveGroq(_live_groq())
+    if GROQ_BACKEND == "fake":
+        return AdaptiveGroq(FakeGroq(
+            latency=float(os.environ.get("FAKE_GROQ_LATENCY", "0.8")),
+            rate_429=float(os.environ.get("FAKE_GROQ_429_RATE", "0")),
+            malformed_rate=float(os.environ.get("FAKE_GROQ_MALFORMED_RATE", "0")),
+            bad_field_rate=float(os.environ.get("FAKE_GROQ_BAD_FIELD_RATE", "0")),
+            rpm_limit=int(os.environ.get("FAKE_GROQ_RPM_LIMIT", "0")),
+            tpm_limit=int(os.environ.get("FAKE_GROQ_TPM_LIMIT", "0")),
+        ))
+    if GROQ_BACKEND == "record":
+        return RecordingGroq(AdaptiveGroq(_live_groq()))
+    if GROQ_BACKEND == "replay":
+        return ReplayGroq()
+    raise ValueError(f"Unknown GROQ_BACKEND: {GROQ_BACKEND!r} (live | fake | record | replay)")
+
+
+def make_clients() -> tuple:
+    """(supabase, groq_client) for the configured backends."""
+    supabase, groq_client = make_supabase(), make_groq()
+    if SUPABASE_BACKEND != "live" or GROQ_BACKEND != "live" or DRY_RUN:
+        log.info(f"Backends: supabase={SUPABASE_BACKEND}, groq={GROQ_BACKEND}, dry_run={DRY_RUN}")
+    return supabase, groq_client
@@ -0,0 +1,328 @@
+"""
+bench.py — Offline end-to-end throughput benchmark
+=========================================================
+Runs the real pipeline code against the offline stand-ins in fakes.py (or a
+recorded Groq session) with every local cache in a throw-away directory, so
+nothing touches Groq quota, the production database or .cache/.
+
+Scenarios:
+  main         scraper.main(): plan → generate → validate → near-dup → bulk insert → auto-repair
+  auto_repair  scraper.auto_repair_untagged() over planted broken rows (batched classify + RPC)
+  repair_db    repair_db.stream_repair() over planted broken rows (per-row classify + update)
+
+Reported per scenario: accepted questions (or repaired rows) per minute,
+Groq requests per accepted item, and p50 / p99 / total time per stage. Repair
+scenarios also report requests per model tier, escalations and agreement.
+
+Usage:
+  python bench.py                                   # all scenarios
+  python bench.py main --questions 150 --latency 1.2 --rate-429 0.05
+  python bench.py auto_repair repair_db --broken-rows 60
+  python bench.py repair_db --classify-model llama-3.3-70b-versatile   # single-tier baseline
+  python bench.py main --tpm-limit 60000 --rate-429 0   # header-paced vs. GROQ_HEADER_PACING=0
+  python bench.py main --replay .cache/groq_recording.jsonl
+  python bench.py --json bench_report.json
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from fakes import FakeGroq, SQLiteSupabase, fake_question
+
+log = logging.getLogger(__name__)
+
+SCENARIOS = ("main", "auto_repair", "repair_db")
+BROKEN_DOMAINS = ["Algebra", "Information and Ideas", "Craft & Structure", "Geometry", "Reading"]
+
+# ─────────────────────────────────────────────────────────────
+# STAGE TIMING
+# ─────────────────────────────────────────────────────────────
+class Stages:
+    """Collects wall-clock samples per stage by wrapping functions in place."""
+
+    def __init__(self):
+        self.samples: dict = {}
+        self._patched: list = []
+        self._lock = threading.Lock()
+
+    def wrap(self, owner, attr: str, stage: str) -> None:
+        original = getattr(owner, attr)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.samples.setdefault(stage, []).append(elapsed)
+
+        setattr(owner, attr, timed)
+        self._patched.append((owner, attr, original))
+
+    def restore(self) -> None:
+        for owner, attr, original in reversed(self._patched):
+            setattr(owner, attr, original)
+        self._patched.clear()
+
+    def summary(self) -> dict:
+        from metrics import stage_summary
+        return stage_summary(self.samples)
+
+# ─────────────────────────────────────────────────────────────
+# FIXTURES
+# ─────────────────────────────────────────────────────────────
+def _isolate(workdir: str) -> None:
+    """Points every cache / state path and both backends at `workdir` (before the pipeline modules load)."""
+    os.environ.update({
+        "SUPABASE_BACKEND": "sqlite",
+        "GROQ_BACKEND": "fake",
+        "DRY_RUN": "false",
+        "FAKE_SUPABASE_PATH": os.path.join(workdir, "supabase.sqlite3"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite3"),
+        "SCHEDULER_STATE_PATH": os.path.join(workdir, "scheduler_state.json"),
+        "CORPUS_DIR": os.path.join(workdir, "corpus"),
+        "NEAR_DUP_INDEX_DIR": os.path.join(workdir, "near_dup"),
+        "LOCAL_CLASSIFIER_PATH": os.path.join(workdir, "local_classifier.json"),
+        "REPAIR_CHECKPOINT_PATH": os.path.join(workdir, "repair_checkpoint.json"),
+    })
+
+
+def bank_rows(n: int, rng: random.Random) -> list:
+    from dedup import content_hash
+    from scraper import ALL_BUCKETS
+    rows = []
+    for _ in range(n):
+        q = fake_question(rng, *rng.choice(ALL_BUCKETS))
+        q.update(content_hash=content_hash(q["question_text"]), source_method="Automated_Pipeline")
+        rows.append(q)
+    return rows
+
+
+def broken_rows(n: int, rng: random.Random) -> list:
+    rows = bank_rows(n, rng)
+    for r in rows:
+        r["domain"] = rng.choice(BROKEN_DOMAINS)
+        if rng.random() < 0.2:
+            r["difficulty"] = "Moderate"
+    return rows
+
+
+def seed_corpus(rng: random.Random, n: int = 200) -> None:
+    from corpus import SourceCorpus, make_passage
+    corpus = SourceCorpus.load()
+    for _ in range(n):
+        corpus.add(make_passage("bench", fake_question(rng, "Math", "Heart_of_Algebra", "Easy", True)["question_text"] * 3))
+    corpus.save()
+
+
+def make_groq(args):
+    if args.replay:
+        from backends import ReplayGroq
+        return ReplayGroq(args.replay)
+    from groq_client import AdaptiveGroq
+    return AdaptiveGroq(FakeGroq(latency=args.latency, rate_429=args.rate_429, malformed_rate=args.malformed,
+                                 seed=args.seed, bad_field_rate=args.bad_field,
+                                 rpm_limit=args.rpm_limit, tpm_limit=args.tpm_limit,
+                                 small_error_rate=args.small_error))
+
+
+def _route(args) -> None:
+    """Per-model rate budgets and the classify tier for this run (routing.py)."""
+    import routing
+
+    routing.GROQ_RPM, routing.GROQ_RPM_CLASSIFY = args.rpm, args.rpm_classify
+    if args.classify_model:
+        routing.MODEL_CLASSIFY = args.classify_model
+    routing.reset_limiters()
+
+
+def _count_broken(db: SQLiteSupabase) -> int:
+    from scraper import BROKEN_ROWS_FILTER
+    return db.table("sat_question_bank").select("id", count="exact").or_(BROKEN_ROWS_FILTER).limit(1).execute().count
+
+# ─────────────────────────────────────────────────────────────
+# SCENARIOS
+# ─────────────────────────────────────────────────────────────
+def bench_main(args, stages: Stages, rng: random.Random) -> dict:
+    import near_dup
+    import scraper
+
+    db = SQLiteSupabase()
+    db.seed("sat_question_bank", bank_rows(args.seed_rows, rng))
+    seed_corpus(rng)
+    groq = make_groq(args)
+
+    scraper.QUESTIONS_PER_RUN = args.questions
+    scraper.GROQ_RPM = args.rpm
+    _route(args)
+    scraper.EXTERNAL_SOURCES = []          # offline: sample from the seeded corpus only
+    stages.wrap(groq.chat.completions, "create", "groq_request")
+    stages.wrap(scraper, "build_target_queue", "plan")
+    stages.wrap(scraper, "load_near_dup_index", "near_dup_sync")
+    stages.wrap(scraper, "_generate_and_validate", "generate+validate")
+    stages.wrap(near_dup.NearDupIndex, "check", "near_dup_check")
+    stages.wrap(scraper, "flush_batch", "db_flush")
+    stages.wrap(scraper, "auto_repair_untagged", "auto_repair")
+
+    before = db.count()
+    started = time.monotonic()
+    scraper.main(db, groq)
+    return {"requested": args.questions, "accepted": db.count() - before,
+            "wall_s": time.monotonic() - started, "groq": groq}
+
+
+def bench_auto_repair(args, stages: Stages, rng: random.Random) -> dict:
+    import scraper
+
+    db = SQLiteSupabase()
+    db.seed("sat_question_bank", bank_rows(args.seed_rows, rng))
+    db.seed("sat_question_bank", broken_rows(args.broken_rows, rng), checked=False)
+    groq = make_groq(args)
+
+    scraper.GROQ_RPM = args.rpm
+    _route(args)
+    stages.wrap(groq.chat.completions, "create", "groq_request")
+    stages.wrap(scraper, "classify_batch", "classify_batch")
+    stages.wrap(scraper, "bulk_update_tags", "db_bulk_update")
+
+    before = _count_broken(db)
+    started = time.monotonic()
+    scraper.auto_repair_untagged(db, groq)
+    return {"requested": before, "accepted": before - _count_broken(db),
+            "wall_s": time.monotonic() - started, "groq": groq}
+
+
+def bench_repair_db(args, stages: Stages, rng: random.Random) -> dict:
+    import repair_db
+
+    db = SQLiteSupabase()
+    db.seed("sat_question_bank", bank_rows(args.seed_rows, rng))
+    db.seed("sat_question_bank", broken_rows(args.broken_rows, rng), checked=False)
+    groq = make_groq(args)
+
+    repair_db.supabase, repair_db.groq_client = db, groq
+    _route(args)
+    stages.wrap(groq.chat.completions, "create", "groq_request")
+    stages.wrap(repair_db, "repair_tags", "classify")
+    stages.wrap(repair_db, "repair_row", "repair_row")
+
+    before = _count_broken(db)
+    started = time.monotonic()
+    repair_db.stream_repair(page_size=args.page_size, reset=True)
+    return {"requested": before, "accepted": before - _count_broken(db),
+            "wall_s": time.monotonic() - started, "groq": groq}
+
+
+RUNNERS = {"main": bench_main, "auto_repair": bench_auto_repair, "repair_db": bench_repair_db}
+
+# ─────────────────────────────────────────────────────────────
+# REPORT
+# ─────────────────────────────────────────────────────────────
+def run(scenario: str, args) -> dict:
+    from metrics import metrics
+    from routing import routing_summary
+
+    metrics.reset()
+    stages = Stages()
+    rng = random.Random(args.seed)
+    sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with sink:
+            res = RUNNERS[scenario](args, stages, rng)
+    finally:
+        stages.restore()
+    groq = res.pop("groq")
+    fake = getattr(groq, "inner", groq)
+    counters = metrics.snapshot()
+    accepted = res["accepted"]
+    report = {
+        "scenario": scenario,
+        **res,
+        "wall_s": round(res["wall_s"], 2),
+        "per_minute": round(accepted / max(res["wall_s"], 1e-9) * 60, 1),
+        "groq_requests": groq.requests,
+        "requests_per_accepted": round(groq.requests / accepted, 3) if accepted else None,
+        "fake_groq": fake.stats() if isinstance(fake, FakeGroq) else None,
+        "adaptive": {k: counters.get(k, 0) for k in ("rate_limited", "retries", "retries_exhausted",
+                                                    "groq_breaker_opened", "groq_breaker_rejected")},
+        "routing": routing_summary(counters) if counters.get("repair_classify_requests") else None,
+        "stages": stages.summary(),
+    }
+    return report
+
+
+def print_report(r: dict) -> None:
+    unit = "questions" if r["scenario"] == "main" else "rows repaired"
+    print(f"\n== {r['scenario']} ==  {r['accepted']}/{r['requested']} {unit} in {r['wall_s']}s  "
+          f"→ {r['per_minute']} /min, {r['requests_per_accepted']} Groq requests per item "
+          f"({r['groq_requests']} requests{'; ' + json.dumps(r['fake_groq']) if r['fake_groq'] else ''})")
+    print(f"  adaptive client: {json.dumps(r['adaptive'])}")
+    if r["routing"]:
+        print(f"  model tiers: {json.dumps(r['routing'])}")
+    print(f"  {'stage':<20}{'n':>6}{'p50 ms':>11}{'p99 ms':>11}{'total s':>10}")
+    for stage, s in sorted(r["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+        print(f"  {stage:<20}{s['n']:>6}{s['p50_ms']:>11.1f}{s['p99_ms']:>11.1f}{s['total_s']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the harvester and repair paths.")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--questions", type=int, default=75, help="main: QUESTIONS_PER_RUN")
+    parser.add_argument("--seed-rows", type=int, default=2000, help="valid rows preloaded into the bank")
+    parser.add_argument("--broken-rows", type=int, default=40, help="repair scenarios: rows with out-of-enum tags")
+    parser.add_argument("--page-size", type=int, default=500, help="repair_db: keyset page size")
+    parser.add_argument("--latency", type=float, default=0.8, help="fake Groq mean seconds per request")
+    parser.add_argument("--rate-429", type=float, default=0.02, help="fake Groq probability of a 429")
+    parser.add_argument("--malformed", type=float, default=0.02, help="fake Groq probability of truncated JSON")
+    parser.add_argument("--bad-field", type=float, default=0.05,
+                        help="fake Groq probability a question has 3 options or no answer")
+    parser.add_argument("--rpm", type=float, default=float(os.environ.get("GROQ_RPM", "28")),
+                        help="token-bucket rate (default: production GROQ_RPM)")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="fake Groq requests/min before it answers 429 (0: none)")
+    parser.add_argument("--tpm-limit", type=int, default=0, help="fake Groq tokens/min before it answers 429 (0: none)")
+    parser.add_argument("--rpm-classify", type=float, default=float(os.environ.get("GROQ_RPM_CLASSIFY", "28")),
+                        help="token-bucket rate of the classify model")
+    parser.add_argument("--classify-model", help="classify tier model (set it to the large model to disable tiering)")
+    parser.add_argument("--small-error", type=float, default=0.15,
+                        help="fake Groq probability the small model mis-tags a question")
+    parser.add_argument("--replay", help="serve Groq answers from a recording instead of the fake")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show pipeline logs and prints")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    workdir = tempfile.mkdtemp(prefix="harvester-bench-")
+    _isolate(workdir)
+    random.seed(args.seed)
+    try:
+        reports = []
+        for scenario in args.scenarios:
+            reports.append(run(scenario, args))
+            print_report(reports[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+corpus.py — Source-material corpus for the harvester
+=========================================================
+Replaces the single blocking urlopen() + 3 KB raw JSON/HTML snippet that was
+pasted into every prompt and stored on every row.
+
+  1. Prefetch: a few random pages from each EXTERNAL_SOURCES endpoint,
+     fetched concurrently over one pooled httpx connection pool.
+  2. Extract: clean passages (title + abstract / first sentence / summary)
+     from the Crossref, OpenLibrary and Gutendex JSON responses.
+  3. Store: passages are content-addressed, de-duplicated and kept in a
+     size-capped JSONL file under .cache/corpus (oldest dropped first).
+  4. Sample: each question gets its own passage. If the network is down
+     the cached corpus is used as-is, and nothing touches the network
+     once the pipeline has started.
+
+Rows reference their passage by `source_ref`; the passage text itself lives
+once in the `source_passages` table.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+from typing import Optional
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+CORPUS_DIR = os.environ.get("CORPUS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "corpus"))
+CORPUS_MAX_PASSAGES = int(os.environ.get("CORPUS_MAX_PASSAGES", "5000"))
+CORPUS_PAGES_PER_SOURCE = int(os.environ.get("CORPUS_PAGES_PER_SOURCE", "2"))
+PASSAGE_MIN_CHARS = 80
+PASSAGE_MAX_CHARS = 900
+FETCH_TIMEOUT = 10.0
+OFFLINE_FALLBACK = "(Simulated random conceptual math or reading text due to network block)"
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
+# ─────────────────────────────────────────────────────────────
+# EXTRACTION
+# ─────────────────────────────────────────────────────────────
+def _clean(text: str) -> str:
+    return _WS_RE.sub(" ", unescape(_TAG_RE.sub(" ", text or ""))).strip()
+
+
+def _sentences(parts: list) -> str:
+    return " ".join(p if p.endswith((".", "!", "?")) else p + "." for p in parts if p)
+
+
+def _first(value) -> str:
+    if isinstance(value, list):
+        return str(value[0]) if value else ""
+    return str(value or "")
+
+
+def extract_crossref(payload: dict) -> list:
+    out = []
+    for item in (payload.get("message") or {}).get("items") or []:
+        title = _clean(_first(item.get("title")))
+        abstract = _clean(item.get("abstract", ""))   # JATS XML → plain text
+        out.append(_sentences([title, abstract]))
+    return out
+
+
+def extract_openlibrary(payload: dict) -> list:
+    out = []
+    for doc in payload.get("docs") or []:
+        parts = [_clean(doc.get("title", ""))]
+        sentence = doc.get("first_sentence")
+        if sentence:
+            parts.append(_clean(_first(sentence)))
+        subjects = doc.get("subject") or []
+        if subjects:
+            parts.append("Subjects: " + ", ".join(_clean(s) for s in subjects[:8]))
+        out.append(_sentences(parts))
+    return out
+
+
+def extract_gutendex(payload: dict) -> list:
+    out = []
+    for book in payload.get("results") or []:
+        parts = [_clean(book.get("title", ""))]
+        parts += [_clean(s) for s in (book.get("summaries") or [])[:1]]
+        subjects = book.get("subjects") or []
+        if subjects:
+            parts.append("Subjects: " + "; ".join(_clean(s) for s in subjects[:6]))
+        out.append(_sentences(parts))
+    return out
+
+
+_EXTRACTORS = {
+    "api.crossref.org": ("crossref", extract_crossref),
+    "openlibrary.org": ("openlibrary", extract_openlibrary),
+    "gutendex.com": ("gutendex", extract_gutendex),
+}
+
+
+def _extractor_for(url: str) -> tuple:
+    host = httpx.URL(url).host
+    return _EXTRACTORS.get(host, (host, lambda payload: []))
+
+
+def make_passage(source: str, text: str) -> Optional[dict]:
+    text = text[:PASSAGE_MAX_CHARS].rsplit(" ", 1)[0] if len(text) > PASSAGE_MAX_CHARS else text
+    if len(text) < PASSAGE_MIN_CHARS:
+        return None
+    pid = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()[:16]
+    return {"id": f"{source}:{pid}", "source": source, "text": text, "fetched_at": int(time.time())}
+
+# ─────────────────────────────────────────────────────────────
+# CORPUS
+# ─────────────────────────────────────────────────────────────
+class SourceCorpus:
+    def __init__(self, path: str = CORPUS_DIR, max_passages: int = CORPUS_MAX_PASSAGES):
+        self.path = path
+        self.max_passages = max_passages
+        self.passages: dict = {}          # id -> passage (insertion order = age)
+
+    @classmethod
+    def load(cls, path: str = CORPUS_DIR) -> "SourceCorpus":
+        corpus = cls(path)
+        try:
+            with open(os.path.join(path, "passages.jsonl")) as f:
+                for line in f:
+                    if line.strip():
+                        p = json.loads(line)
+                        corpus.passages[p["id"]] = p
+        except OSError:
+            pass
+        return corpus
+
+    def save(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, "passages.jsonl.tmp")
+        with open(tmp, "w") as f:
+            for p in self.passages.values():
+                f.write(json.dumps(p) + "\n")
+        os.replace(tmp, os.path.join(self.path, "passages.jsonl"))
+
+    def add(self, passage: Optional[dict]) -> bool:
+        if passage is None or passage["id"] in self.passages:
+            return False
+        self.passages[passage["id"]] = passage
+        while len(self.passages) > self.max_passages:
+            self.passages.pop(next(iter(self.passages)))
+        return True
+
+    def refresh(self, sources: list, pages_per_source: int = CORPUS_PAGES_PER_SOURCE) -> int:
+        """
+        Fetches `pages_per_source` random pages of each source concurrently over
+        one pooled client. Network failures are logged and ignored — the
+        cached corpus is still usable. Returns the number of new passages.
+        """
+        urls = [src + str(random.randint(1, 1000)) for src in sources for _ in range(pages_per_source)]
+        added = 0
+        started = time.monotonic()
+        limits = httpx.Limits(max_connections=len(sources) * 2, max_keepalive_connections=len(sources) * 2)
+        with httpx.Client(timeout=FETCH_TIMEOUT, limits=limits, follow_redirects=True,
+                          headers={"User-Agent": "Mozilla/5.0 (SAT harvester)"}) as client:
+            def fetch(url: str) -> list:
+                source, extract = _extractor_for(url)
+                try:
+                    resp = client.get(url)
+                    resp.raise_for_status()
+                    return [make_passage(source, _clean(t)) for t in extract(resp.json())]
+                except Exception as e:
+                    log.warning(f"Corpus fetch failed for {url}: {e}")
+                    return []
+
+            with ThreadPoolExecutor(max_workers=len(urls) or 1) as pool:
+                for passages in pool.map(fetch, urls):
+                    added += sum(self.add(p) for p in passages)
+        log.info(f"Corpus refresh: +{added} passages from {len(urls)} pages in "
+                 f"{time.monotonic() - started:.1f}s ({len(self.passages)} cached)")
+        return added
+
+    def sample(self, n: int) -> list:
+        """
+        n passages, distinct where the corpus allows it. Falls back to a
+        placeholder passage when the corpus is empty (first run offline).
+        """
+        pool = list(self.passages.values())
+        if not pool:
+            return [{"id": None, "source": None, "text": OFFLINE_FALLBACK}] * n
+        out = []
+        while len(out) < n:
+            out += random.sample(pool, min(len(pool), n - len(out)))
+        return out
+
+
+def publish_passages(supabase, passages: list) -> None:
+    """Upserts the passages referenced this run into `source_passages` (one call)."""
+    rows = {p["id"]: {"id": p["id"], "source": p["source"], "passage_text": p["text"]} for p in passages if p["id"]}
+    if not rows:
+        return
+    try:
+        supabase.table("source_passages").upsert(list(rows.values()), on_conflict="id", ignore_duplicates=True).execute()
+    except Exception as e:
+        log.warning(f"Could not publish source passages: {e}")
@@ -0,0 +1,259 @@
+"""
+daemon.py — Long-running harvester (python scraper.py --daemon)
+=========================================================
+The cron workflow pays a cold start 96 times a day: pip install, a fresh
+interpreter, new Supabase / Groq clients, a full inventory scan, a near-dup
+index load and a corpus fetch. The daemon does all of that once and then
+harvests continuously:
+
+  • Warm state     clients, scheduler state, source corpus, near-dup index
+                   and per-bucket inventory counts live in memory.
+  • Cycles         every DAEMON_CYCLE_SECONDS a small queue is planned (the
+                   daily Groq quota spread over the cycles left today) and
+                   run through scraper.run_pipeline(). One token bucket is
+                   shared by every cycle and the repair sweep, so GROQ_RPM
+                   holds across cycles.
+  • Inventory      counts are bumped in memory per accepted question; the
+                   view is re-read and the near-dup index re-synced every
+                   DAEMON_INVENTORY_REFRESH_SECONDS to pick up other writers.
+  • Checkpoints    every RUN_INTERVAL_MINUTES (one cron run's worth) the
+                   scheduler state, corpus and near-dup index are saved, the
+                   run report is written and acceptance history is decayed —
+                   so reports and scheduler behaviour match cron runs.
+  • Repair         auto_repair_untagged() every DAEMON_REPAIR_SECONDS.
+  • Shutdown       SIGTERM / SIGINT finish the current cycle, checkpoint and exit.
+  • Status         GET http://127.0.0.1:DAEMON_STATUS_PORT/healthz (200 / 503)
+                   and /status (JSON); DAEMON_STATUS_PORT=0 disables it.
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import scraper
+from backends import DRY_RUN, make_clients
+from corpus import SourceCorpus, publish_passages
+from metrics import metrics
+from ratelimit import TokenBucket
+from routing import routing_summary
+from salvage import recovery_summary
+from scheduler import RUN_INTERVAL_MINUTES, SchedulerState
+
+log = logging.getLogger(__name__)
+
+DAEMON_CYCLE_SECONDS = float(os.environ.get("DAEMON_CYCLE_SECONDS", "60"))
+DAEMON_INVENTORY_REFRESH_SECONDS = float(os.environ.get("DAEMON_INVENTORY_REFRESH_SECONDS", "1800"))
+DAEMON_CORPUS_REFRESH_SECONDS = float(os.environ.get("DAEMON_CORPUS_REFRESH_SECONDS", "3600"))
+DAEMON_REPAIR_SECONDS = float(os.environ.get("DAEMON_REPAIR_SECONDS", str(RUN_INTERVAL_MINUTES * 60)))
+DAEMON_STATUS_HOST = "127.0.0.1"
+DAEMON_STATUS_PORT = int(os.environ.get("DAEMON_STATUS_PORT", "8787"))
+UNHEALTHY_AFTER_CYCLES = 3     # /healthz fails once no cycle has finished for this many cycle lengths
+
+
+class Harvester:
+    def __init__(self, supabase=None, groq_client=None, cycle_seconds: float = DAEMON_CYCLE_SECONDS):
+        if supabase is None or groq_client is None:
+            supabase, groq_client = make_clients()
+        self.supabase = supabase
+        self.groq_client = groq_client
+        self.cycle_seconds = cycle_seconds
+        self.stop = threading.Event()
+        self.limiter = TokenBucket(scraper.GROQ_RPM, burst=scraper.HARVEST_CONCURRENCY)
+        self.state = SchedulerState.load()
+        self.corpus = SourceCorpus.load()
+        self.near_dups = None
+        self.inventory: dict = {}
+        self.started_at = time.time()
+        self.cycles = 0
+        self.totals = {"accepted": 0, "skipped": 0, "errors": 0, "repair_requests": 0}
+        self.last_cycle_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._due = {"inventory": 0.0, "corpus": 0.0, "repair": 0.0,
+                     "checkpoint": time.monotonic() + RUN_INTERVAL_MINUTES * 60}
+        self._lock = threading.Lock()
+
+    # ── periodic work ──
+    def _is_due(self, task: str, every: float) -> bool:
+        now = time.monotonic()
+        if now < self._due[task]:
+            return False
+        self._due[task] = now + every
+        return True
+
+    def refresh_inventory(self) -> None:
+        with metrics.timer("inventory_refresh"):
+            inventory = scraper.read_inventory(self.supabase)
+        if inventory or not self.inventory:    # a failed read keeps the in-memory counts
+            with self._lock:
+                self.inventory = inventory
+        with metrics.timer("near_dup_sync"):
+            if self.near_dups is None:
+                self.near_dups = scraper.load_near_dup_index(self.supabase)
+            else:
+                try:
+                    self.near_dups.sync(self.supabase)
+                except Exception as e:
+                    log.warning(f"Near-dup index sync failed: {e}")
+        log.info(f"Inventory refreshed: {sum(self.inventory.values())} rows in {len(self.inventory)} buckets")
+
+    def cycle(self) -> None:
+        """Plans and runs one small queue against the warm state."""
+        if self._is_due("inventory", DAEMON_INVENTORY_REFRESH_SECONDS):
+            self.refresh_inventory()
+        if self._is_due("corpus", DAEMON_CORPUS_REFRESH_SECONDS):
+            with metrics.timer("corpus"):
+                self.corpus.refresh(scraper.EXTERNAL_SOURCES)
+
+        with metrics.timer("plan"):
+            queue = scraper.build_target_queue(self.supabase, self.state, existing=self.inventory,
+                                               interval_minutes=self.cycle_seconds / 60)
+        if queue:
+            passages = self.corpus.sample(len(queue))
+            publish_passages(self.supabase, passages)
+            inserted, skipped = scraper.run_pipeline(
+                self.supabase, self.groq_client, queue, passages,
+                self.near_dups, self.state, limiter=self.limiter, inventory=self.inventory,
+                inventory_lock=self._lock)
+            with self._lock:
+                self.totals["accepted"] += inserted
+                self.totals["skipped"] += skipped
+        else:
+            log.info("Daily Groq quota exhausted — idling until it resets.")
+
+        if self._is_due("repair", DAEMON_REPAIR_SECONDS):
+            n = scraper.auto_repair_untagged(self.supabase, self.groq_client, limiter=self.limiter)
+            self.state.spend(n)
+            with self._lock:
+                self.totals["repair_requests"] += n
+
+    def checkpoint(self) -> None:
+        """Persists warm state and closes the current report window (one cron run's worth)."""
+        try:
+            if DRY_RUN:
+                self.state.save_spend()
+            else:
+                self.state.save()
+            self.corpus.save()
+            if self.near_dups is not None and not DRY_RUN:
+                self.near_dups.save()
+        except OSError as e:
+            log.warning(f"Could not persist local caches: {e}")
+        metrics.write({
+            "mode": "daemon", "dry_run": DRY_RUN, "model": scraper.MODEL, "cycles": self.cycles,
+            "generation_batch_size": scraper.GENERATION_BATCH_SIZE, "concurrency": scraper.HARVEST_CONCURRENCY,
+            "groq_rpm": scraper.GROQ_RPM, "daily_quota_left": self.state.remaining_quota(),
+            "recovery": recovery_summary(metrics.snapshot()),
+            "routing": routing_summary(metrics.snapshot()),
+        })
+        metrics.reset()
+        self.state.start_run()
+
+    # ── main loop ──
+    def run(self) -> None:
+        log.info(f"Harvester daemon started: cycle {self.cycle_seconds:g}s, checkpoint every "
+                 f"{RUN_INTERVAL_MINUTES} min" + (" (DRY RUN — no writes)" if DRY_RUN else ""))
+        metrics.reset()
+        while not self.stop.is_set():
+            started = time.monotonic()
+            try:
+                self.cycle()
+                self.last_error = None
+            except Exception as e:
+                with self._lock:
+                    self.totals["errors"] += 1
+                    self.last_error = str(e)
+                log.error(f"Daemon cycle failed: {e}")
+            with self._lock:
+                self.cycles += 1
+                self.last_cycle_at = time.time()
+            if self._is_due("checkpoint", RUN_INTERVAL_MINUTES * 60):
+                self.checkpoint()
+            self.stop.wait(max(0.0, self.cycle_seconds - (time.monotonic() - started)))
+        log.info("Shutdown requested — writing final checkpoint.")
+        self.checkpoint()
+        log.info(f"Harvester daemon stopped after {self.cycles} cycles: {self.totals}")
+
+    # ── status ──
+    def healthy(self) -> bool:
+        reference = self.last_cycle_at or self.started_at
+        return time.time() - reference < UNHEALTHY_AFTER_CYCLES * max(self.cycle_seconds, 60)
+
+    def status(self) -> dict:
+        with self._lock:
+            counters = metrics.snapshot()
+            return {
+                "healthy": self.healthy(),
+                "stopping": self.stop.is_set(),
+                "dry_run": DRY_RUN,
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "cycles": self.cycles,
+                "last_cycle_at": self.last_cycle_at,
+                "last_error": self.last_error,
+                "totals": dict(self.totals),
+                "daily_quota_left": self.state.remaining_quota(),
+                "inventory_rows": sum(self.inventory.values()),
+                "near_dup_rows": len(self.near_dups) if self.near_dups is not None else 0,
+                "corpus_passages": len(self.corpus.passages),
+                "window": {k: counters.get(k, 0) for k in
+                           ("requests", "prompt_tokens", "completion_tokens", "outcome_accepted", "rate_limited")},
+            }
+
+
+def serve_status(harvester: Harvester, port: int = DAEMON_STATUS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Starts the localhost /healthz + /status endpoint on a background thread."""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/healthz":
+                code = 200 if harvester.healthy() else 503
+                body = {"status": "ok" if code == 200 else "stalled"}
+            elif self.path == "/status":
+                code, body = 200, harvester.status()
+            else:
+                code, body = 404, {"error": "not found"}
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((DAEMON_STATUS_HOST, port), Handler)
+    threading.Thread(target=server.serve_forever, name="status", daemon=True).start()
+    log.info(f"Status endpoint on http://{DAEMON_STATUS_HOST}:{server.server_port}/status")
+    return server
+
+
+def run(supabase=None, groq_client=None) -> None:
+    harvester = Harvester(supabase, groq_client)
+
+    def request_stop(signum, _frame):
+        log.info(f"Received {signal.Signals(signum).name}; stopping after the current cycle…")
+        harvester.stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    try:
+        server = serve_status(harvester)
+    except OSError as e:
+        log.warning(f"Status endpoint disabled: {e}")
+        server = None
+    try:
+        harvester.run()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    run()
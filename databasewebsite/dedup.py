@@ -0,0 +1,48 @@
+"""
+dedup.py — Content hashing for question de-duplication
+=========================================================
+Every row carries `content_hash` = sha256 of its normalized question_text.
+The column has a UNIQUE index (see schema.sql), so a whole batch can be
+checked with one `IN (...)` lookup and written with one upsert that ignores
+conflicts.
+
+normalize_text() is the canonical definition; the SQL backfill in schema.sql
+mirrors it:
+    lower(btrim(regexp_replace(question_text, '[ \\t\\n\\r\\f\\v]+', ' ', 'g')))
+Whitespace is the explicit ASCII class WHITESPACE_CLASS on both sides.
+str.split() and Postgres' `\\s` disagree on Unicode spaces (U+00A0,
+U+2009, U+3000, …), which would give a backfilled row a different hash
+from the same text inserted by the harvester.
+"""
+
+import hashlib
+import re
+
+WHITESPACE_CLASS = r"[ \t\n\r\f\v]"     # keep identical to the regexp_replace pattern in schema.sql
+_WHITESPACE_RE = re.compile(WHITESPACE_CLASS + "+")
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case, collapse ASCII whitespace runs to a single space, trim."""
+    return _WHITESPACE_RE.sub(" ", (text or "").lower()).strip(" ")
+
+
+def content_hash(question_text: str) -> str:
+    return hashlib.sha256(normalize_text(question_text).encode("utf-8")).hexdigest()
+
+
+def dedup_batch(rows: list) -> tuple:
+    """
+    Stamps `content_hash` on every row and drops in-batch repeats (first wins).
+    Returns (unique_rows, n_dropped).
+    """
+    seen = set()
+    unique = []
+    for row in rows:
+        h = content_hash(row.get("question_text", ""))
+        row["content_hash"] = h
+        if h in seen:
+            continue
+        seen.add(h)
+        unique.append(row)
+    return unique, len(rows) - len(unique)
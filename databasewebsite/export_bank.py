@@ -0,0 +1,236 @@
+"""
+export_bank.py — Incremental, sharded export of the question bank
+=========================================================
+Bulk reads of sat_question_bank otherwise mean row-capped PostgREST
+selects that drag the heavy columns along. This writes the bank to static,
+compressed files that can be served as-is or loaded for offline analysis:
+
+  EXPORT_DIR/
+    manifest.json                       shards, row counts, sha256, watermark
+    index.json.gz                       {id: shard} for every exported row
+    core/<module>__<domain>__<difficulty>.jsonl.gz
+                                        one row per question, light columns only
+    heavy/<module>__<domain>__<difficulty>.jsonl.gz
+                                        {id, rationale, raw_original_text}
+
+Delta export: rows are pulled in (updated_at, id) keyset order after the
+watermark in the manifest (schema.sql section 11 keeps updated_at current),
+so each run fetches only new or changed rows. Only the shards those rows
+land in (or move out of, after a re-tag) are rewritten. Rows newer than
+EXPORT_SETTLE_SECONDS are left for the next run, so a transaction that
+commits late can't slip in behind the watermark. Deletions are not
+visible to a watermark; `--full` rebuilds everything from scratch.
+
+Files are gzip with mtime 0, so an unchanged shard keeps its sha256.
+
+Usage:
+  python export_bank.py                 # delta export into EXPORT_DIR
+  python export_bank.py --full          # rebuild every shard
+  python export_bank.py --out ./public/bank
+"""
+
+import argparse
+import datetime as dt
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Iterator, Optional
+
+from backends import make_supabase
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+log = logging.getLogger(__name__)
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "export"))
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "1000"))
+EXPORT_SETTLE_SECONDS = float(os.environ.get("EXPORT_SETTLE_SECONDS", "120"))
+MANIFEST_VERSION = 1
+
+CORE_COLUMNS = ("id", "module", "domain", "difficulty", "is_spr", "question_text", "options", "correct_answer",
+                "source_method", "source_ref", "content_hash", "created_at", "updated_at")
+HEAVY_COLUMNS = ("rationale", "raw_original_text")
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_-]+")
+
+# ─────────────────────────────────────────────────────────────
+# SHARD FILES
+# ─────────────────────────────────────────────────────────────
+def shard_key(row: dict) -> str:
+    parts = (row.get("module"), row.get("domain"), row.get("difficulty"))
+    return "__".join(_UNSAFE_RE.sub("_", str(p or "unknown")) for p in parts)
+
+
+def _read_jsonl_gz(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_gz(path: str, text: str) -> tuple:
+    """Atomic, reproducible gzip write. Returns (bytes, sha256)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = gzip.compress(text.encode("utf-8"), compresslevel=9, mtime=0)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def _jsonl(rows: list) -> str:
+    return "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in rows)
+
+
+def read_shard(key: str, out_dir: str = EXPORT_DIR, heavy: bool = False) -> list:
+    """Rows of one exported shard; with heavy=True the heavy columns are joined back in."""
+    rows = _read_jsonl_gz(os.path.join(out_dir, "core", f"{key}.jsonl.gz"))
+    if heavy:
+        extra = {r["id"]: r for r in _read_jsonl_gz(os.path.join(out_dir, "heavy", f"{key}.jsonl.gz"))}
+        rows = [{**r, **{c: extra.get(r["id"], {}).get(c) for c in HEAVY_COLUMNS}} for r in rows]
+    return rows
+
+# ─────────────────────────────────────────────────────────────
+# MANIFEST
+# ─────────────────────────────────────────────────────────────
+def load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        log.warning("Export manifest version changed — rebuilding from scratch.")
+    except (OSError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "watermark": None, "shards": {}}
+
+
+def _save_manifest(out_dir: str, manifest: dict) -> None:
+    path = os.path.join(out_dir, "manifest.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+# ─────────────────────────────────────────────────────────────
+# DELTA FETCH
+# ─────────────────────────────────────────────────────────────
+def fetch_changes(supabase, watermark: Optional[list], cutoff: str,
+                  page_size: int = EXPORT_PAGE_SIZE) -> Iterator[list]:
+    """Pages of rows with (updated_at, id) after `watermark` and updated_at before `cutoff`."""
+    columns = ", ".join(CORE_COLUMNS + HEAVY_COLUMNS)
+    while True:
+        q = supabase.table("sat_question_bank").select(columns) \
+            .lt("updated_at", cutoff).order("updated_at").order("id").limit(page_size)
+        if watermark:
+            ts, last_id = watermark
+            q = q.or_(f'updated_at.gt."{ts}",and(updated_at.eq."{ts}",id.gt.{last_id})')
+        rows = q.execute().data or []
+        if not rows:
+            return
+        yield rows
+        watermark = [rows[-1]["updated_at"], rows[-1]["id"]]
+        if len(rows) < page_size:
+            return
+
+# ─────────────────────────────────────────────────────────────
+# EXPORT
+# ─────────────────────────────────────────────────────────────
+def export(supabase, out_dir: str = EXPORT_DIR, full: bool = False) -> dict:
+    """Runs one (delta or full) export. Returns the new manifest."""
+    started = time.monotonic()
+    manifest = {"version": MANIFEST_VERSION, "watermark": None, "shards": {}} if full else load_manifest(out_dir)
+    index_path = os.path.join(out_dir, "index.json.gz")
+    index: dict = {}
+    if manifest["watermark"] and os.path.exists(index_path):
+        with gzip.open(index_path, "rt", encoding="utf-8") as f:
+            index = json.load(f)
+    elif manifest["watermark"]:
+        log.warning("Export index missing — running a full export.")
+        manifest, full = {"version": MANIFEST_VERSION, "watermark": None, "shards": {}}, True
+
+    cutoff = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=EXPORT_SETTLE_SECONDS)).isoformat()
+    changed: dict = {}                     # id -> latest row
+    watermark = manifest["watermark"]
+    for page in fetch_changes(supabase, watermark, cutoff):
+        for row in page:
+            changed[str(row["id"])] = row
+        watermark = [page[-1]["updated_at"], page[-1]["id"]]
+
+    if not changed and not full:
+        log.info(f"Export up to date: no rows changed since {manifest['watermark']}")
+        return manifest
+
+    # Shards touched: where changed rows land, and where they were before a re-tag
+    touched: dict = {}
+    for rid, row in changed.items():
+        touched.setdefault(shard_key(row), []).append(row)
+        old = index.get(rid)
+        if old is not None:
+            touched.setdefault(old, [])
+        index[rid] = shard_key(row)
+
+    def kept(kind: str, key: str) -> list:
+        if full:
+            return []
+        return [r for r in _read_jsonl_gz(os.path.join(out_dir, kind, f"{key}.jsonl.gz")) if str(r["id"]) not in changed]
+
+    for key, incoming in sorted(touched.items()):
+        core, heavy = kept("core", key), kept("heavy", key)
+        core += [{c: row.get(c) for c in CORE_COLUMNS} for row in incoming]
+        heavy += [{"id": row["id"], **{c: row.get(c) for c in HEAVY_COLUMNS}}
+                  for row in incoming if any(row.get(c) for c in HEAVY_COLUMNS)]
+        core.sort(key=lambda r: str(r["id"]))
+        heavy.sort(key=lambda r: str(r["id"]))
+        if not core:
+            for kind in ("core", "heavy"):
+                path = os.path.join(out_dir, kind, f"{key}.jsonl.gz")
+                if os.path.exists(path):
+                    os.remove(path)
+            manifest["shards"].pop(key, None)
+            continue
+        core_bytes, core_sha = _write_gz(os.path.join(out_dir, "core", f"{key}.jsonl.gz"), _jsonl(core))
+        heavy_bytes, heavy_sha = _write_gz(os.path.join(out_dir, "heavy", f"{key}.jsonl.gz"), _jsonl(heavy))
+        module, domain, difficulty = core[0]["module"], core[0]["domain"], core[0]["difficulty"]
+        manifest["shards"][key] = {
+            "module": module, "domain": domain, "difficulty": difficulty, "rows": len(core),
+            "core": {"path": f"core/{key}.jsonl.gz", "bytes": core_bytes, "sha256": core_sha},
+            "heavy": {"path": f"heavy/{key}.jsonl.gz", "bytes": heavy_bytes, "sha256": heavy_sha},
+        }
+
+    if full:   # shards of buckets that no longer exist
+        for kind in ("core", "heavy"):
+            kind_dir = os.path.join(out_dir, kind)
+            for name in os.listdir(kind_dir) if os.path.isdir(kind_dir) else []:
+                if name.endswith(".jsonl.gz") and name[:-len(".jsonl.gz")] not in manifest["shards"]:
+                    os.remove(os.path.join(kind_dir, name))
+    os.makedirs(out_dir, exist_ok=True)
+    _write_gz(index_path, json.dumps(index, separators=(",", ":")))
+    manifest["watermark"] = watermark
+    manifest["generated_at"] = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+    manifest["rows"] = sum(s["rows"] for s in manifest["shards"].values())
+    manifest["columns"] = {"core": list(CORE_COLUMNS), "heavy": ["id", *HEAVY_COLUMNS]}
+    _save_manifest(out_dir, manifest)
+
+    core_kb = sum(s["core"]["bytes"] for s in manifest["shards"].values()) / 1024
+    heavy_kb = sum(s["heavy"]["bytes"] for s in manifest["shards"].values()) / 1024
+    log.info(f"Export {'full' if full else 'delta'}: {len(changed)} rows fetched, {len(touched)} shards rewritten, "
+             f"{manifest['rows']} rows in {len(manifest['shards'])} shards "
+             f"(core {core_kb:.0f} KiB, heavy {heavy_kb:.0f} KiB) in {time.monotonic() - started:.1f}s")
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export sat_question_bank to sharded gzip JSONL")
+    parser.add_argument("--out", default=EXPORT_DIR, help="output directory")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and rebuild every shard")
+    args = parser.parse_args()
+    export(make_supabase(), args.out, args.full)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,671 @@
+"""
+fakes.py — Offline stand-ins for Groq and Supabase
+=========================================================
+Lets scraper.py, repair_db.py and bench.py run end-to-end without network,
+Groq quota or the production database.
+
+  • FakeGroq        — duck-types `client.chat.completions.create(...)`.
+                      Recognises the generation and classification prompts
+                      this repo sends and answers them with well-formed
+                      JSON. Latency, 429 rate, malformed-JSON rate (code
+                      fences, surrounding prose, trailing commas, truncation)
+                      and bad-field rate (3 options / missing answer) are
+                      configurable; every call is counted.
+  • SQLiteSupabase  — duck-types the subset of the supabase-py / PostgREST
+                      builder we use (select/eq/in_/gt/or_/order/limit,
+                      insert/upsert/update, count="exact", the
+                      bulk_update_tags RPC) on top of SQLite. The tables
+                      carry the NOT NULL / CHECK / UNIQUE constraints from
+                      schema.sql, so rows the real database would reject
+                      are rejected here too.
+
+Neither class talks to the network; see backends.py for how they are
+selected at runtime.
+"""
+
+import datetime as dt
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Optional
+
+VALID_DOMAINS_BY_MODULE = {
+    "Math": ["Heart_of_Algebra", "Advanced_Math", "Problem_Solving_Data", "Geometry_Trigonometry"],
+    "Reading_Writing": ["Information_Ideas", "Craft_Structure", "Expression_Ideas", "Standard_English"],
+}
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+
+# ─────────────────────────────────────────────────────────────
+# FAKE GROQ
+# ─────────────────────────────────────────────────────────────
+class FakeRateLimitError(Exception):
+    """Raised for simulated 429s; shaped like groq.RateLimitError (status_code, response.headers)."""
+
+    status_code = 429
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("Error code: 429 - {'error': {'message': 'Rate limit reached for model', "
+                         "'type': 'requests', 'code': 'rate_limit_exceeded'}}")
+        headers = {} if retry_after is None else {"retry-after": f"{retry_after:.2f}"}
+        self.response = SimpleNamespace(status_code=429, headers=headers)
+
+
+_SLOT_RE = re.compile(r"^\s*Slot (\d+): Section (\w+) \| Domain (\w+) \| Difficulty (\w+) \| (SPR|multiple)", re.M)
+_WORDS = [a + b for a in ("ka", "lo", "mi", "su", "te", "ra", "vo", "ni", "pe", "zu", "da", "fi")
+          for b in ("ren", "mal", "tis", "gon", "bek", "lud", "sar", "wip", "nox", "cey", "hab", "jot")]
+
+
+def prompt_kind(prompt: str) -> str:
+    """'generate_batch' | 'reask' | 'classify_batch' | 'classify' | 'unknown'."""
+    if _SLOT_RE.search(prompt):
+        return "generate_batch"
+    if "complete except for one invalid field" in prompt:
+        return "reask"
+    if "\nQUESTIONS:\n" in prompt:
+        return "classify_batch"
+    if "QUESTION TEXT:" in prompt:
+        return "classify"
+    return "unknown"
+
+
+class FakeGroq:
+    """
+    Stand-in for `groq.Groq`. `latency` is the mean seconds per call (±50%
+    uniform jitter); `rate_429` and `malformed_rate` are per-call
+    probabilities, `bad_field_rate` is per generated question. Thread-safe.
+
+    With `rpm_limit` / `tpm_limit` set, it also enforces per-minute request /
+    token buckets that refill continuously, like the real API: requests over
+    either limit get a 429 with `retry-after`, and every response carries
+    x-ratelimit-* headers (read via `chat.completions.with_raw_response.create`).
+    Buckets are per model, as on Groq.
+
+    Small models ("8b" / "instant" in the name) answer in SMALL_MODEL_SPEEDUP
+    of the latency and mis-tag `small_error_rate` of classifications, usually
+    with a low self-reported confidence; large models always tag correctly.
+    """
+
+    MALFORMATIONS = ("truncate", "fence", "prose", "trailing_comma")
+    WINDOW_S = 60.0
+    SMALL_MODEL_SPEEDUP = 0.25
+
+    def __init__(self, latency: float = 0.8, rate_429: float = 0.0, malformed_rate: float = 0.0,
+                 seed: Optional[int] = None, bad_field_rate: float = 0.0,
+                 rpm_limit: int = 0, tpm_limit: int = 0, small_error_rate: float = 0.15):
+        self.latency = latency
+        self.small_error_rate = small_error_rate
+        self.rate_429 = rate_429
+        self.malformed_rate = malformed_rate
+        self.bad_field_rate = bad_field_rate
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.requests = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self._level: dict = {}             # (model, requests | tokens) -> units left in that bucket
+        self._refilled_at: dict = {}       # model -> last refill
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self.create, with_raw_response=SimpleNamespace(create=self._create_raw)))
+
+    def _admit(self, model: str, tokens: int) -> tuple:
+        """
+        Two continuously refilling buckets per model (capacity = the per-minute
+        limit). Returns (headers, retry_after or None). Caller holds the lock.
+        """
+        now = time.monotonic()
+        elapsed = now - self._refilled_at.get(model, now)
+        self._refilled_at[model] = now
+        limits = {"requests": self.rpm_limit, "tokens": self.tpm_limit}
+        cost = {"requests": 1, "tokens": tokens}
+        level = {}
+        for kind, limit in limits.items():
+            if limit:
+                key = (model, kind)
+                self._level[key] = level[kind] = min(limit, self._level.get(key, limit) + elapsed * limit / self.WINDOW_S)
+        short = [(k, cost[k] - level[k]) for k in level if level[k] < cost[k]]
+        if short:
+            return {}, max(0.01, max(gap * self.WINDOW_S / limits[k] for k, gap in short))
+        headers = {}
+        for kind, left in level.items():
+            limit = limits[kind]
+            left = self._level[(model, kind)] = left - cost[kind]
+            headers.update({f"x-ratelimit-limit-{kind}": str(limit),
+                            f"x-ratelimit-remaining-{kind}": str(int(left)),
+                            f"x-ratelimit-reset-{kind}": f"{(limit - left) * self.WINDOW_S / limit:.2f}s"})
+        return headers, None
+
+    def _create_raw(self, model: str, messages: list, **kwargs):
+        prompt = messages[-1]["content"]
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        with self._lock:
+            self.requests += 1
+            delay = self.latency * self._rng.uniform(0.5, 1.5) * (self.SMALL_MODEL_SPEEDUP if _is_small(model) else 1.0)
+            rng = random.Random(self._rng.random())
+        content = json.dumps(self._answer(prompt, rng, model))
+        tokens = prompt_tokens + len(content) // 4          # charged like the real API: prompt + completion
+        with self._lock:
+            headers, retry_after = self._admit(model, tokens) if self.rpm_limit or self.tpm_limit else ({}, None)
+            throttled = retry_after is not None or self._rng.random() < self.rate_429
+            broken = not throttled and self._rng.random() < self.malformed_rate
+            if throttled:
+                self.rate_limited += 1
+            if broken:
+                self.malformed += 1
+        time.sleep(delay if not throttled else delay * 0.1)
+        if throttled:
+            raise FakeRateLimitError(retry_after)
+
+        if broken:
+            content = _malform(content, rng.choice(self.MALFORMATIONS))
+        response = completion(content, model, prompt_tokens=prompt_tokens)
+        return SimpleNamespace(headers=headers, parse=lambda: response)
+
+    def create(self, model: str, messages: list, **kwargs):
+        return self._create_raw(model, messages, **kwargs).parse()
+
+    def _classify(self, text: str, rng: random.Random, model: str) -> dict:
+        if _is_small(model) and rng.random() < self.small_error_rate:
+            tags = _tags_for(text + "#wrong")
+            tags["confidence"] = round(rng.uniform(0.3, 0.9), 2)    # mostly unsure, sometimes confidently wrong
+        else:
+            tags = _tags_for(text)
+            tags["confidence"] = round(rng.uniform(0.75, 1.0), 2)
+        return tags
+
+    def _answer(self, prompt: str, rng: random.Random, model: str = "") -> dict:
+        kind = prompt_kind(prompt)
+        if kind == "generate_batch":
+            return {"questions": [
+                dict(self._maybe_damage(fake_question(rng, module, domain, difficulty, spr == "SPR"), rng), slot=int(i))
+                for i, module, domain, difficulty, spr in _SLOT_RE.findall(prompt)
+            ]}
+        if kind == "reask":
+            shown = json.loads(prompt.split("QUESTION:\n", 1)[1].split("\n", 1)[0])
+            if '{"options":' in prompt:
+                options = [_sentence(rng, 4) for _ in range(3)] + [shown.get("correct_answer") or _sentence(rng, 4)]
+                rng.shuffle(options)
+                return {"options": options}
+            if shown.get("options"):
+                return {"correct_answer": rng.choice(shown["options"])}
+            return {"correct_answer": str(rng.randint(2, 999))}
+        if kind == "classify_batch":
+            block = prompt.split("\nQUESTIONS:\n", 1)[1].split("\n\n", 1)[0]
+            results = []
+            for line in block.splitlines():
+                if line.startswith("{"):
+                    item = json.loads(line)
+                    results.append(dict(self._classify(item["text"], rng, model), id=item["id"]))
+            return {"results": results}
+        if kind == "classify":
+            text = prompt.split("QUESTION TEXT:", 1)[1].split("Respond in plain JSON", 1)[0]
+            return self._classify(text.strip(), rng, model)
+        return {}
+
+    def _maybe_damage(self, q: dict, rng: random.Random) -> dict:
+        if rng.random() < self.bad_field_rate:
+            if q["options"] and rng.random() < 0.5:
+                q["options"] = q["options"][:3]
+            else:
+                q["correct_answer"] = ""
+        return q
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "rate_limited": self.rate_limited, "malformed": self.malformed}
+
+
+def completion(content: str, model: str, prompt_tokens: int = 0, completion_tokens: Optional[int] = None):
+    """Builds an object shaped like a groq ChatCompletion."""
+    completion_tokens = len(content) // 4 if completion_tokens is None else completion_tokens
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, finish_reason="stop",
+                                 message=SimpleNamespace(role="assistant", content=content))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                              total_tokens=prompt_tokens + completion_tokens),
+    )
+
+
+def _malform(content: str, how: str) -> str:
+    """The ways LLM JSON typically breaks."""
+    if how == "fence":
+        return f"```json\n{content}\n```"
+    if how == "prose":
+        return f"Here is the JSON you asked for:\n{content}\nLet me know if you need changes."
+    if how == "trailing_comma":
+        return content[:-1] + ",}" if content.endswith("}") else content
+    return content[:max(1, int(len(content) * 0.8))]
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize()
+
+
+def fake_question(rng: random.Random, module: str, domain: str, difficulty: str, is_spr: bool) -> dict:
+    text = f"{_sentence(rng, 18)}. {_sentence(rng, 12)}?"
+    if is_spr:
+        answer = str(rng.randint(2, 999))
+        options = None
+    else:
+        options = [_sentence(rng, 4) for _ in range(4)]
+        answer = rng.choice(options)
+    return {
+        "module": module, "domain": domain, "difficulty": difficulty, "is_spr": is_spr,
+        "question_text": text, "options": options, "correct_answer": answer,
+        "rationale": _sentence(rng, 10) + ".",
+    }
+
+
+def _is_small(model: str) -> bool:
+    return "8b" in model or "instant" in model
+
+
+def _tags_for(text: str) -> dict:
+    """Deterministic, always-valid tags for a question text."""
+    rng = random.Random(text)
+    module = rng.choice(list(VALID_DOMAINS_BY_MODULE))
+    return {"module": module, "domain": rng.choice(VALID_DOMAINS_BY_MODULE[module]),
+            "difficulty": rng.choice(DIFFICULTIES)}
+
+# ─────────────────────────────────────────────────────────────
+# SQLITE SUPABASE STAND-IN
+# ─────────────────────────────────────────────────────────────
+def _in_list(values: list) -> str:
+    return ", ".join(f"'{v}'" for v in values)
+
+
+# Mirrors schema.sql (sections 2, 3, 7, 8, 10, 11). Domain names follow the enums the
+# harvester, repair scripts and frontend actually write.
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sat_question_bank (
+    id                TEXT PRIMARY KEY,
+    module            TEXT NOT NULL CHECK (module IN ('Math', 'Reading_Writing')),
+    domain            TEXT NOT NULL,
+    difficulty        TEXT NOT NULL CHECK (difficulty IN ('Easy', 'Medium', 'Hard')),
+    question_text     TEXT NOT NULL,
+    is_spr            INTEGER NOT NULL DEFAULT 0,
+    options           TEXT,
+    correct_answer    TEXT NOT NULL,
+    rationale         TEXT,
+    source_method     TEXT NOT NULL DEFAULT 'Automated_Pipeline'
+                      CHECK (source_method IN ('Automated_Pipeline', 'Admin_Dropzone')),
+    created_at        TEXT NOT NULL,
+    updated_at        TEXT NOT NULL,
+    content_hash      TEXT,
+    source_ref        TEXT,
+    raw_original_text TEXT,
+    CONSTRAINT valid_domain CHECK (
+        (module = 'Math' AND domain IN ({_in_list(VALID_DOMAINS_BY_MODULE['Math'])})) OR
+        (module = 'Reading_Writing' AND domain IN ({_in_list(VALID_DOMAINS_BY_MODULE['Reading_Writing'])}))
+    ),
+    CONSTRAINT spr_options_null CHECK ((is_spr = 1 AND options IS NULL) OR (is_spr = 0))
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_sat_content_hash ON sat_question_bank(content_hash);
+CREATE INDEX IF NOT EXISTS idx_sat_bucket ON sat_question_bank(module, domain, difficulty, is_spr);
+CREATE INDEX IF NOT EXISTS idx_sat_updated ON sat_question_bank(updated_at, id);
+CREATE TRIGGER IF NOT EXISTS trg_sat_touch_updated_at AFTER UPDATE ON sat_question_bank
+    WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE sat_question_bank SET updated_at = now_ts() WHERE id = NEW.id;
+END;
+CREATE VIEW IF NOT EXISTS view_bucket_inventory AS
+    SELECT module, domain, difficulty, is_spr, COUNT(*) AS question_count
+    FROM sat_question_bank
+    GROUP BY module, domain, difficulty, is_spr;
+CREATE TABLE IF NOT EXISTS source_passages (
+    id           TEXT PRIMARY KEY,
+    source       TEXT NOT NULL,
+    passage_text TEXT NOT NULL,
+    created_at   TEXT
+);
+CREATE TABLE IF NOT EXISTS sat_test_forms (
+    id         TEXT PRIMARY KEY,
+    batch      TEXT NOT NULL,
+    section    TEXT NOT NULL CHECK (section IN ('rw', 'math')),
+    path       TEXT NOT NULL CHECK (path IN ('m1', 'm2_higher', 'm2_lower')),
+    family     TEXT NOT NULL,
+    pick       REAL NOT NULL,
+    active     INTEGER NOT NULL DEFAULT 0,
+    items      TEXT NOT NULL,
+    blueprint  TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_forms_pick ON sat_test_forms(section, path, active, pick);
+CREATE INDEX IF NOT EXISTS idx_forms_family ON sat_test_forms(family, path);
+"""
+
+_BOOL_COLS = {"is_spr", "active"}
+_JSON_COLS = {"options", "items", "blueprint"}
+_IDENT_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+_OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+class StandInError(Exception):
+    """Shaped like postgrest.APIError: carries a Postgres SQLSTATE in `code`."""
+
+    def __init__(self, message: str, code: str):
+        super().__init__(f"{{'code': '{code}', 'message': {message!r}}}")
+        self.code = code
+        self.message = message
+
+
+def _ident(name: str) -> str:
+    if not _IDENT_RE.match(name):
+        raise StandInError(f"invalid column name {name!r}", "42703")
+    return name
+
+
+def _encode(col: str, value):
+    if col in _JSON_COLS and value is not None:
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _decode(row: sqlite3.Row) -> dict:
+    out = {}
+    for col in row.keys():
+        v = row[col]
+        if col in _BOOL_COLS and v is not None:
+            v = bool(v)
+        elif col in _JSON_COLS and v is not None:
+            v = json.loads(v)
+        out[col] = v
+    return out
+
+
+def _split_top(s: str) -> list:
+    """Splits a PostgREST logic string on commas outside parentheses and quotes."""
+    parts, depth, quoted, cur = [], 0, False, []
+    for ch in s:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append("".join(cur))
+            cur = []
+            continue
+        cur.append(ch)
+    parts.append("".join(cur))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _unquote(v: str) -> str:
+    return v[1:-1] if len(v) >= 2 and v[0] == v[-1] == '"' else v
+
+
+def _condition(expr: str) -> tuple:
+    """One PostgREST filter expression → (sql, params)."""
+    for logic in ("and", "or"):
+        if expr.startswith(logic + "(") and expr.endswith(")"):
+            parts = [_condition(p) for p in _split_top(expr[len(logic) + 1:-1])]
+            return "(" + f" {logic.upper()} ".join(sql for sql, _ in parts) + ")", [p for _, ps in parts for p in ps]
+    col, rest = expr.split(".", 1)
+    col = _ident(col)
+    negate = rest.startswith("not.")
+    if negate:
+        rest = rest[4:]
+    op, value = rest.split(".", 1)
+    if op == "in":
+        items = [_unquote(v) for v in _split_top(value.strip("()"))]
+        sql, params = f"{col} IN ({', '.join('?' * len(items))})", items
+    elif op == "is":
+        sql, params = f"{col} IS {dict(null='NULL', true='1', false='0')[value]}", []
+    elif op in _OPS:
+        sql, params = f"{col} {_OPS[op]} ?", [_unquote(value)]
+    else:
+        raise StandInError(f"unsupported operator {op!r}", "PGRST100")
+    return (f"NOT ({sql})" if negate else sql), params
+
+
+class _Query:
+    """A PostgREST request builder; nothing runs until execute()."""
+
+    def __init__(self, db: "SQLiteSupabase", table: str):
+        self._db = db
+        self._table = _ident(table)
+        self._op = "select"
+        self._columns = "*"
+        self._count = None
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._where: list = []
+        self._params: list = []
+        self._order: list = []
+        self._limit = None
+
+    # ── verbs ──
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "_Query":
+        self._columns = "*" if columns.strip() == "*" else ", ".join(_ident(c.strip()) for c in columns.split(","))
+        self._count = count
+        return self
+
+    def insert(self, rows) -> "_Query":
+        self._op, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False) -> "_Query":
+        self._op, self._payload = "upsert", rows
+        self._on_conflict, self._ignore_duplicates = _ident(on_conflict), ignore_duplicates
+        return self
+
+    def update(self, values: dict) -> "_Query":
+        self._op, self._payload = "update", values
+        return self
+
+    def delete(self) -> "_Query":
+        self._op = "delete"
+        return self
+
+    # ── filters / modifiers ──
+    def _filter(self, sql: str, params: list) -> "_Query":
+        self._where.append(sql)
+        self._params += params
+        return self
+
+    def eq(self, col: str, value) -> "_Query":
+        return self._filter(f"{_ident(col)} = ?", [_encode(col, value)])
+
+    def neq(self, col: str, value) -> "_Query":
+        return self._filter(f"{_ident(col)} != ?", [_encode(col, value)])
+
+    def gt(self, col: str, value) -> "_Query":
+        return self._filter(f"{_ident(col)} > ?", [value])
+
+    def gte(self, col: str, value) -> "_Query":
+        return self._filter(f"{_ident(col)} >= ?", [value])
+
+    def lt(self, col: str, value) -> "_Query":
+        return self._filter(f"{_ident(col)} < ?", [value])
+
+    def in_(self, col: str, values: list) -> "_Query":
+        values = [_encode(col, v) for v in values]
+        return self._filter(f"{_ident(col)} IN ({', '.join('?' * len(values))})", values)
+
+    def or_(self, filters: str) -> "_Query":
+        parts = [_condition(p) for p in _split_top(filters)]
+        return self._filter("(" + " OR ".join(sql for sql, _ in parts) + ")", [p for _, ps in parts for p in ps])
+
+    def order(self, col: str, desc: bool = False) -> "_Query":
+        self._order.append(f"{_ident(col)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, n: int) -> "_Query":
+        self._limit = int(n)
+        return self
+
+    def execute(self):
+        with self._db.lock:
+            return getattr(self, "_run_" + self._op)()
+
+    # ── execution ──
+    def _where_sql(self) -> str:
+        return (" WHERE " + " AND ".join(self._where)) if self._where else ""
+
+    def _run_select(self):
+        sql = f"SELECT {self._columns} FROM {self._table}{self._where_sql()}"
+        if self._order:
+            sql += " ORDER BY " + ", ".join(self._order)
+        if self._limit is not None:
+            sql += f" LIMIT {self._limit}"
+        data = [_decode(r) for r in self._db.conn.execute(sql, self._params)]
+        count = None
+        if self._count:
+            count = self._db.conn.execute(f"SELECT COUNT(*) FROM {self._table}{self._where_sql()}",
+                                          self._params).fetchone()[0]
+        return SimpleNamespace(data=data, count=count)
+
+    def _run_insert(self):
+        return self._write_rows(conflict="")
+
+    def _run_upsert(self):
+        if self._ignore_duplicates:
+            return self._write_rows(conflict=f" ON CONFLICT({self._on_conflict}) DO NOTHING")
+        return self._write_rows(conflict=None)
+
+    def _write_rows(self, conflict: Optional[str]):
+        rows = self._payload if isinstance(self._payload, list) else [self._payload]
+        written = []
+        # One statement per row inside one transaction: like a PostgREST bulk
+        # insert, a single bad row rejects the whole request.
+        with self._db.transaction():
+            for row in rows:
+                row = dict(row)
+                if self._table == "sat_question_bank":
+                    row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", self._db.now())
+                if self._table == "sat_question_bank":
+                    row.setdefault("updated_at", row["created_at"])
+                cols = [_ident(c) for c in row]
+                clause = conflict
+                if clause is None:
+                    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c != self._on_conflict)
+                    clause = f" ON CONFLICT({self._on_conflict}) DO UPDATE SET {updates}"
+                sql = (f"INSERT INTO {self._table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+                       f"{clause} RETURNING *")
+                written += [_decode(r) for r in self._db.execute(sql, [_encode(c, row[c]) for c in cols])]
+        return SimpleNamespace(data=written, count=None)
+
+    def _run_update(self):
+        cols = [_ident(c) for c in self._payload]
+        sql = (f"UPDATE {self._table} SET {', '.join(f'{c} = ?' for c in cols)}"
+               f"{self._where_sql()} RETURNING *")
+        with self._db.transaction():
+            data = [_decode(r) for r in self._db.execute(sql, [_encode(c, self._payload[c]) for c in cols] + self._params)]
+        return SimpleNamespace(data=data, count=None)
+
+    def _run_delete(self):
+        with self._db.transaction():
+            data = [_decode(r) for r in self._db.execute(
+                f"DELETE FROM {self._table}{self._where_sql()} RETURNING *", self._params)]
+        return SimpleNamespace(data=data, count=None)
+
+
+class _RPC:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return SimpleNamespace(data=self._fn(), count=None)
+
+
+class SQLiteSupabase:
+    """Stand-in for `supabase.Client` backed by one SQLite database (default: in memory)."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        self._clock = dt.datetime.now(dt.timezone.utc)
+        self.conn.create_function("now_ts", 0, self.now)   # updated_at trigger
+        self.conn.executescript(SCHEMA)
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None) -> _RPC:
+        if fn != "bulk_update_tags":
+            raise StandInError(f"Could not find the function public.{fn}", "PGRST202")
+        return _RPC(lambda: self._bulk_update_tags((params or {}).get("payload") or []))
+
+    # ── helpers ──
+    def now(self) -> str:
+        """Strictly increasing timestamps so (created_at | updated_at, id) keyset pages are stable."""
+        self._clock = max(self._clock + dt.timedelta(microseconds=1), dt.datetime.now(dt.timezone.utc))
+        return self._clock.isoformat(timespec="microseconds")
+
+    def execute(self, sql: str, params: list) -> list:
+        try:
+            return self.conn.execute(sql, params).fetchall()
+        except sqlite3.IntegrityError as e:
+            msg = str(e)
+            code = "23514" if "CHECK" in msg else "23502" if "NOT NULL" in msg else "23505"
+            raise StandInError(msg, code) from e
+        except sqlite3.OperationalError as e:
+            raise StandInError(str(e), "42703" if "column" in str(e) else "XX000") from e
+
+    def transaction(self):
+        db = self
+
+        class _Tx:
+            def __enter__(self):
+                db.conn.execute("SAVEPOINT sp")
+
+            def __exit__(self, exc_type, exc, tb):
+                if exc_type is None:
+                    db.conn.execute("RELEASE sp")
+                else:
+                    db.conn.execute("ROLLBACK TO sp")
+                    db.conn.execute("RELEASE sp")
+                return False
+        return _Tx()
+
+    def _bulk_update_tags(self, payload: list) -> dict:
+        """Same contract as the plpgsql function in schema.sql section 9."""
+        updated, failed, missing = 0, [], []
+        with self.lock:
+            for r in payload:
+                try:
+                    with self.transaction():
+                        hit = self.execute(
+                            "UPDATE sat_question_bank SET module = ?, domain = ?, difficulty = ?, "
+                            "raw_original_text = COALESCE(raw_original_text, ?) WHERE id = ? RETURNING id",
+                            [r.get("module"), r.get("domain"), r.get("difficulty"), r.get("raw_original_text"), r.get("id")],
+                        )
+                    if hit:
+                        updated += 1
+                    else:
+                        missing.append(str(r.get("id")))
+                except StandInError as e:
+                    if e.code not in ("23514", "23502"):
+                        raise
+                    failed.append(str(r.get("id")))
+        return {"updated": updated, "failed": failed, "missing": missing}
+
+    def seed(self, table: str, rows: list, checked: bool = True) -> None:
+        """
+        Bulk-loads fixture rows. With checked=False the CHECK constraints are
+        bypassed, e.g. to plant legacy rows with out-of-enum tags.
+        """
+        with self.lock:
+            if not checked:
+                self.conn.execute("PRAGMA ignore_check_constraints = ON")
+            try:
+                self.table(table).insert(rows)._run_insert()
+            finally:
+                self.conn.execute("PRAGMA ignore_check_constraints = OFF")
+
+    def count(self, table: str = "sat_question_bank") -> int:
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {_ident(table)}").fetchone()[0]
@@ -0,0 +1,331 @@
+"""
+groq_client.py — Header-driven pacing, retries and a circuit breaker for Groq
+=========================================================
+Every Groq call from scraper.py, repair_db.py and salvage.py goes through one
+AdaptiveGroq wrapper (backends.make_groq() applies it). It replaces the
+per-call-site retry loops and fixed sleeps:
+
+  • Pacing     x-ratelimit-remaining-{requests,tokens} and
+               x-ratelimit-reset-{requests,tokens} are read from every
+               response (via with_raw_response) and tracked per model, as
+               Groq's limits are. Within a short window
+               (the per-minute limits) requests run freely while there is
+               headroom. Below GROQ_PACING_LOW_WATER of the limit they are
+               spaced at the window's refill rate ((limit - remaining) /
+               reset). A request the window can't cover waits until enough
+               has refilled instead of drawing a 429. A long window
+               (e.g. the daily request quota) is only a floor: when it is
+               exhausted, callers wait for the reset.
+  • Backoff    429s, 5xx and connection errors are retried up to
+               GROQ_MAX_RETRIES times. The wait is `retry-after` when the API
+               sends it, otherwise full-jitter exponential backoff. The pause
+               applies to every thread calling that model, so they don't
+               retry in a herd.
+  • Breaker    after GROQ_BREAKER_THRESHOLD consecutive failed attempts the
+               circuit opens: calls fail fast with CircuitOpenError for
+               GROQ_BREAKER_COOLDOWN seconds, then a single probe decides
+               whether it closes again (doubling the cooldown if not). Like
+               pacing, the breaker is per model, so a struggling classifier
+               model doesn't stop generation. Any answer from the server,
+               including a 400, closes it.
+
+The scripts' token buckets (GROQ_RPM) stay in place as a static ceiling;
+this wrapper lets that ceiling sit close to the real limit. Every attempt
+sent, including ones that end in a 429 or an error, is counted as
+`groq_attempts:<model>`, which is what the daily quota is charged from.
+"""
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+GROQ_HEADER_PACING = os.environ.get("GROQ_HEADER_PACING", "1") != "0"   # 0: retries / breaker only (A/B)
+GROQ_MAX_RETRIES = int(os.environ.get("GROQ_MAX_RETRIES", "4"))
+GROQ_BACKOFF_BASE = float(os.environ.get("GROQ_BACKOFF_BASE", "1.0"))      # seconds, doubled per attempt
+GROQ_BACKOFF_MAX = float(os.environ.get("GROQ_BACKOFF_MAX", "60"))
+GROQ_BREAKER_THRESHOLD = int(os.environ.get("GROQ_BREAKER_THRESHOLD", "5"))
+GROQ_BREAKER_COOLDOWN = float(os.environ.get("GROQ_BREAKER_COOLDOWN", "60"))
+BREAKER_MAX_COOLDOWN = 600.0
+SHORT_WINDOW_S = 120.0        # rate windows at most this long are paced; longer ones are only a floor
+PACING_LOW_WATER = float(os.environ.get("GROQ_PACING_LOW_WATER", "0.25"))   # pace below this share of the limit
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+_TRANSIENT_ERRORS = ("APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling Groq while the circuit breaker is open."""
+
+
+def parse_duration(value) -> Optional[float]:
+    """Groq reset header ("2m59.56s", "7.66s", "120ms") or retry-after ("12") → seconds."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(text)
+    if not parts:
+        return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+
+def _status_of(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def _headers_of(exc: Exception) -> dict:
+    return dict(getattr(getattr(exc, "response", None), "headers", None) or {})
+
+
+def is_retryable(exc: Exception) -> bool:
+    status = _status_of(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in _TRANSIENT_ERRORS or isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class _Window:
+    """What the API last reported for one limit (requests or tokens)."""
+
+    def __init__(self):
+        self.limit: Optional[float] = None
+        self.remaining: Optional[float] = None
+        self.reset_at = 0.0           # monotonic time the window is full again
+        self.length = 0.0             # seconds from the report to the reset
+
+    def update(self, limit, remaining, reset, now: float) -> None:
+        reset_s = parse_duration(reset)
+        if remaining is None or reset_s is None:
+            return
+        try:
+            self.remaining = float(remaining)
+            self.limit = float(limit) if limit is not None else self.limit
+        except ValueError:
+            return
+        self.length = reset_s
+        self.reset_at = now + reset_s
+
+    def delay(self, cost: float, now: float) -> tuple:
+        """
+        (wait_until, spacing) for a request costing `cost` units of this limit.
+        Free-running while there is headroom. Below the low-water mark a short
+        window is paced at its refill rate. A request the window can't cover
+        waits until enough of it has refilled.
+        """
+        if self.remaining is None or now >= self.reset_at:
+            return now, 0.0
+        used = (self.limit or 0.0) - self.remaining
+        refill = used / (self.reset_at - now) if used > 0 else 0.0     # units per second
+        if self.remaining < cost:
+            if refill <= 0:
+                return self.reset_at, 0.0
+            # Later callers queue behind this one at the refill rate
+            return min(self.reset_at, now + (cost - self.remaining) / refill), cost / refill
+        if self.length > SHORT_WINDOW_S or refill <= 0 or self.remaining > PACING_LOW_WATER * self.limit:
+            return now, 0.0
+        return now, cost / refill
+
+
+class _ModelLimits:
+    """Pacing and breaker state for one model (Groq's limits are per model)."""
+
+    def __init__(self, breaker_cooldown: float):
+        self.requests = _Window()
+        self.tokens = _Window()
+        self.next_at = 0.0            # monotonic time before which no request may start
+        self.failures = 0             # consecutive failed attempts
+        self.open_until = 0.0         # 0.0 = circuit closed
+        self.cooldown = breaker_cooldown
+        self.probing = False
+
+
+class AdaptiveGroq:
+    """
+    Drop-in for a groq client: `chat.completions.create(...)` with the same
+    arguments and return value. Thread-safe; share one instance per process.
+    Pacing and the circuit breaker are both tracked per model.
+    """
+
+    def __init__(self, inner, max_retries: int = GROQ_MAX_RETRIES,
+                 breaker_threshold: int = GROQ_BREAKER_THRESHOLD, breaker_cooldown: float = GROQ_BREAKER_COOLDOWN):
+        self.inner = inner
+        self.max_retries = max_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.requests = 0             # attempts actually sent
+        self._models: dict = {}       # model -> _ModelLimits
+        self._completion_ewma = 400.0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    # ── circuit breaker ──
+    def _admit(self, model: str) -> bool:
+        """Raises CircuitOpenError while `model`'s circuit is open. Returns True if this call is the probe."""
+        with self._lock:
+            b = self._limits(model)
+            now = time.monotonic()
+            if b.open_until == 0.0:
+                return False
+            if now < b.open_until or b.probing:
+                metrics.inc("groq_breaker_rejected")
+                raise CircuitOpenError(f"Groq circuit for {model} open for another "
+                                       f"{max(0.0, b.open_until - now):.0f}s after {b.failures} consecutive failures")
+            b.probing = True              # half-open: this call is the probe
+            return True
+
+    def _succeeded(self, model: str) -> None:
+        with self._lock:
+            b = self._limits(model)
+            if b.open_until:
+                log.info(f"Groq circuit for {model} closed: probe succeeded")
+            b.failures, b.open_until, b.probing = 0, 0.0, False
+            b.cooldown = self.breaker_cooldown
+
+    def _failed(self, model: str) -> None:
+        with self._lock:
+            b = self._limits(model)
+            b.failures += 1
+            if b.probing or (not b.open_until and b.failures >= self.breaker_threshold):
+                if b.probing:
+                    b.cooldown = min(BREAKER_MAX_COOLDOWN, b.cooldown * 2)
+                b.open_until = time.monotonic() + b.cooldown
+                b.probing = False
+                metrics.inc("groq_breaker_opened")
+                log.error(f"Groq circuit for {model} opened for {b.cooldown:.0f}s "
+                          f"after {b.failures} consecutive failures")
+
+    def _release_probe(self, model: str) -> None:
+        """A probe that ended without an answer either way (e.g. a local error) lets the next call probe."""
+        with self._lock:
+            self._limits(model).probing = False
+
+    # ── pacing ──
+    def _limits(self, model: str) -> _ModelLimits:
+        """Caller holds the lock."""
+        if model not in self._models:
+            self._models[model] = _ModelLimits(self.breaker_cooldown)
+        return self._models[model]
+
+    def _reserve(self, model: str, est_tokens: float) -> float:
+        """Claims the next start slot for `model`. Returns seconds to wait before sending."""
+        with self._lock:
+            limits = self._limits(model)
+            now = time.monotonic()
+            start = max(now, limits.next_at)
+            spacing = 0.0
+            for window, cost in ((limits.requests, 1.0), (limits.tokens, est_tokens)):
+                until, gap = window.delay(cost, now)
+                start = max(start, until)
+                spacing = max(spacing, gap)
+                if window.remaining is not None and now < window.reset_at:
+                    window.remaining -= cost       # other threads see this request's share
+            limits.next_at = start + spacing
+            self.requests += 1
+            return start - now
+
+    def _observe(self, model: str, headers: dict) -> None:
+        if not headers or not GROQ_HEADER_PACING:
+            return
+        get = lambda k: headers.get(k) if hasattr(headers, "get") else None
+        with self._lock:
+            limits = self._limits(model)
+            now = time.monotonic()
+            for window, kind in ((limits.requests, "requests"), (limits.tokens, "tokens")):
+                window.update(get(f"x-ratelimit-limit-{kind}"), get(f"x-ratelimit-remaining-{kind}"),
+                              get(f"x-ratelimit-reset-{kind}"), now)
+
+    def _pause(self, model: str, seconds: float) -> None:
+        """Holds back every thread's next call to `model`."""
+        with self._lock:
+            limits = self._limits(model)
+            limits.next_at = max(limits.next_at, time.monotonic() + seconds)
+
+    def _estimate_tokens(self, kwargs: dict) -> float:
+        prompt = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages") or []) / 4
+        completion = self._completion_ewma
+        if kwargs.get("max_tokens"):
+            completion = min(completion, kwargs["max_tokens"])
+        return prompt + completion
+
+    def _send(self, kwargs: dict) -> tuple:
+        completions = self.inner.chat.completions
+        raw_api = getattr(completions, "with_raw_response", None)
+        if raw_api is not None:
+            raw = raw_api.create(**kwargs)
+            return raw.parse(), raw.headers
+        return completions.create(**kwargs), {}
+
+    # ── public ──
+    def create(self, **kwargs):
+        model = kwargs.get("model", "")
+        est = self._estimate_tokens(kwargs)
+        for attempt in range(self.max_retries + 1):
+            probe = self._admit(model)
+            try:
+                wait = self._reserve(model, est)
+                if wait > 0:
+                    metrics.observe("groq_pacing_wait", wait)
+                    time.sleep(wait)
+                metrics.inc(f"groq_attempts:{model}")      # Groq counts every attempt against the quota
+                response, headers = self._send(kwargs)
+            except Exception as e:
+                self._observe(model, _headers_of(e))
+                if not is_retryable(e):
+                    if _status_of(e) is not None:
+                        self._succeeded(model)            # the server answered; the request was at fault
+                    elif probe:
+                        self._release_probe(model)
+                    raise
+                status = _status_of(e)
+                metrics.inc("rate_limited" if status == 429 else "groq_transient_errors")
+                self._failed(model)
+                if attempt == self.max_retries:
+                    metrics.inc("retries_exhausted")
+                    raise
+                retry_after = parse_duration(_headers_of(e).get("retry-after"))
+                if retry_after is not None:
+                    delay = retry_after + random.uniform(0, 0.25 * retry_after + 0.1)
+                else:
+                    delay = random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * 2 ** attempt))
+                metrics.inc("retries")
+                log.warning(f"Groq {'rate limit' if status == 429 else 'error'} (attempt {attempt + 1}): "
+                            f"retrying in {delay:.1f}s — {e}")
+                self._pause(model, delay)
+                continue
+            except BaseException:
+                if probe:
+                    self._release_probe(model)             # e.g. KeyboardInterrupt mid-sleep
+                raise
+            self._observe(model, headers)
+            self._succeeded(model)
+            usage = getattr(response, "usage", None)
+            if getattr(usage, "completion_tokens", None):
+                with self._lock:
+                    self._completion_ewma = 0.8 * self._completion_ewma + 0.2 * usage.completion_tokens
+            return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "models": {m: {"remaining_requests": l.requests.remaining, "remaining_tokens": l.tokens.remaining}
+                           for m, l in self._models.items()},
+                "breaker_open": sorted(m for m, l in self._models.items() if l.open_until > time.monotonic()),
+                "consecutive_failures": {m: l.failures for m, l in self._models.items() if l.failures},
+            }
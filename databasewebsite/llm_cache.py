@@ -0,0 +1,116 @@
+"""
+llm_cache.py — Persistent content-addressed cache for Groq classification calls
+=========================================================
+Key = sha256(model, prompt template version, normalized question text), so a
+new model or a reworded prompt naturally misses. Values are the parsed JSON
+the model returned.
+
+  • TTL per entry (valid answers live long; invalid ones expire quickly so a
+    broken row is retried a few times a day instead of every cron tick).
+  • Size-bounded: least-recently-used entries are evicted past max_entries.
+  • Hit / miss / eviction counters for the run report.
+  • read_only (DRY_RUN): lookups still hit, but nothing is written, expired
+    or evicted (last_access isn't bumped either), so a dry run leaves the
+    cache exactly as the next real run expects it.
+
+Backed by a single SQLite file under .cache/ (persisted by the workflow).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from dedup import normalize_text
+
+LLM_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_cache.sqlite3"),
+)
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL_DAYS", "30")) * 86400
+LLM_CACHE_NEGATIVE_TTL = float(os.environ.get("LLM_CACHE_NEGATIVE_TTL_HOURS", "6")) * 3600
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "200000"))
+EVICT_CHECK_EVERY = 64         # puts between size checks (COUNT(*) is a scan)
+
+
+class LLMCache:
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, read_only: bool = False):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key          TEXT PRIMARY KEY,
+                value        TEXT NOT NULL,
+                expires_at   REAL NOT NULL,
+                last_access  REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+
+    @staticmethod
+    def key(model: str, prompt_version: str, text: str) -> str:
+        payload = f"{model}\x1f{prompt_version}\x1f{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt_version: str, text: str) -> Optional[dict]:
+        k = self.key(model, prompt_version, text)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (k,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None and not self.read_only:
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (k,))
+                self.misses += 1
+                return None
+            if not self.read_only:
+                self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, k))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, model: str, prompt_version: str, text: str, value: dict, ttl: Optional[float] = None) -> None:
+        if self.read_only:
+            return
+        k = self.key(model, prompt_version, text)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (k, json.dumps(value), now + (self.ttl if ttl is None else ttl), now),
+            )
+            self._puts += 1
+            if self._puts % EVICT_CHECK_EVERY == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        over = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+        if over > 0:
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access LIMIT ?)", (over,)
+            )
+            self.evictions += over
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if not self.read_only:
+                self._evict()
+            self._db.close()
@@ -0,0 +1,333 @@
+"""
+local_classifier.py — Local pre-classifier for question tags
+=========================================================
+Picks domain (8-way; module follows from domain) and difficulty (3-way) for
+a question without an LLM call. Only rows the model is unsure about are
+passed on to Groq.
+
+Model: multinomial naive Bayes over TF-IDF-weighted word unigrams + bigrams
+(numbers masked), trained on the correctly tagged rows already in
+sat_question_bank. Pure stdlib — predicting one question takes tens of
+microseconds and the model is a small JSON file under .cache/.
+
+Confidence is the temperature-calibrated posterior of the winning class; a
+prediction is used only if BOTH heads clear LOCAL_CLASSIFIER_THRESHOLD.
+
+The repair paths call load_or_train(), which trains on first use (CI starts
+with an empty .cache) and retrains once the saved model is older than
+LOCAL_CLASSIFIER_MAX_AGE_HOURS, so the model follows the bank without a
+separate job. A failed attempt (typically a young bank with fewer than
+MIN_TRAIN_ROWS tagged rows) touches a `<model>.tried` marker, and no new
+attempt is made until that marker is older than the same max age, so
+cron runs and daemon cycles don't page through the bank on every call.
+
+Usage:
+  python local_classifier.py retrain [--threshold 0.9]   # fetch, train, evaluate, save
+  python local_classifier.py evaluate                    # re-score the saved model
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+LOCAL_CLASSIFIER_PATH = os.environ.get(
+    "LOCAL_CLASSIFIER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "local_classifier.json"),
+)
+LOCAL_CLASSIFIER_THRESHOLD = float(os.environ.get("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+LOCAL_CLASSIFIER_MAX_AGE_HOURS = float(os.environ.get("LOCAL_CLASSIFIER_MAX_AGE_HOURS", "24"))
+MIN_TRAIN_ROWS = 200         # fewer correctly tagged rows than this: don't train, defer everything to Groq
+MAX_VOCAB = 30_000
+MIN_DF = 2
+ALPHA = 0.1                  # Lidstone smoothing
+HOLDOUT_BUCKETS = 10         # by id hash: bucket 0 = test, bucket 1 = calibration, rest = train
+PAGE_SIZE = 1000
+
+DOMAIN_MODULE = {
+    "Heart_of_Algebra": "Math", "Advanced_Math": "Math",
+    "Problem_Solving_Data": "Math", "Geometry_Trigonometry": "Math",
+    "Information_Ideas": "Reading_Writing", "Craft_Structure": "Reading_Writing",
+    "Expression_Ideas": "Reading_Writing", "Standard_English": "Reading_Writing",
+}
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?|[=<>^√π%$+\-*/]")
+
+# ─────────────────────────────────────────────────────────────
+# FEATURES
+# ─────────────────────────────────────────────────────────────
+def features(text: str) -> Counter:
+    toks = ["#" if t[0].isdigit() else t for t in _TOKEN_RE.findall((text or "").lower())]
+    feats = Counter(toks)
+    feats.update(f"{a} {b}" for a, b in zip(toks, toks[1:]))
+    return feats
+
+# ─────────────────────────────────────────────────────────────
+# NAIVE BAYES HEAD
+# ─────────────────────────────────────────────────────────────
+class _NBHead:
+    """One multinomial NB classifier over TF-IDF-weighted features."""
+
+    def __init__(self, classes: list, log_prior: dict, log_lik: dict, log_unseen: dict, temperature: float = 1.0):
+        self.classes = classes
+        self.temperature = temperature  # fitted on calibration rows; NB posteriors are overconfident
+        self.log_prior = log_prior
+        self.log_lik = log_lik          # class -> {feature: log P(f|c)}
+        self.log_unseen = log_unseen    # class -> log P(unseen in-vocab f | c)
+
+    @classmethod
+    def fit(cls, docs: list, labels: list, idf: dict) -> "_NBHead":
+        classes = sorted(set(labels))
+        n_docs = Counter(labels)
+        mass = {c: Counter() for c in classes}
+        for feats, label in zip(docs, labels):
+            m = mass[label]
+            for f, tf in feats.items():
+                w = idf.get(f)
+                if w is not None:
+                    m[f] += (1 + math.log(tf)) * w
+        log_prior = {c: math.log(n_docs[c] / len(labels)) for c in classes}
+        log_lik, log_unseen = {}, {}
+        for c in classes:
+            denom = sum(mass[c].values()) + ALPHA * len(idf)
+            log_lik[c] = {f: math.log((v + ALPHA) / denom) for f, v in mass[c].items()}
+            log_unseen[c] = math.log(ALPHA / denom)
+        return cls(classes, log_prior, log_lik, log_unseen)
+
+    def scores(self, feats: Counter, idf: dict) -> dict:
+        weighted = [(f, (1 + math.log(tf)) * idf[f]) for f, tf in feats.items() if f in idf]
+        out = {}
+        for c in self.classes:
+            lik, unseen = self.log_lik[c], self.log_unseen[c]
+            out[c] = self.log_prior[c] + sum(w * lik.get(f, unseen) for f, w in weighted)
+        return out
+
+    @staticmethod
+    def _posterior(scores: dict, temperature: float) -> tuple:
+        best = max(scores, key=scores.get)
+        z = sum(math.exp((s - scores[best]) / temperature) for s in scores.values())
+        return best, 1.0 / z
+
+    def predict(self, feats: Counter, idf: dict) -> tuple:
+        """Returns (best_class, calibrated posterior probability)."""
+        return self._posterior(self.scores(feats, idf), self.temperature)
+
+    def calibrate(self, docs: list, labels: list, idf: dict) -> None:
+        """Temperature scaling: pick T minimising held-out negative log-likelihood."""
+        all_scores = [self.scores(d, idf) for d in docs]
+        best_t, best_nll = 1.0, float("inf")
+        for t in (1, 1.5, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64):
+            nll = 0.0
+            for sc, label in zip(all_scores, labels):
+                top = max(sc.values())
+                z = sum(math.exp((v - top) / t) for v in sc.values())
+                nll -= (sc.get(label, top - 1e3) - top) / t - math.log(z)
+            if nll < best_nll:
+                best_t, best_nll = t, nll
+        self.temperature = best_t
+
+    def to_json(self) -> dict:
+        return {"classes": self.classes, "log_prior": self.log_prior,
+                "log_lik": self.log_lik, "log_unseen": self.log_unseen, "temperature": self.temperature}
+
+# ─────────────────────────────────────────────────────────────
+# MODEL
+# ─────────────────────────────────────────────────────────────
+class LocalClassifier:
+    def __init__(self, idf: dict, domain: _NBHead, difficulty: _NBHead,
+                 threshold: float = LOCAL_CLASSIFIER_THRESHOLD, report: Optional[dict] = None):
+        self.idf = idf
+        self.domain = domain
+        self.difficulty = difficulty
+        self.threshold = threshold
+        self.report = report or {}
+
+    @classmethod
+    def train(cls, rows: list, threshold: float = LOCAL_CLASSIFIER_THRESHOLD) -> "LocalClassifier":
+        docs = [features(r["question_text"]) for r in rows]
+        df = Counter()
+        for d in docs:
+            df.update(d.keys())
+        vocab = [f for f, n in df.most_common(MAX_VOCAB) if n >= MIN_DF]
+        idf = {f: math.log((1 + len(docs)) / (1 + df[f])) + 1 for f in vocab}
+        domain = _NBHead.fit(docs, [r["domain"] for r in rows], idf)
+        difficulty = _NBHead.fit(docs, [r["difficulty"] for r in rows], idf)
+        return cls(idf, domain, difficulty, threshold)
+
+    def calibrate(self, rows: list) -> None:
+        docs = [features(r["question_text"]) for r in rows]
+        self.domain.calibrate(docs, [r["domain"] for r in rows], self.idf)
+        self.difficulty.calibrate(docs, [r["difficulty"] for r in rows], self.idf)
+
+    def predict(self, question_text: str) -> dict:
+        """
+        {"module", "domain", "difficulty", "confidence", "confident"} — tags use
+        the same enum strings as the LLM classifiers.
+        """
+        feats = features(question_text)
+        domain, p_dom = self.domain.predict(feats, self.idf)
+        difficulty, p_diff = self.difficulty.predict(feats, self.idf)
+        confidence = min(p_dom, p_diff)
+        return {
+            "module": DOMAIN_MODULE.get(domain), "domain": domain, "difficulty": difficulty,
+            "confidence": confidence, "confident": confidence >= self.threshold,
+        }
+
+    def evaluate(self, rows: list) -> dict:
+        """Accuracy on `rows`, and the share the model would answer without Groq."""
+        n = len(rows) or 1
+        dom_ok = diff_ok = both_ok = confident = confident_ok = 0
+        for r in rows:
+            p = self.predict(r["question_text"])
+            d_ok, f_ok = p["domain"] == r["domain"], p["difficulty"] == r["difficulty"]
+            dom_ok += d_ok
+            diff_ok += f_ok
+            both_ok += d_ok and f_ok
+            if p["confident"]:
+                confident += 1
+                confident_ok += d_ok and f_ok
+        return {
+            "holdout_rows": len(rows),
+            "domain_accuracy": round(dom_ok / n, 4),
+            "difficulty_accuracy": round(diff_ok / n, 4),
+            "joint_accuracy": round(both_ok / n, 4),
+            "threshold": self.threshold,
+            "llm_calls_avoided": round(confident / n, 4),
+            "accuracy_when_confident": round(confident_ok / confident, 4) if confident else None,
+        }
+
+    def save(self, path: str = LOCAL_CLASSIFIER_PATH) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"idf": self.idf, "domain": self.domain.to_json(),
+                       "difficulty": self.difficulty.to_json(), "report": self.report}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = LOCAL_CLASSIFIER_PATH, threshold: float = LOCAL_CLASSIFIER_THRESHOLD) -> Optional["LocalClassifier"]:
+        """Returns the saved model, or None if it hasn't been trained yet."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(data["idf"], _NBHead(**data["domain"]), _NBHead(**data["difficulty"]),
+                   threshold, data.get("report"))
+
+# ─────────────────────────────────────────────────────────────
+# TRAINING DATA
+# ─────────────────────────────────────────────────────────────
+def split_of(row_id: str) -> str:
+    """Deterministic train / calib / test assignment, stable across retrains."""
+    bucket = int(hashlib.md5(str(row_id).encode()).hexdigest(), 16) % HOLDOUT_BUCKETS
+    return {0: "test", 1: "calib"}.get(bucket, "train")
+
+
+def fetch_training_rows(supabase) -> list:
+    """Every correctly tagged row, keyset-paginated by id."""
+    rows, last_id = [], None
+    while True:
+        q = supabase.table("sat_question_bank") \
+            .select("id, module, domain, difficulty, question_text") \
+            .in_("domain", list(DOMAIN_MODULE)).in_("difficulty", DIFFICULTIES) \
+            .order("id").limit(PAGE_SIZE)
+        if last_id:
+            q = q.gt("id", last_id)
+        page = q.execute().data or []
+        rows += [r for r in page if DOMAIN_MODULE.get(r["domain"]) == r["module"] and r.get("question_text")]
+        if len(page) < PAGE_SIZE:
+            return rows
+        last_id = page[-1]["id"]
+
+
+def retrain(supabase, threshold: float = LOCAL_CLASSIFIER_THRESHOLD,
+            path: str = LOCAL_CLASSIFIER_PATH) -> LocalClassifier:
+    rows = fetch_training_rows(supabase)
+    train_rows = [r for r in rows if split_of(r["id"]) == "train"]
+    if len(train_rows) < MIN_TRAIN_ROWS:
+        raise ValueError(f"only {len(train_rows)} training rows (need {MIN_TRAIN_ROWS})")
+    calib_rows = [r for r in rows if split_of(r["id"]) == "calib"]
+    test_rows = [r for r in rows if split_of(r["id"]) == "test"]
+    started = time.monotonic()
+    model = LocalClassifier.train(train_rows, threshold)
+    model.calibrate(calib_rows)
+    trained_in = time.monotonic() - started
+    model.report = model.evaluate(test_rows)
+    model.report.update(train_rows=len(train_rows), vocab=len(model.idf), train_seconds=round(trained_in, 2))
+    if test_rows:
+        t0 = time.perf_counter()
+        for r in test_rows:
+            model.predict(r["question_text"])
+        model.report["predict_us"] = round((time.perf_counter() - t0) / len(test_rows) * 1e6, 1)
+    model.save(path)
+    log.info(f"Local classifier retrained: {json.dumps(model.report)}")
+    return model
+
+
+def _age_hours(path: str) -> Optional[float]:
+    try:
+        return (time.time() - os.path.getmtime(path)) / 3600
+    except OSError:
+        return None
+
+
+def load_or_train(supabase, max_age_hours: float = LOCAL_CLASSIFIER_MAX_AGE_HOURS,
+                  path: str = LOCAL_CLASSIFIER_PATH) -> Optional[LocalClassifier]:
+    """
+    The saved model, (re)trained first if there is none or it is older than
+    `max_age_hours`. If training fails the stale model (or None) is returned,
+    so repair falls back to Groq instead of stopping, and the attempt is
+    recorded so the next one waits another `max_age_hours`.
+    """
+    model = LocalClassifier.load(path)
+    age_h = _age_hours(path) if model is not None else None
+    if model is not None and age_h is not None and age_h < max_age_hours:
+        return model
+    marker = path + ".tried"
+    tried_h = _age_hours(marker)
+    if tried_h is not None and tried_h < max_age_hours:
+        return model
+    log.info("Local classifier: " + ("no saved model" if model is None else f"model is {age_h:.0f}h old")
+             + " — retraining")
+    try:
+        model = retrain(supabase, path=path)
+    except Exception as e:
+        log.warning(f"Local classifier retrain failed ({e}); "
+                    + ("using the previous model." if model is not None else "all rows go to Groq.")
+                    + f" Next attempt in {max_age_hours:g}h.")
+        os.makedirs(os.path.dirname(marker) or ".", exist_ok=True)
+        with open(marker, "w") as f:
+            f.write(f"{e}\n")
+        return model
+    if os.path.exists(marker):
+        os.remove(marker)
+    return model
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Train / evaluate the local tag classifier.")
+    parser.add_argument("command", choices=["retrain", "evaluate"])
+    parser.add_argument("--threshold", type=float, default=LOCAL_CLASSIFIER_THRESHOLD)
+    args = parser.parse_args()
+
+    from backends import make_supabase
+    client = make_supabase()
+    if args.command == "retrain":
+        retrain(client, args.threshold)
+    else:
+        model = LocalClassifier.load(threshold=args.threshold)
+        if model is None:
+            raise SystemExit("No saved model — run `python local_classifier.py retrain` first.")
+        holdout = [r for r in fetch_training_rows(client) if split_of(r["id"]) == "test"]
+        print(json.dumps(model.evaluate(holdout), indent=2))
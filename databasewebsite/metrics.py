@@ -0,0 +1,271 @@
+"""
+metrics.py — Per-run instrumentation for the harvester
+=========================================================
+One process-wide RunMetrics collects, thread-safely:
+
+  • stage timings   (`with metrics.timer("validate"): …`) → n / p50 / p99 / total
+  • counters        Groq requests, prompt / completion tokens (also per model,
+                    for pricing), retries, 429s, parse errors, repair results, …
+  • bucket outcomes every requested question's outcome (accepted, invalid,
+                    duplicate, near_duplicate, insert_failed) plus the
+                    specific rejection reason, per (module, domain,
+                    difficulty, is_spr) bucket
+
+At the end of a run write() produces:
+
+  • RUN_REPORT_PATH          latest report (JSON)
+  • RUN_HISTORY_PATH         one compact JSON line per run, for cost / yield trends
+  • PROMETHEUS_TEXTFILE      optional node_exporter textfile (only if set)
+"""
+
+import datetime as dt
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from scheduler import bucket_key
+
+log = logging.getLogger(__name__)
+
+_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+RUN_REPORT_PATH = os.environ.get("RUN_REPORT_PATH", os.path.join(_CACHE_DIR, "run_report.json"))
+RUN_HISTORY_PATH = os.environ.get("RUN_HISTORY_PATH", os.path.join(_CACHE_DIR, "run_history.jsonl"))
+PROMETHEUS_TEXTFILE = os.environ.get("PROMETHEUS_TEXTFILE", "")
+# USD per million tokens (input, output), Groq list prices; only used for the estimate.
+# GROQ_MODEL_PRICES='{"model": [in, out], …}' adds or overrides entries; models
+# not listed are priced at GROQ_COST_PER_MTOK_IN / _OUT.
+MODEL_PRICES = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    **{m: tuple(p) for m, p in json.loads(os.environ.get("GROQ_MODEL_PRICES", "{}")).items()},
+}
+COST_PER_MTOK_IN = float(os.environ.get("GROQ_COST_PER_MTOK_IN", "0.59"))
+COST_PER_MTOK_OUT = float(os.environ.get("GROQ_COST_PER_MTOK_OUT", "0.79"))
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    # ceil(p% of n); round(x + 0.5) rounds half to even, so an exact rank (p50 of 10) landed one high
+    rank = max(1, min(len(sorted_values), math.ceil(p * len(sorted_values) / 100)))
+    return sorted_values[rank - 1]
+
+
+def stage_summary(samples: dict) -> dict:
+    """{stage: [seconds, …]} → {stage: {n, p50_ms, p99_ms, total_s}}."""
+    out = {}
+    for stage, values in samples.items():
+        values = sorted(values)
+        out[stage] = {
+            "n": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "total_s": round(sum(values), 3),
+        }
+    return out
+
+
+def estimated_usd(counters: dict, prefix: Optional[str] = None) -> float:
+    """
+    Cost of the per-model token counters, each model at its own price. With
+    `prefix` only that caller's spend ("" = generation); otherwise all of it.
+    """
+    cost = 0.0
+    for key, n in counters.items():
+        name, sep, model = key.partition(":")
+        if not sep or "cached" in name or not name.endswith(("prompt_tokens", "completion_tokens")):
+            continue
+        kind = "prompt_tokens" if name.endswith("prompt_tokens") else "completion_tokens"
+        if prefix is not None and name != prefix + kind:
+            continue
+        price_in, price_out = MODEL_PRICES.get(model, (COST_PER_MTOK_IN, COST_PER_MTOK_OUT))
+        cost += n / 1e6 * (price_in if kind == "prompt_tokens" else price_out)
+    return cost
+
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.stages: dict = {}
+            self.counters: Counter = Counter()
+            self.buckets: dict = {}
+
+    # ── collection ──
+    @contextmanager
+    def timer(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def inc(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def record_usage(self, response, prefix: str = "") -> None:
+        """
+        Counts one completed Groq request and its token usage. Generation uses
+        the bare counters; other callers pass a prefix (e.g. "repair_") so
+        their spend is reported separately. Tokens are also counted per
+        model (`<prefix>prompt_tokens:<model>`) so each is priced correctly.
+        """
+        usage = getattr(response, "usage", None)
+        model = getattr(response, "model", None) or "unknown"
+        with self._lock:
+            self.counters[prefix + "requests"] += 1
+            if usage is not None:
+                prompt = getattr(usage, "prompt_tokens", 0) or 0
+                completion = getattr(usage, "completion_tokens", 0) or 0
+                self.counters[prefix + "prompt_tokens"] += prompt
+                self.counters[prefix + "completion_tokens"] += completion
+                self.counters[f"{prefix}prompt_tokens:{model}"] += prompt
+                self.counters[f"{prefix}completion_tokens:{model}"] += completion
+                details = getattr(usage, "prompt_tokens_details", None)     # prefix-cache hits, where reported
+                self.counters[prefix + "cached_prompt_tokens"] += getattr(details, "cached_tokens", 0) or 0
+
+    def outcome(self, bucket: tuple, outcome: str) -> None:
+        """Final outcome of one requested question (same vocabulary as scheduler.OUTCOMES)."""
+        with self._lock:
+            self.buckets.setdefault(bucket_key(bucket), Counter())[outcome] += 1
+            self.counters[f"outcome_{outcome}"] += 1
+
+    def reject(self, bucket: tuple, reason: str) -> None:
+        """Why a question was rejected before insert (finer-grained than its outcome)."""
+        with self._lock:
+            self.buckets.setdefault(bucket_key(bucket), Counter())[f"reason:{reason}"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+    # ── reporting ──
+    def report(self, extra: Optional[dict] = None) -> dict:
+        with self._lock:
+            c = Counter(self.counters)
+            stages = stage_summary(self.stages)
+            buckets = {k: dict(v) for k, v in sorted(self.buckets.items())}
+            started_at = self.started_at
+        accepted = c["outcome_accepted"]
+        tokens = c["prompt_tokens"] + c["completion_tokens"]
+        gen_cost = estimated_usd(c, prefix="")
+        cost = estimated_usd(c)
+        return {
+            "started_at": dt.datetime.fromtimestamp(started_at, dt.timezone.utc).isoformat(timespec="seconds"),
+            "duration_s": round(time.time() - started_at, 2),
+            "accepted": accepted,
+            "requests": c["requests"],
+            "tokens": {"prompt": c["prompt_tokens"], "completion": c["completion_tokens"], "total": tokens,
+                       "cached_prompt": c["cached_prompt_tokens"]},
+            "per_request": {
+                "prompt_tokens": round(c["prompt_tokens"] / c["requests"], 1) if c["requests"] else None,
+            },
+            "per_accepted": {
+                "requests": round(c["requests"] / accepted, 3) if accepted else None,
+                "tokens": round(tokens / accepted, 1) if accepted else None,
+                "estimated_usd": round(gen_cost / accepted, 6) if accepted else None,
+            },
+            "estimated_usd": round(cost, 6),           # all Groq spend this run, repair included
+            "counters": dict(sorted(c.items())),
+            "stages": stages,
+            "buckets": buckets,
+            **(extra or {}),
+        }
+
+    def write(self, extra: Optional[dict] = None, path: str = RUN_REPORT_PATH,
+              history_path: str = RUN_HISTORY_PATH, prom_path: str = PROMETHEUS_TEXTFILE) -> dict:
+        """Writes the JSON report (+ history line, + Prometheus textfile if configured). Never raises."""
+        report = self.report(extra)
+        try:
+            _atomic_write(path, json.dumps(report, indent=1))
+            summary = {k: report[k] for k in ("started_at", "duration_s", "accepted", "requests",
+                                              "tokens", "per_accepted", "estimated_usd")}
+            summary["outcomes"] = {k[len("outcome_"):]: v for k, v in report["counters"].items() if k.startswith("outcome_")}
+            os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+            with open(history_path, "a") as f:
+                f.write(json.dumps(summary) + "\n")
+            if prom_path:
+                _atomic_write(prom_path, to_prometheus(report))
+            log.info(f"Run report written to {path}")
+        except OSError as e:
+            log.warning(f"Could not write run report: {e}")
+        return report
+
+
+def _atomic_write(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in labels.items()) + "}"
+
+
+def to_prometheus(report: dict) -> str:
+    """Prometheus text exposition of a report (gauges describing the last run)."""
+    lines = [
+        "# HELP harvester_last_run_timestamp_seconds Start of the last harvester run.",
+        "# TYPE harvester_last_run_timestamp_seconds gauge",
+        f"harvester_last_run_timestamp_seconds {dt.datetime.fromisoformat(report['started_at']).timestamp():.0f}",
+        "# HELP harvester_run_duration_seconds Wall time of the last run.",
+        "# TYPE harvester_run_duration_seconds gauge",
+        f"harvester_run_duration_seconds {report['duration_s']}",
+        "# HELP harvester_counter Per-run counters (requests, tokens, retries, 429s, outcomes, …).",
+        "# TYPE harvester_counter gauge",
+    ]
+    lines += [f"harvester_counter{_labels(name=k)} {v}" for k, v in report["counters"].items()]
+    lines += [
+        "# HELP harvester_stage_seconds Stage latency quantiles for the last run.",
+        "# TYPE harvester_stage_seconds gauge",
+    ]
+    for stage, s in report["stages"].items():
+        lines.append(f"harvester_stage_seconds{_labels(stage=stage, quantile='0.5')} {s['p50_ms'] / 1000:.6f}")
+        lines.append(f"harvester_stage_seconds{_labels(stage=stage, quantile='0.99')} {s['p99_ms'] / 1000:.6f}")
+        lines.append(f"harvester_stage_seconds_sum{_labels(stage=stage)} {s['total_s']}")
+        lines.append(f"harvester_stage_seconds_count{_labels(stage=stage)} {s['n']}")
+    outcome_lines, reason_lines = [], []
+    for key, counts in report["buckets"].items():
+        module, domain, difficulty, is_spr = key.split("|")
+        bucket = dict(module=module, domain=domain, difficulty=difficulty, is_spr=is_spr)
+        for name, n in counts.items():
+            if name.startswith("reason:"):
+                reason_lines.append(f"harvester_bucket_rejections{_labels(**bucket, reason=name[len('reason:'):])} {n}")
+            else:
+                outcome_lines.append(f"harvester_bucket_outcomes{_labels(**bucket, outcome=name)} {n}")
+    lines += [
+        "# HELP harvester_bucket_outcomes Final outcome of each requested question, per bucket, last run.",
+        "# TYPE harvester_bucket_outcomes gauge",
+        *outcome_lines,
+        "# HELP harvester_bucket_rejections Rejection reasons per bucket, last run.",
+        "# TYPE harvester_bucket_rejections gauge",
+        *reason_lines,
+    ]
+    if report["per_accepted"]["tokens"] is not None:
+        lines += [
+            "# HELP harvester_tokens_per_accepted Groq tokens spent per accepted question.",
+            "# TYPE harvester_tokens_per_accepted gauge",
+            f"harvester_tokens_per_accepted {report['per_accepted']['tokens']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+metrics = RunMetrics()
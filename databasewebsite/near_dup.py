@@ -0,0 +1,435 @@
+"""
+near_dup.py — MinHash / LSH near-duplicate detector for the question bank
+=========================================================================
+Exact content_hash dedup misses the common LLM failure mode at temperature
+0.8: the same item with a different fictional name or number. This index
+catches those by comparing word-shingle sets:
+
+  1. Canonicalize: mask digits and mid-sentence capitalized words (names),
+     lower-case, collapse whitespace.
+  2. Shingle question_text + options into word 3-grams, hash with crc32.
+  3. One-permutation MinHash into NUM_PERM 32-bit slots; BANDS bands for LSH.
+  4. Candidates sharing any band are verified by signature agreement
+     (estimated Jaccard) against NEAR_DUP_THRESHOLD. Band keys are a
+     blake2b digest of the band's packed slots, so a saved index matches
+     under any Python version.
+
+The harvester checks a question with check() and holds its signature with
+stage() until the insert resolves: confirm() indexes rows that were
+written, discard() drops rows the database rejected, so the index never
+references a question that doesn't exist.
+
+Storage is flat `array` buffers (no per-row Python objects besides the id
+string) so 1M rows fit in a few hundred MB and load with `fromfile`. Band
+tables are sorted uint64 arrays of (band_key << 32 | row_index) searched with
+bisect; freshly added rows sit in a small dict until the next compaction.
+
+The index is persisted under NEAR_DUP_INDEX_DIR and synced incrementally
+from sat_question_bank with a (created_at, id) keyset watermark.
+
+Usage:
+  python near_dup.py sync                 # pull new rows from Supabase, save
+  python near_dup.py eval                 # precision/recall on near_dup_eval.jsonl
+  python near_dup.py bench 10000 100000   # synthetic build/memory/latency
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+NUM_PERM = 48
+BANDS = 8                      # 8 bands × 6 rows → candidate threshold ≈ (1/8)^(1/6) ≈ 0.71
+BAND_HASH = "blake2b-32"       # stored in meta.json; an index saved with another band hash is rebuilt
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.7"))
+NEAR_DUP_INDEX_DIR = os.environ.get("NEAR_DUP_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "near_dup"))
+NEAR_DUP_EVAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "near_dup_eval.jsonl")
+HOT_BUCKET_LIMIT = 64          # band buckets larger than this are skipped at query time
+COMPACT_EVERY = 50_000         # pending band entries before merging into sorted arrays
+SYNC_PAGE_SIZE = 1000
+
+_PRIME = (1 << 61) - 1
+_MASK32 = 0xFFFFFFFF
+_EMPTY = 1 << 40               # sentinel above any 32-bit slot value
+_ROTATE = 0x9E3779B1           # densification offset per borrowed slot
+_rng = random.Random(0x5A7)    # fixed seed: the hash must be identical across runs
+_A, _B = _rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)
+
+_NAME_RE = re.compile(r"(?<=[a-z,;:] )[A-Z][a-zA-Z'-]+")
+_NUM_RE = re.compile(r"\d+(?:[.,]\d+)*")
+_WORD_RE = re.compile(r"[a-z#]+")
+
+# ─────────────────────────────────────────────────────────────
+# SHINGLING / MINHASH
+# ─────────────────────────────────────────────────────────────
+def canonicalize(question_text: str, options: Optional[list] = None) -> str:
+    text = question_text or ""
+    if options:
+        text += " " + " ".join(str(o) for o in options)
+    text = _NAME_RE.sub("X", text)
+    text = _NUM_RE.sub("#", text)
+    return text.lower()
+
+
+def shingles(text: str, k: int = 3) -> set:
+    words = _WORD_RE.findall(text)
+    if len(words) < k:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + k]).encode()) for i in range(len(words) - k + 1)}
+
+
+def minhash(shingle_set: set) -> list:
+    """
+    One-permutation MinHash: a single universal hash per shingle, binned into
+    NUM_PERM slots keeping the minimum per slot. Empty slots are densified by
+    borrowing the next non-empty slot (rotation), so signatures stay comparable.
+    O(shingles) instead of O(shingles × NUM_PERM).
+    """
+    sig = [_EMPTY] * NUM_PERM
+    for x in shingle_set:
+        h = (_A * x + _B) % _PRIME
+        slot = h % NUM_PERM
+        v = (h // NUM_PERM) & _MASK32
+        if v < sig[slot]:
+            sig[slot] = v
+    if _EMPTY in sig and len(shingle_set):
+        for i in range(NUM_PERM):
+            if sig[i] == _EMPTY:
+                for d in range(1, NUM_PERM):
+                    v = sig[(i + d) % NUM_PERM]
+                    if v != _EMPTY and v <= _MASK32:
+                        sig[i] = (v + d * _ROTATE) & _MASK32
+                        break
+    return [v & _MASK32 for v in sig]
+
+
+def signature(question_text: str, options: Optional[list] = None) -> list:
+    return minhash(shingles(canonicalize(question_text, options)))
+
+
+def similarity(a, b) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def _band_keys(sig) -> list:
+    # Persisted in the band tables, so the hash must not depend on the
+    # interpreter (built-in hash() of a tuple is not guaranteed stable).
+    r = NUM_PERM // BANDS
+    return [int.from_bytes(hashlib.blake2b(struct.pack(f"<{r}I", *sig[i * r:(i + 1) * r]), digest_size=4).digest(), "little")
+            for i in range(BANDS)]
+
+# ─────────────────────────────────────────────────────────────
+# INDEX
+# ─────────────────────────────────────────────────────────────
+class NearDupIndex:
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD):
+        self.threshold = threshold
+        self.ids: list = []
+        self._sigs = array("I")
+        self._bands = [array("Q") for _ in range(BANDS)]
+        self._pending = [dict() for _ in range(BANDS)]
+        self._pending_count = 0
+        self.watermark: Optional[list] = None    # [created_at, id] of last synced row
+        self.local_keys: set = set()             # rows added by this harvester since the watermark
+        self._staged: dict = {}                  # row_id -> signature, awaiting confirm()/discard()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_signature(self, row_id: str, sig: list) -> None:
+        idx = len(self.ids)
+        self.ids.append(row_id)
+        self._sigs.extend(sig)
+        for b, key in enumerate(_band_keys(sig)):
+            self._pending[b].setdefault(key, []).append(idx)
+        self._pending_count += 1
+        if self._pending_count >= COMPACT_EVERY:
+            self.compact()
+
+    def add(self, row_id: str, question_text: str, options: Optional[list] = None) -> None:
+        self.add_signature(row_id, signature(question_text, options))
+
+    def compact(self) -> None:
+        """Merge pending band entries into the sorted band arrays."""
+        if not self._pending_count:
+            return
+        for b in range(BANDS):
+            merged = list(self._bands[b])
+            for key, idxs in self._pending[b].items():
+                merged.extend((key << 32) | i for i in idxs)
+            merged.sort()
+            self._bands[b] = array("Q", merged)
+            self._pending[b] = {}
+        self._pending_count = 0
+
+    def _candidates(self, sig: list) -> set:
+        cands = set()
+        for b, key in enumerate(_band_keys(sig)):
+            arr = self._bands[b]
+            lo = bisect_left(arr, key << 32)
+            hi = bisect_right(arr, (key << 32) | _MASK32)
+            pending = self._pending[b].get(key, ())
+            # Keys shared by hundreds of rows come from boilerplate stems
+            # ("Which choice completes the text…"); they carry no signal.
+            if hi - lo + len(pending) > HOT_BUCKET_LIMIT:
+                continue
+            cands.update(arr[j] & _MASK32 for j in range(lo, hi))
+            cands.update(pending)
+        return cands
+
+    def query_signature(self, sig: list) -> Optional[tuple]:
+        """Best match above threshold as (row_id, estimated_jaccard), else None."""
+        best = None
+        for idx in self._candidates(sig):
+            base = idx * NUM_PERM
+            score = similarity(self._sigs[base:base + NUM_PERM], sig)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (self.ids[idx], score)
+        return best
+
+    def query(self, question_text: str, options: Optional[list] = None) -> Optional[tuple]:
+        return self.query_signature(signature(question_text, options))
+
+    # ── Harvester hooks ───────────────────────────────────────
+    def check(self, question_text: str, options: Optional[list] = None) -> tuple:
+        """
+        (match, signature): the best near-duplicate among indexed and staged
+        rows, or None. Nothing is indexed; stage() the signature if the row
+        goes on to be written.
+        """
+        sig = signature(question_text, options)
+        match = self.query_signature(sig)
+        for row_id, staged in self._staged.items():
+            score = similarity(staged, sig)
+            if score >= self.threshold and (match is None or score > match[1]):
+                match = (row_id, score)
+        return match, sig
+
+    def stage(self, row_id: str, sig: list) -> None:
+        """Holds a row awaiting its insert so later rows in the batch are checked against it."""
+        self._staged[row_id] = sig
+
+    def confirm(self, row_id: str) -> None:
+        """The staged row was written: index it."""
+        sig = self._staged.pop(row_id, None)
+        if sig is not None:
+            self.add_signature(row_id, sig)
+            self.local_keys.add(row_id)
+
+    def discard(self, row_id: str) -> None:
+        """The staged row was not written (duplicate or failed insert): forget it."""
+        self._staged.pop(row_id, None)
+
+    def memory_bytes(self) -> int:
+        ids = sum(sys.getsizeof(s) for s in self.ids) + sys.getsizeof(self.ids)
+        arrays = self._sigs.itemsize * len(self._sigs) + sum(a.itemsize * len(a) for a in self._bands)
+        return ids + arrays
+
+    # ── Persistence ───────────────────────────────────────────
+    def save(self, path: str = NEAR_DUP_INDEX_DIR) -> None:
+        self.compact()
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "sigs.bin"), "wb") as f:
+            self._sigs.tofile(f)
+        for b, arr in enumerate(self._bands):
+            with open(os.path.join(path, f"band{b}.bin"), "wb") as f:
+                arr.tofile(f)
+        with open(os.path.join(path, "ids.txt"), "w") as f:
+            f.write("\n".join(self.ids))
+        meta = {
+            "num_perm": NUM_PERM, "bands": BANDS, "band_hash": BAND_HASH, "count": len(self.ids),
+            "watermark": self.watermark, "local_keys": sorted(self.local_keys),
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str = NEAR_DUP_INDEX_DIR, threshold: float = NEAR_DUP_THRESHOLD) -> "NearDupIndex":
+        """Loads a saved index, or returns an empty one if none exists / params changed."""
+        idx = cls(threshold)
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return idx
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("num_perm") != NUM_PERM or meta.get("bands") != BANDS or meta.get("band_hash") != BAND_HASH:
+            log.warning("Near-dup index parameters changed — rebuilding from scratch.")
+            return idx
+        count = meta["count"]
+        with open(os.path.join(path, "sigs.bin"), "rb") as f:
+            idx._sigs.fromfile(f, count * NUM_PERM)
+        for b in range(BANDS):
+            size = os.path.getsize(os.path.join(path, f"band{b}.bin")) // 8
+            with open(os.path.join(path, f"band{b}.bin"), "rb") as f:
+                idx._bands[b].fromfile(f, size)
+        with open(os.path.join(path, "ids.txt")) as f:
+            idx.ids = f.read().split("\n") if count else []
+        idx.watermark = meta.get("watermark")
+        idx.local_keys = set(meta.get("local_keys", []))
+        return idx
+
+    # ── Incremental sync from Supabase ────────────────────────
+    def sync(self, supabase) -> int:
+        """Indexes rows created after the stored watermark. Returns rows added."""
+        added = 0
+        while True:
+            q = supabase.table("sat_question_bank") \
+                .select("id, content_hash, question_text, options, created_at") \
+                .order("created_at").order("id").limit(SYNC_PAGE_SIZE)
+            if self.watermark:
+                ts, last_id = self.watermark
+                q = q.or_(f'created_at.gt."{ts}",and(created_at.eq."{ts}",id.gt.{last_id})')
+            rows = q.execute().data or []
+            for r in rows:
+                # Rows this harvester accepted were indexed under their content_hash already
+                if r.get("content_hash") in self.local_keys:
+                    continue
+                self.add(r["id"], r.get("question_text", ""), r.get("options"))
+                added += 1
+            if rows:
+                self.watermark = [rows[-1]["created_at"], rows[-1]["id"]]
+            if len(rows) < SYNC_PAGE_SIZE:
+                break
+        self.local_keys.clear()
+        log.info(f"Near-dup index synced: +{added} rows ({len(self)} total)")
+        return added
+
+# ─────────────────────────────────────────────────────────────
+# EVALUATION (labeled pairs)
+# ─────────────────────────────────────────────────────────────
+def evaluate(path: str = NEAR_DUP_EVAL_FILE, threshold: float = NEAR_DUP_THRESHOLD) -> dict:
+    """
+    Precision / recall on hand-labeled question pairs: LLM-style regenerations
+    (entity swaps, rewording, reordered options) and distinct questions built
+    on the same template or topic. Each pair goes through a fresh index the
+    way the harvester uses it: `a` is check()ed, stage()d and confirm()ed as
+    a written row, then `b` is check()ed, so LSH banding is exercised along
+    with the signature threshold.
+    """
+    with open(path) as f:
+        pairs = [json.loads(line) for line in f if line.strip()]
+    tp = fp = fn = tn = 0
+    by_kind: dict = {}
+    for pair in pairs:
+        idx = NearDupIndex(threshold)
+        _, sig = idx.check(pair["a"]["question_text"], pair["a"].get("options"))
+        idx.stage("a", sig)
+        idx.confirm("a")
+        caught = idx.check(pair["b"]["question_text"], pair["b"].get("options"))[0] is not None
+        kind = by_kind.setdefault(pair["kind"], [0, 0])
+        kind[0] += caught
+        kind[1] += 1
+        if pair["duplicate"]:
+            tp, fn = tp + caught, fn + (not caught)
+        else:
+            fp, tn = fp + caught, tn + (not caught)
+    return {
+        "pairs": len(pairs), "threshold": threshold,
+        "precision": round(tp / (tp + fp), 3) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 3) if tp + fn else None,
+        "false_positive_rate": round(fp / (fp + tn), 3) if fp + tn else None,
+        "flagged_by_kind": {k: f"{v[0]}/{v[1]}" for k, v in sorted(by_kind.items())},
+    }
+
+# ─────────────────────────────────────────────────────────────
+# BENCHMARK (synthetic rows)
+# ─────────────────────────────────────────────────────────────
+_NAMES = ["Ava", "Liam", "Noor", "Kenji", "Marisol", "Tobias", "Priya", "Olu", "Greta", "Ravi"]
+_STEMS = [
+    "Which choice completes the text with the most logical and precise word or phrase?",
+    "Which equation represents the situation described?",
+    "Which choice best states the main purpose of the text?",
+    "What is the value of x?",
+    "Which finding, if true, would most directly support the claim?",
+]
+_vrng = random.Random(1)
+_VOCAB = ["".join(_vrng.choice("abcdefghijklmnoprstuvw") for _ in range(_vrng.randint(3, 9))) for _ in range(20_000)]
+EDIT_RATES = (0.05, 0.1, 0.2, 0.3)
+
+
+def _synthetic_question(seed: int, variant: int = 0, edit_rate: float = 0.0) -> tuple:
+    """
+    Row `seed`. A different `variant` swaps names and numbers, and
+    `edit_rate` of the body words are replaced or dropped. Names and numbers
+    alone are masked by canonicalize(), so only the word edits test the LSH.
+    """
+    rng = random.Random(seed)
+    words = [rng.choice(_VOCAB) for _ in range(rng.randint(25, 60))]
+    stem = rng.choice(_STEMS)
+    vr = random.Random(seed * 7919 + variant)
+    if edit_rate:
+        edited = []
+        for w in words:
+            r = vr.random()
+            if r < edit_rate / 2:
+                continue                                  # dropped
+            edited.append(vr.choice(_VOCAB) if r < edit_rate else w)
+        words = edited
+    name, a, b = vr.choice(_NAMES), vr.randint(2, 90), vr.randint(2, 90)
+    text = f"In the study, {name} measured {a} samples over {b} days; " + " ".join(words) + ". " + stem
+    opts = [f"{a}x + {b}", f"{b}x + {a}", f"{a + b}x", f"{vr.randint(100, 999)}x"]
+    return text, opts
+
+
+def bench(sizes: list) -> None:
+    """
+    Build time, memory and lookup latency at scale. Recall is reported per
+    word-edit rate as a tolerance curve for the banding, not as real-world
+    recall; `python near_dup.py eval` measures that on labeled pairs.
+    """
+    for n in sizes:
+        idx = NearDupIndex()
+        t0 = time.perf_counter()
+        for i in range(n):
+            text, opts = _synthetic_question(i)
+            idx.add(str(i), text, opts)
+        idx.compact()
+        build = time.perf_counter() - t0
+
+        rng = random.Random(n)
+        unseen = [signature(*_synthetic_question(n + i)) for i in range(500)]
+        t0 = time.perf_counter()
+        false_pos = sum(idx.query_signature(s) is not None for s in unseen)
+        lookup_us = (time.perf_counter() - t0) / len(unseen) * 1e6
+        caught = []
+        for rate in EDIT_RATES:
+            probes = [signature(*_synthetic_question(rng.randrange(n), variant=1, edit_rate=rate)) for _ in range(500)]
+            caught.append(f"{rate:.0%}:{sum(idx.query_signature(s) is not None for s in probes)}/500")
+        print(f"n={n:>9,}  build={build:8.1f}s  mem={idx.memory_bytes() / 1e6:7.1f} MB  "
+              f"lookup={lookup_us:6.1f}µs  caught by word-edit rate: {' '.join(caught)}  "
+              f"false positives={false_pos}/500")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(
+        description="MinHash/LSH near-duplicate index. The harvester calls check() per question, "
+                    "stage()s the signature and confirm()s or discard()s it once the insert resolves.")
+    parser.add_argument("command", nargs="?", default="sync", choices=["sync", "eval", "bench"],
+                        help="sync: index rows created since the watermark and save; "
+                             "eval: precision/recall on near_dup_eval.jsonl through check/stage/confirm; "
+                             "bench: synthetic build/memory/latency at the given sizes")
+    parser.add_argument("sizes", nargs="*", type=int, help="bench: index sizes (default 10000 100000 1000000)")
+    args = parser.parse_args()
+    if args.command == "bench":
+        bench(args.sizes or [10_000, 100_000, 1_000_000])
+    elif args.command == "eval":
+        print(json.dumps(evaluate(), indent=1))
+    else:
+        from backends import make_supabase
+        index = NearDupIndex.load()
+        index.sync(make_supabase())
+        index.save()
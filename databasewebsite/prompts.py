@@ -0,0 +1,124 @@
+"""
+prompts.py — Token-budgeted generation prompts
+=========================================================
+Every generation request is two messages:
+
+  • system   GENERATION_SYSTEM_PROMPT: the shared rules and the output
+             schema. It is byte-identical on every request, so the
+             provider's prompt-prefix cache can serve it, and it is paid
+             once per request however many slots follow.
+  • user     one line per slot plus that slot's source passage, trimmed to
+             SOURCE_TOKEN_BUDGET tokens on a sentence boundary.
+
+The old prompts repeated a ~700-token instruction block in the user turn on
+every request and appended a "Randomization Seed Offset" line. That line made
+identical requests look different without changing the output distribution
+(temperature and the per-slot sources already vary the questions).
+
+Token counts are a local estimate (estimate_tokens), so no tokenizer has to
+be downloaded. `python prompts.py` prints the per-prompt breakdown for a
+sample queue.
+"""
+
+import math
+import os
+import re
+
+SOURCE_TOKEN_BUDGET = int(os.environ.get("SOURCE_TOKEN_BUDGET", "120"))   # per slot
+
+# Llama-3-style pre-tokenisation: words (with their leading space), digit
+# groups of up to three, and punctuation runs. Long words split into roughly
+# one token per 6 letters.
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]+|\s+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+GENERATION_SYSTEM_PROMPT = """You write brand-new Digital SAT questions and sanitize copyright. Write one question per slot in the user message; questions must be unrelated.
+
+Rules:
+1. Copy each slot's module, domain and difficulty exactly. Never invent categories.
+2. Use the topic of the slot's source if it fits, but do a strict Entity Swap: fictional names, places, companies and scenarios, different in every slot. Copy no text from the source.
+3. Keep math/logic/grammar mechanics identical to real College Board style.
+4. Easy = single step, Medium = 2-3 steps, Hard = multi-concept or trap.
+5. Reading_Writing: question_text starts with a 2-4 sentence passage.
+6. "multiple choice": is_spr false, 4 distinct plausible options, correct_answer is the exact text of one. "SPR" (grid-in): is_spr true, options null, correct_answer numeric.
+
+Reply with only this JSON, no markdown:
+{"questions":[{"slot":0,"module":"","domain":"","difficulty":"","is_spr":false,"question_text":"","options":["","","",""],"correct_answer":"","rationale":"1-2 sentences"}]}"""
+
+# ─────────────────────────────────────────────────────────────
+# TOKEN ESTIMATE
+# ─────────────────────────────────────────────────────────────
+def estimate_tokens(text: str) -> int:
+    """Approximate Llama 3 token count of `text`."""
+    n = 0
+    for piece in _PIECE_RE.findall(text or ""):
+        if piece[0].isalpha():
+            n += math.ceil(len(piece) / 6)
+        elif piece[0].isspace():
+            n += 1 if "\n" in piece or len(piece) > 1 else 0   # single spaces merge into the next word
+        else:
+            n += math.ceil(len(piece) / 2) if not piece[0].isdigit() else 1
+    return n
+
+
+def trim_to_tokens(text: str, budget: int = SOURCE_TOKEN_BUDGET) -> str:
+    """The longest run of whole sentences within `budget` tokens (whole words if one sentence is too long)."""
+    text = (text or "").strip()
+    if estimate_tokens(text) <= budget:
+        return text
+    kept, used = [], 0
+    for sentence in _SENTENCE_END_RE.split(text):
+        cost = estimate_tokens(sentence) + 1
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return " ".join(kept)
+    words, used = [], estimate_tokens("…")     # the ellipsis counts against the budget too
+    for word in text.split():
+        used += estimate_tokens(" " + word)
+        if used > budget:
+            break
+        words.append(word)
+    return " ".join(words) + "…"
+
+# ─────────────────────────────────────────────────────────────
+# MESSAGES
+# ─────────────────────────────────────────────────────────────
+def slot_line(i: int, module: str, domain: str, difficulty: str, is_spr: bool) -> str:
+    return f"Slot {i}: Section {module} | Domain {domain} | Difficulty {difficulty} | {'SPR' if is_spr else 'multiple choice'}"
+
+
+def generation_messages(buckets: list, sources: list, budget: int = SOURCE_TOKEN_BUDGET) -> list:
+    """[system, user] messages asking for one question per bucket, each with its own source."""
+    slots = "\n".join(slot_line(i, *b) for i, b in enumerate(buckets))
+    passages = "\n".join(f"[{i}] {trim_to_tokens(text, budget)}" for i, text in enumerate(sources))
+    return [
+        {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{slots}\n\nSources (one per slot):\n{passages}"},
+    ]
+
+
+def prompt_breakdown(messages: list) -> dict:
+    """Estimated tokens per message role, plus the total."""
+    counts: dict = {}
+    for m in messages:
+        counts[m["role"]] = counts.get(m["role"], 0) + estimate_tokens(m["content"])
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+if __name__ == "__main__":
+    import random
+
+    from corpus import SourceCorpus
+    from scraper import ALL_BUCKETS, GENERATION_BATCH_SIZE
+
+    rng = random.Random(0)
+    passages = [p["text"] for p in SourceCorpus.load().sample(GENERATION_BATCH_SIZE)]
+    buckets = rng.sample(ALL_BUCKETS, GENERATION_BATCH_SIZE)
+    for n in sorted({1, GENERATION_BATCH_SIZE}):
+        counts = prompt_breakdown(generation_messages(buckets[:n], passages[:n]))
+        print(f"{n} slot(s): {counts} → {counts['total'] / n:.0f} prompt tokens per question "
+              f"({counts['system']} cacheable)")
@@ -1,25 +1,59 @@
+import argparse
 import os
 import json
 import logging
 import time
-from supabase import create_client, Client
-from groq import Groq
+from backends import DRY_RUN, make_clients
+from llm_cache import LLM_CACHE_NEGATIVE_TTL, LLMCache
+from local_classifier import load_or_train
+from metrics import metrics
+from routing import CLASSIFY_CACHE_MODEL, classify_tiered, routing_summary
+from salvage import parse_counted
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger(__name__)
 
-SUPABASE_URL = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+# Live clients by default; SUPABASE_BACKEND / GROQ_BACKEND / DRY_RUN select others (backends.py)
+supabase, groq_client = make_clients()
+PROMPT_VERSION = "repair_db-v2"   # bump when the prompt below changes — invalidates cached tags
 
-if not all([SUPABASE_URL, SUPABASE_KEY, GROQ_API_KEY]):
-    raise ValueError("Missing required environment variables: NEXT_PUBLIC_SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY (or ANON), GROQ_API_KEY")
+VALID_MODULES = ["Math", "Reading_Writing"]
+VALID_DOMAINS = ["Heart_of_Algebra", "Advanced_Math", "Problem_Solving_Data", "Geometry_Trigonometry", "Information_Ideas", "Craft_Structure", "Expression_Ideas", "Standard_English"]
+VALID_DIFFS = ["Easy", "Medium", "Hard"]
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-groq_client = Groq(api_key=GROQ_API_KEY)
-MODEL = "llama-3.3-70b-versatile"
+cache = LLMCache(read_only=DRY_RUN)
+local_model = load_or_train(supabase)   # trained on first use, retrained when stale
+local_stats = {"local": 0, "deferred": 0}
+
+CHECKPOINT_PATH = os.environ.get(
+    "REPAIR_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "repair_checkpoint.json"),
+)   # base name; each --stream mode keeps its own file (see _checkpoint_path)
+CHECKPOINT_EVERY = 25   # rows between checkpoint writes inside a page
+
+
+def tags_valid(tags: dict) -> bool:
+    return tags.get("module") in VALID_MODULES and tags.get("domain") in VALID_DOMAINS and tags.get("difficulty") in VALID_DIFFS
 
 def repair_tags(row_id: str, question_text: str):
+    """
+    Returns {"module", "domain", "difficulty"}, or None. Tries the local
+    classifier first (confident predictions only), then the cache, then Groq:
+    the small model, escalated to the large one when in doubt (routing.py).
+    """
+    local_guess = None
+    if local_model is not None:
+        pred = local_model.predict(question_text)
+        if pred["confident"]:
+            local_stats["local"] += 1
+            return {k: pred[k] for k in ("module", "domain", "difficulty")}
+        local_stats["deferred"] += 1
+        local_guess = pred
+
+    cached = cache.get(CLASSIFY_CACHE_MODEL, PROMPT_VERSION, question_text)
+    if cached is not None:
+        return cached
+
     prompt = f"""You are a strict database evaluation engine.
 Below is a SAT question. You must categorize it strictly using the exact Allowed Enums below. DO NOT make up your own tags.
 
@@ -37,30 +71,91 @@ ALLOWED DIFFICULTIES:
 QUESTION TEXT:
 {question_text}
 
-Respond in plain JSON only (no markdown code blocks, no trailing commas):
+Respond in plain JSON only (no markdown code blocks, no trailing commas). "confidence" is your probability (0-1) that all three tags are right:
 {{
   "module": "<module>",
   "domain": "<domain>",
-  "difficulty": "<difficulty>"
+  "difficulty": "<difficulty>",
+  "confidence": <0-1>
 }}"""
 
-    for attempt in range(3):
-        try:
-            response = groq_client.chat.completions.create(
-                model=MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"}
-            )
-            raw = response.choices[0].message.content.strip()
-            data = json.loads(raw)
-            return data
-        except Exception as e:
-            if "rate_limit" in str(e).lower() or "429" in str(e):
-                time.sleep(2 * (attempt + 1))
-            else:
-                log.error(f"Groq API error on attempt {attempt+1}: {e}")
-    return None
+    def classify(model: str, tier: str, rows: list) -> dict:
+        response = groq_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        metrics.record_usage(response, prefix=f"repair_{tier}_")
+        raw = response.choices[0].message.content.strip()
+        data = parse_counted(raw)
+        if data is None:
+            raise ValueError(f"unparseable response: {raw[:80]!r}")
+        return {str(row_id): data}
+
+    # Errors were already retried with backoff by the client; classify_tiered logs what's left
+    results, _ = classify_tiered([{"id": row_id, "question_text": question_text}], classify,
+                                 local_guesses={str(row_id): local_guess} if local_guess else None)
+    data = results.get(str(row_id))
+    if data is None:
+        return None
+    # Invalid answers are cached briefly so the next sweep doesn't re-ask immediately
+    cache.put(CLASSIFY_CACHE_MODEL, PROMPT_VERSION, question_text, data, None if tags_valid(data) else LLM_CACHE_NEGATIVE_TTL)
+    return data
+
+def log_local_stats() -> None:
+    tiers = routing_summary(metrics.snapshot())
+    if tiers["requests"]["classify"]:
+        log.info(f"Model tiers: {tiers['requests']['classify']} {tiers['models']['classify']} requests, "
+                 f"{tiers['requests']['escalate']} escalated to {tiers['models']['escalate']} {tiers['escalated']}, "
+                 f"agreement {tiers['agreement']}")
+    total = local_stats["local"] + local_stats["deferred"]
+    if local_model is None:
+        log.info("Local classifier: no model (too few tagged rows to train on)")
+    elif total:
+        log.info(f"Local classifier: tagged {local_stats['local']}/{total} rows without an LLM call "
+                 f"({local_stats['local'] / total:.0%} avoided)")
+
+def repair_row(row: dict) -> bool:
+    """Re-classifies one row and writes the new tags. True if the row was fixed."""
+    rid = row["id"]
+    qtext = row["question_text"]
+
+    # Local model / cache / Groq re-evaluate the tags
+    new_tags = repair_tags(rid, qtext)
+    ok = False
+
+    if new_tags:
+        module = new_tags.get("module")
+        domain = new_tags.get("domain")
+        difficulty = new_tags.get("difficulty")
+
+        # Simple validation to ensure the tags match the strict enums exactly
+        if tags_valid(new_tags):
+            # Issue the UPDATE
+            update_payload = {
+                "module": module,
+                "domain": domain,
+                "difficulty": difficulty
+            }
+
+            try:
+                res = supabase.table("sat_question_bank").update(update_payload).eq("id", rid).execute()
+                if DRY_RUN:     # DryRunSupabase drops the update and returns no rows
+                    log.info(f" ✓ [dry-run] Would repair ID: {rid} -> {module} | {domain} | {difficulty}")
+                    ok = True
+                elif res.data:
+                    log.info(f" ✓ Repaired ID: {rid} -> {module} | {domain} | {difficulty}")
+                    ok = True
+                else:
+                    log.warning(f" ✗ Row {rid} no longer exists; nothing to repair")
+            except Exception as e:
+                log.error(f" ✗ Database update failed for ID {rid}: {e}")
+        else:
+            log.warning(f" ✗ Groq returned invalid tags for ID {rid}: {module} | {domain} | {difficulty}")
+    else:
+        log.error(f" ✗ Failed to get Groq response for ID {rid}")
+    return ok
 
 def main():
     log.info("Fetching all rows from sat_question_bank...")
@@ -79,50 +174,152 @@ def main():
     failed_count = 0
 
     for i, row in enumerate(rows):
-        rid = row["id"]
-        qtext = row["question_text"]
-        
-        log.info(f"[{i+1}/{len(rows)}] Evaluating Row ID: {rid}")
-        
-        # Call Groq to re-evaluate the tags
-        new_tags = repair_tags(rid, qtext)
-        
-        if new_tags:
-            module = new_tags.get("module")
-            domain = new_tags.get("domain")
-            difficulty = new_tags.get("difficulty")
-            
-            # Simple validation to ensure the tags match the strict enums exactly
-            valid_modules = ["Math", "Reading_Writing"]
-            valid_domains = ["Heart_of_Algebra", "Advanced_Math", "Problem_Solving_Data", "Geometry_Trigonometry", "Information_Ideas", "Craft_Structure", "Expression_Ideas", "Standard_English"]
-            valid_diffs = ["Easy", "Medium", "Hard"]
-            
-            if module in valid_modules and domain in valid_domains and difficulty in valid_diffs:
-                # Issue the UPDATE
-                update_payload = {
-                    "module": module,
-                    "domain": domain,
-                    "difficulty": difficulty
-                }
-                
-                try:
-                    supabase.table("sat_question_bank").update(update_payload).eq("id", rid).execute()
-                    log.info(f" ✓ Repaired ID: {rid} -> {module} | {domain} | {difficulty}")
-                    fixed_count += 1
-                except Exception as e:
-                    log.error(f" ✗ Database update failed for ID {rid}: {e}")
-                    failed_count += 1
-            else:
-                log.warning(f" ✗ Groq returned invalid tags for ID {rid}: {module} | {domain} | {difficulty}")
-                failed_count += 1
+        log.info(f"[{i+1}/{len(rows)}] Evaluating Row ID: {row['id']}")
+        if repair_row(row):
+            fixed_count += 1
         else:
-            log.error(f" ✗ Failed to get Groq response for ID {rid}")
             failed_count += 1
-            
-        # Groq strict rate limits buffer
-        time.sleep(1.5)
 
     log.info(f"=== REPAIR COMPLETE: Fixed {fixed_count}, Failed {failed_count} ===")
+    log.info(f"Classification cache: {cache.stats()}")
+    log_local_stats()
+    cache.close()
+
+# ─────────────────────────────────────────────────────────────
+# STREAMING REPAIR (keyset pagination + checkpoint/resume)
+# ─────────────────────────────────────────────────────────────
+def _quoted(values: list) -> str:
+    return ",".join(f'"{v}"' for v in values)
+
+
+# PostgREST filter selecting only rows whose tags fall outside the enums
+BROKEN_ROWS_FILTER = (
+    f"module.not.in.({_quoted(VALID_MODULES)}),"
+    f"domain.not.in.({_quoted(VALID_DOMAINS)}),"
+    f"difficulty.not.in.({_quoted(VALID_DIFFS)})"
+)
+
+
+def _checkpoint_path(mode: str) -> str:
+    root, ext = os.path.splitext(CHECKPOINT_PATH)
+    return f"{root}.{mode}{ext}"
+
+
+def _load_checkpoint(mode: str, row_filter: str, reset: bool) -> dict:
+    """
+    The saved position for this walk. A checkpoint is only resumed by the
+    same mode with the same server-side filter: resuming the broken-rows walk
+    from an --all-rows position (or vice versa) would skip rows.
+    """
+    fresh = {"mode": mode, "filter": row_filter, "last_id": None, "scanned": 0, "fixed": 0, "failed": 0}
+    if reset:
+        return fresh
+    try:
+        with open(_checkpoint_path(mode)) as f:
+            ckpt = json.load(f)
+        if ckpt.get("mode") != mode or ckpt.get("filter") != row_filter:
+            log.warning(f"Ignoring checkpoint written for another walk ({ckpt.get('mode')}, filter changed: "
+                        f"{ckpt.get('filter') != row_filter}) — starting over.")
+            return fresh
+        log.info(f"Resuming {mode} walk from checkpoint: after id {ckpt['last_id']} "
+                 f"({ckpt['scanned']} scanned, {ckpt['fixed']} fixed, {ckpt['failed']} failed)")
+        return ckpt
+    except (OSError, ValueError, KeyError):
+        return fresh
+
+
+def _save_checkpoint(ckpt: dict) -> None:
+    if DRY_RUN:     # nothing was written, so the real resume position must not move
+        return
+    path = _checkpoint_path(ckpt["mode"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(ckpt, f)
+    os.replace(tmp, path)
+
+
+def stream_repair(page_size: int = 500, all_rows: bool = False, reset: bool = False) -> None:
+    """
+    Walks sat_question_bank in id order, one keyset page at a time, so tables
+    of any size are covered without OFFSET scans or the 1000-row cap. Unless
+    `all_rows` is set, only rows with out-of-enum tags are fetched (filtered
+    server-side). Progress is checkpointed so an interrupted run resumes
+    where it stopped; each mode has its own checkpoint, removed once its
+    walk completes. A DRY_RUN walk reads the checkpoint but never saves or
+    removes it.
+    """
+    mode = "all" if all_rows else "broken"
+    ckpt = _load_checkpoint(mode, "" if all_rows else BROKEN_ROWS_FILTER, reset)
+
+    total = None
+    try:
+        q = supabase.table("sat_question_bank").select("id", count="exact").limit(1)
+        if not all_rows:
+            q = q.or_(BROKEN_ROWS_FILTER)
+        if ckpt["last_id"]:
+            q = q.gt("id", ckpt["last_id"])
+        total = q.execute().count
+        log.info(f"Streaming repair: {total} {'rows' if all_rows else 'broken rows'} left to process")
+    except Exception as e:
+        log.warning(f"Could not count remaining rows: {e}")
+
+    started = time.monotonic()
+    done_this_run = 0
+    try:
+        while True:
+            q = supabase.table("sat_question_bank") \
+                .select("id, module, domain, difficulty, question_text") \
+                .order("id").limit(page_size)
+            if not all_rows:
+                q = q.or_(BROKEN_ROWS_FILTER)
+            if ckpt["last_id"]:
+                q = q.gt("id", ckpt["last_id"])
+            rows = q.execute().data or []
+            if not rows:
+                break
+
+            for row in rows:
+                if repair_row(row):
+                    ckpt["fixed"] += 1
+                else:
+                    ckpt["failed"] += 1
+                ckpt["scanned"] += 1
+                ckpt["last_id"] = row["id"]
+                done_this_run += 1
+                if done_this_run % CHECKPOINT_EVERY == 0:
+                    _save_checkpoint(ckpt)
+
+            _save_checkpoint(ckpt)
+            elapsed = time.monotonic() - started
+            rate = done_this_run / max(elapsed, 1e-9)
+            eta = f", ETA {(total - done_this_run) / rate / 60:.1f} min" if total and rate else ""
+            log.info(f"Progress: {done_this_run}{f'/{total}' if total is not None else ''} this run "
+                     f"({rate:.2f} rows/s{eta}) — fixed {ckpt['fixed']}, failed {ckpt['failed']}")
+            if len(rows) < page_size:
+                break
+    finally:
+        _save_checkpoint(ckpt)
+
+    if not DRY_RUN and os.path.exists(_checkpoint_path(mode)):
+        os.remove(_checkpoint_path(mode))
+    log.info(f"=== STREAMING REPAIR COMPLETE: scanned {ckpt['scanned']}, "
+             f"Fixed {ckpt['fixed']}, Failed {ckpt['failed']} ===")
+    log.info(f"Classification cache: {cache.stats()}")
+    log_local_stats()
+    cache.close()
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Re-classify sat_question_bank tags via Groq.")
+    parser.add_argument("--stream", action="store_true",
+                        help="keyset-paginated repair of the whole table with checkpoint/resume")
+    parser.add_argument("--all-rows", action="store_true",
+                        help="with --stream: re-classify every row, not only rows with out-of-enum tags")
+    parser.add_argument("--reset", action="store_true", help="with --stream: ignore any saved checkpoint")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.stream:
+        stream_repair(page_size=args.page_size, all_rows=args.all_rows, reset=args.reset)
+    else:
+        main()
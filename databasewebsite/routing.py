@@ -0,0 +1,216 @@
+"""
+routing.py — Model tiers for Groq calls
+=========================================================
+Each Groq task goes to a model picked for it, instead of one MODEL for everything:
+
+  generate   GROQ_MODEL_GENERATE  (llama-3.3-70b-versatile)  question writing, re-asks
+  classify   GROQ_MODEL_CLASSIFY  (llama-3.1-8b-instant)     first pass of every tag classification
+  escalate   GROQ_MODEL_ESCALATE  (the generate model)       second opinion on doubtful classifications
+
+classify_tiered() runs the small model first and escalates a result when it is
+
+  invalid         outside the enums,
+  inconsistent    a domain from the other module,
+  low_confidence  self-rated below CLASSIFY_ESCALATE_BELOW, or
+  disputed        the local classifier names another domain with a calibrated
+                  confidence of at least ROUTING_DISPUTE_MIN. The guesses it
+                  hands over are the ones it wasn't sure enough to use, so
+                  most of them are weak; counting every disagreement would
+                  send most repairs to the 70B model, which is the quota
+                  this routing exists to save.
+
+ROUTING_AUDIT_RATE of the results that pass are escalated anyway, so agreement
+between the tiers is measured on an unbiased sample and not only on the
+doubtful rows. The escalated answer wins whenever it is valid.
+
+Groq's limits are per model, so each model has its own token bucket
+(limiter_for). The classify bucket is GROQ_RPM_CLASSIFY, and the generate
+model keeps GROQ_RPM. Classification therefore doesn't spend the
+generation model's per-minute or daily quota; only escalations do.
+
+Reported per tier: `repair_<tier>_requests` / `_prompt_tokens` /
+`_completion_tokens`, `classify_<tier>` stage latency, `escalated_<reason>`
+and `tier_agree` / `tier_disagree` (see routing_summary()).
+"""
+
+import logging
+import os
+import random
+import threading
+from typing import Callable, Optional
+
+from metrics import metrics
+from ratelimit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+MODEL_GENERATE = os.environ.get("GROQ_MODEL_GENERATE", "llama-3.3-70b-versatile")
+MODEL_CLASSIFY = os.environ.get("GROQ_MODEL_CLASSIFY", "llama-3.1-8b-instant")
+MODEL_ESCALATE = os.environ.get("GROQ_MODEL_ESCALATE", MODEL_GENERATE)
+CLASSIFY_CACHE_MODEL = f"{MODEL_CLASSIFY}+{MODEL_ESCALATE}"    # LLMCache key: either model changing invalidates
+
+GROQ_RPM = float(os.environ.get("GROQ_RPM", "28"))                      # generate / escalate model
+GROQ_RPM_CLASSIFY = float(os.environ.get("GROQ_RPM_CLASSIFY", "28"))    # classify model (free tier: 30 rpm)
+CLASSIFY_ESCALATE_BELOW = float(os.environ.get("CLASSIFY_ESCALATE_BELOW", "0.7"))
+ROUTING_AUDIT_RATE = float(os.environ.get("ROUTING_AUDIT_RATE", "0.05"))
+ROUTING_DISPUTE_MIN = float(os.environ.get("ROUTING_DISPUTE_MIN", "0.75"))   # local confidence needed to dispute
+
+TAG_KEYS = ("module", "domain", "difficulty")
+DOMAINS_BY_MODULE = {
+    "Math": ("Heart_of_Algebra", "Advanced_Math", "Problem_Solving_Data", "Geometry_Trigonometry"),
+    "Reading_Writing": ("Information_Ideas", "Craft_Structure", "Expression_Ideas", "Standard_English"),
+}
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+_limiters: dict = {}
+_limiters_lock = threading.Lock()
+
+# ─────────────────────────────────────────────────────────────
+# RATE BUDGETS
+# ─────────────────────────────────────────────────────────────
+def model_rpm(model: str) -> float:
+    return GROQ_RPM_CLASSIFY if model == MODEL_CLASSIFY and model != MODEL_GENERATE else GROQ_RPM
+
+
+def limiter_for(model: str, generation_limiter: Optional[TokenBucket] = None) -> TokenBucket:
+    """
+    The process-wide token bucket for `model`. Pass the caller's generation
+    bucket so escalations share it with harvesting instead of adding a second
+    budget for the same model.
+    """
+    if generation_limiter is not None and model == MODEL_GENERATE:
+        return generation_limiter
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = TokenBucket(model_rpm(model))
+        return _limiters[model]
+
+
+def reset_limiters() -> None:
+    """Drops the buckets so they are rebuilt from the (possibly changed) RPM settings."""
+    with _limiters_lock:
+        _limiters.clear()
+
+# ─────────────────────────────────────────────────────────────
+# ESCALATION
+# ─────────────────────────────────────────────────────────────
+def clean_tags(tags: Optional[dict]) -> Optional[dict]:
+    return {k: tags.get(k) for k in TAG_KEYS} if isinstance(tags, dict) else None
+
+
+def tags_valid(tags: Optional[dict]) -> bool:
+    return bool(tags) and tags.get("domain") in DOMAINS_BY_MODULE.get(tags.get("module"), ()) \
+        and tags.get("difficulty") in DIFFICULTIES
+
+
+def escalation_reason(tags: Optional[dict], local_guess: Optional[dict] = None) -> Optional[str]:
+    """Why a small-model classification should get a second opinion, or None if it stands."""
+    if not tags:
+        return "invalid"
+    module, domain = tags.get("module"), tags.get("domain")
+    if module not in DOMAINS_BY_MODULE or tags.get("difficulty") not in DIFFICULTIES \
+            or not any(domain in domains for domains in DOMAINS_BY_MODULE.values()):
+        return "invalid"
+    if domain not in DOMAINS_BY_MODULE[module]:
+        return "inconsistent"
+    try:
+        confidence = float(tags.get("confidence", 1.0))
+    except (TypeError, ValueError):
+        confidence = 0.0
+    if confidence < CLASSIFY_ESCALATE_BELOW:
+        return "low_confidence"
+    if local_guess and local_guess.get("domain") and local_guess["domain"] != domain:
+        try:
+            local_confidence = float(local_guess.get("confidence", 0.0))
+        except (TypeError, ValueError):
+            local_confidence = 0.0
+        if local_confidence >= ROUTING_DISPUTE_MIN:
+            return "disputed"
+    return None
+
+
+def _chunks(rows: list, size: int):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def classify_tiered(rows: list, classify: Callable[[str, str, list], dict], batch_size: int = 1,
+                    generation_limiter: Optional[TokenBucket] = None, local_guesses: Optional[dict] = None,
+                    rng: Optional[random.Random] = None) -> tuple:
+    """
+    Tags `rows` ({"id", "question_text", …}) with the small model, escalating
+    doubtful results to the large one. `classify(model, tier, chunk)` makes one
+    request and returns {id: tags}; `local_guesses` maps id -> the local
+    classifier's (unconfident) prediction. Returns ({id: tags}, requests made
+    on the generation model), the latter to be spent from its daily quota.
+    """
+    rng = rng or random.Random()
+    local_guesses = local_guesses or {}
+    generation_requests = 0
+
+    def run_tier(model: str, tier: str, todo: list) -> dict:
+        nonlocal generation_requests
+        limiter = limiter_for(model, generation_limiter)
+        out: dict = {}
+        for chunk in _chunks(todo, batch_size):
+            metrics.observe("repair_rate_wait", limiter.acquire())
+            generation_requests += model == MODEL_GENERATE
+            try:
+                with metrics.timer(f"classify_{tier}"):
+                    out.update(classify(model, tier, chunk))
+            except Exception as e:
+                metrics.inc(f"repair_{tier}_errors")
+                log.error(f"  ✗ {tier} classification ({model}) failed for {len(chunk)} rows: {e}")
+        return out
+
+    first = run_tier(MODEL_CLASSIFY, "classify", rows)
+    if MODEL_CLASSIFY == MODEL_ESCALATE:
+        return {rid: clean_tags(t) for rid, t in first.items()}, generation_requests
+
+    final: dict = {}
+    second_opinion, audited = [], set()
+    for row in rows:
+        rid = str(row["id"])
+        tags = first.get(rid)
+        reason = escalation_reason(tags, local_guesses.get(rid))
+        if reason:
+            metrics.inc(f"escalated_{reason}")
+            second_opinion.append(row)
+        elif rng.random() < ROUTING_AUDIT_RATE:
+            metrics.inc("escalated_audit")
+            audited.add(rid)
+            second_opinion.append(row)
+        if tags is not None:
+            final[rid] = clean_tags(tags)
+
+    second = run_tier(MODEL_ESCALATE, "escalate", second_opinion) if second_opinion else {}
+    for row in second_opinion:
+        rid = str(row["id"])
+        tags = clean_tags(second.get(rid))
+        if tags is None:
+            continue
+        small = final.get(rid)
+        if tags_valid(small) and tags_valid(tags):
+            metrics.inc("tier_agree" if small == tags else "tier_disagree")
+            if rid in audited:
+                metrics.inc("tier_audit_agree" if small == tags else "tier_audit_disagree")
+        if tags_valid(tags) or not tags_valid(small):
+            final[rid] = tags
+    return final, generation_requests
+
+
+def routing_summary(counters: dict) -> dict:
+    """Tier usage and agreement for the run report."""
+    def rate(hit: str, miss: str) -> Optional[float]:
+        n = counters.get(hit, 0) + counters.get(miss, 0)
+        return round(counters.get(hit, 0) / n, 3) if n else None
+
+    return {
+        "models": {"classify": MODEL_CLASSIFY, "escalate": MODEL_ESCALATE},
+        "requests": {tier: counters.get(f"repair_{tier}_requests", 0) for tier in ("classify", "escalate")},
+        "tokens": {tier: counters.get(f"repair_{tier}_prompt_tokens", 0) + counters.get(f"repair_{tier}_completion_tokens", 0)
+                   for tier in ("classify", "escalate")},
+        "escalated": {k[len("escalated_"):]: v for k, v in sorted(counters.items()) if k.startswith("escalated_")},
+        "agreement": rate("tier_agree", "tier_disagree"),           # over every row both tiers answered
+        "audit_agreement": rate("tier_audit_agree", "tier_audit_disagree"),   # unbiased sample
+    }
@@ -0,0 +1,224 @@
+"""
+salvage.py — Recover malformed Groq generations instead of discarding them
+=========================================================
+Two layers, both reported through metrics.py:
+
+  1. Tolerant parsing (free). parse_lenient() accepts what json.loads
+     rejects but is still unambiguous: markdown code fences, prose around
+     the object, trailing commas. salvage_items() pulls every complete
+     question out of a batch response that was cut off mid-array (e.g. at
+     max_tokens), so one truncated tail doesn't sink its neighbours.
+  2. Targeted re-ask (one short request). When a question is fine except
+     for a single repairable field (options or correct_answer), reask_field()
+     asks for just that field with a small max_tokens budget instead of
+     regenerating the whole 1k-token question.
+
+JSON_SALVAGE=0 turns both layers off (strict json.loads, no re-ask) for A/B runs.
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Optional
+
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+JSON_SALVAGE = os.environ.get("JSON_SALVAGE", "1") != "0"
+REASK_MAX_TOKENS = int(os.environ.get("REASK_MAX_TOKENS", "300"))
+REASKABLE_FIELDS = ("options", "correct_answer")
+
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_decoder = json.JSONDecoder()
+
+# ─────────────────────────────────────────────────────────────
+# TOLERANT PARSING
+# ─────────────────────────────────────────────────────────────
+def _first_object(text: str) -> Optional[str]:
+    """The first balanced {...} in `text` (string- and escape-aware), or None."""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth, in_str, escaped = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def parse_lenient(raw: Optional[str]) -> tuple:
+    """
+    Returns (obj, how): obj is the parsed dict or None; how is one of
+    "strict", "fenced", "extracted", "trailing_commas" or "failed".
+    """
+    if not raw:
+        return None, "failed"
+    try:
+        obj = json.loads(raw)
+        return (obj, "strict") if isinstance(obj, dict) else (None, "failed")
+    except json.JSONDecodeError:
+        if not JSON_SALVAGE:
+            return None, "failed"
+    unfenced = _FENCE_RE.sub("", raw)
+    candidates = [(unfenced, "fenced")]
+    block = _first_object(unfenced)
+    if block:
+        candidates += [(block, "extracted"), (_TRAILING_COMMA_RE.sub(r"\1", block), "trailing_commas")]
+    for text, how in candidates:
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(obj, dict):
+            return obj, how
+    return None, "failed"
+
+
+def salvage_items(raw: Optional[str], key: str = "questions") -> list:
+    """Every complete object in the `key` array of a (possibly truncated) response."""
+    if not raw or not JSON_SALVAGE:
+        return []
+    m = re.search(r'"%s"\s*:\s*\[' % re.escape(key), raw)
+    if not m:
+        return []
+    items, pos = [], m.end()
+    while True:
+        while pos < len(raw) and raw[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(raw) or raw[pos] != "{":
+            break
+        try:
+            item, pos = _decoder.raw_decode(raw, pos)
+        except json.JSONDecodeError:
+            break
+        items.append(item)
+    return items
+
+
+def parse_counted(raw: Optional[str]) -> Optional[dict]:
+    """parse_lenient() plus salvage accounting: every response that needed help is counted."""
+    obj, how = parse_lenient(raw)
+    if how != "strict":
+        metrics.inc("salvage_parse_attempts")
+        if obj is not None:
+            metrics.inc("salvage_parse_recovered")
+            metrics.inc(f"salvage_parse_{how}")
+    return obj
+
+# ─────────────────────────────────────────────────────────────
+# TARGETED RE-ASK
+# ─────────────────────────────────────────────────────────────
+def invalid_fields(data: dict, is_spr: bool) -> list:
+    """Fields that would make validate() reject an otherwise well-formed question."""
+    if not isinstance(data, dict):
+        return ["*"]
+    bad = []
+    if not data.get("question_text"):
+        bad.append("question_text")
+    if not data.get("correct_answer"):
+        bad.append("correct_answer")
+    if not bool(data.get("is_spr", is_spr)):
+        opts = data.get("options")
+        if not isinstance(opts, list) or len(opts) != 4:
+            bad.append("options")
+        elif data.get("correct_answer") and not answer_in_options(data["correct_answer"], opts):
+            bad.append("correct_answer")
+    return bad
+
+
+def answer_in_options(answer, options: list) -> bool:
+    """A multiple-choice answer must be the exact text of one option."""
+    return str(answer).strip() in {str(o).strip() for o in options}
+
+
+_REQUIREMENTS = {
+    "options": '"options" must be a list of exactly 4 distinct, plausible answer choices, '
+               'one of which is exactly the correct answer.',
+    "correct_answer": '"correct_answer" must be the exact text of the correct option '
+                      '(or the numeric value for a grid-in question).',
+}
+
+
+def build_reask_prompt(data: dict, field: str) -> str:
+    shown = {k: v for k, v in data.items() if k != field and k in
+             ("module", "domain", "difficulty", "is_spr", "question_text", "options", "correct_answer")}
+    example = '["<A>", "<B>", "<C>", "<D>"]' if field == "options" else '"<answer>"'
+    return f"""The Digital SAT question below is complete except for one invalid field.
+{_REQUIREMENTS[field]}
+
+QUESTION:
+{json.dumps(shown, ensure_ascii=False)}
+
+Respond with ONLY a JSON object containing that single field:
+{{"{field}": {example}}}"""
+
+
+def reask_field(client, model: str, data: dict, field: str) -> bool:
+    """
+    Asks for just `field` and patches it into `data` in place. True if the
+    returned value is usable. Costs one short Groq request.
+    """
+    metrics.inc("reask_attempts")
+    metrics.inc(f"reask_{field}")
+    try:
+        with metrics.timer("groq_reask"):
+            response = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": build_reask_prompt(data, field)}],
+                response_format={"type": "json_object"},
+                temperature=0.2,
+                max_tokens=REASK_MAX_TOKENS,
+            )
+        metrics.record_usage(response)
+        value = (parse_counted(response.choices[0].message.content) or {}).get(field)
+    except Exception as e:
+        log.warning(f"Re-ask for {field} failed: {e}")
+        return False
+    if field == "options":
+        # The answer is kept as is, so the new options must still contain it
+        ok = isinstance(value, list) and len(value) == 4 and len(set(map(str, value))) == 4 \
+            and answer_in_options(data.get("correct_answer", ""), value)
+    else:
+        ok = isinstance(value, (str, int, float)) and str(value).strip() != ""
+        value = str(value).strip() if ok else value
+        options = data.get("options")
+        if ok and not data.get("is_spr") and isinstance(options, list):
+            ok = answer_in_options(value, options)
+    if ok:
+        data[field] = value
+        metrics.inc("reask_recovered")
+    else:
+        metrics.inc(f"reask_{field}_rejected")
+    return ok
+
+
+def recovery_summary(counters: dict) -> dict:
+    """Recovery rates for the run report."""
+    def rate(num: str, den: str):
+        return round(counters.get(num, 0) / counters[den], 3) if counters.get(den) else None
+    return {
+        "parse_attempts": counters.get("salvage_parse_attempts", 0),
+        "parse_recovered": counters.get("salvage_parse_recovered", 0),
+        "parse_recovery_rate": rate("salvage_parse_recovered", "salvage_parse_attempts"),
+        "items_salvaged": counters.get("salvage_items_recovered", 0),
+        "reask_attempts": counters.get("reask_attempts", 0),
+        "reask_recovered": counters.get("reask_recovered", 0),
+        "reask_recovery_rate": rate("reask_recovered", "reask_attempts"),
+    }
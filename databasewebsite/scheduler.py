@@ -0,0 +1,194 @@
+"""
+scheduler.py — Quota-aware bucket scheduler for the harvester
+=========================================================
+Decides how many Groq generation requests each (module, domain, difficulty,
+is_spr) bucket gets this run.
+
+  • Deficit  = max(0, TARGET_PER_BUCKET - current count).
+  • Each bucket's acceptance rate (accepted / requested) is tracked across
+    runs, with every rejection reason counted: invalid generations,
+    exact duplicates, near-duplicates and failed inserts. Old runs decay.
+  • Requests are apportioned exactly (largest-remainder / Hamilton) with
+    weight deficit / acceptance, so *expected accepted questions* are
+    proportional to the gap, and no bucket is given more requests than it
+    needs to close its gap.
+  • The run's total is paced against the remaining daily Groq quota spread
+    over the cron runs left in the UTC day.
+
+State lives in a small JSON file under .cache/ (persisted by the workflow).
+"""
+
+import datetime as dt
+import json
+import logging
+import math
+import os
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+DAILY_REQUEST_QUOTA = int(os.environ.get("GROQ_DAILY_REQUEST_QUOTA", "14400"))
+RUN_INTERVAL_MINUTES = int(os.environ.get("RUN_INTERVAL_MINUTES", "15"))
+SCHEDULER_STATE_PATH = os.environ.get(
+    "SCHEDULER_STATE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "scheduler_state.json"),
+)
+STATS_DECAY = 0.9              # per-run decay of acceptance history
+PRIOR_ACCEPT = 0.8             # Beta prior for buckets with little history…
+PRIOR_WEIGHT = 5.0             # …worth this many pseudo-requests
+MIN_ACCEPT = 0.05              # floor so a bad streak can't demand infinite requests
+
+OUTCOMES = ("accepted", "invalid", "duplicate", "near_duplicate", "insert_failed")
+
+
+def bucket_key(bucket: tuple) -> str:
+    """Flat string key of a (module, domain, difficulty, is_spr) bucket, shared with the run report."""
+    module, domain, difficulty, is_spr = bucket
+    return f"{module}|{domain}|{difficulty}|{int(bool(is_spr))}"
+
+# ─────────────────────────────────────────────────────────────
+# PERSISTENT STATE
+# ─────────────────────────────────────────────────────────────
+class SchedulerState:
+    def __init__(self, data: Optional[dict] = None):
+        data = data or {}
+        self.buckets: dict = data.get("buckets", {})
+        self.day: str = data.get("day", "")
+        self.requests_today: int = data.get("requests_today", 0)
+
+    @classmethod
+    def load(cls, path: str = SCHEDULER_STATE_PATH) -> "SchedulerState":
+        try:
+            with open(path) as f:
+                state = cls(json.load(f))
+        except (OSError, ValueError):
+            state = cls()
+        state.start_run()
+        return state
+
+    def save(self, path: str = SCHEDULER_STATE_PATH) -> None:
+        self._write({"buckets": self.buckets, "day": self.day, "requests_today": self.requests_today}, path)
+
+    def save_spend(self, path: str = SCHEDULER_STATE_PATH) -> None:
+        """
+        Dry runs: persists today's quota spend (the Groq calls were real) but
+        leaves the acceptance history on disk as it was, undecayed and without
+        this run's outcomes.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.update(day=self.day, requests_today=self.requests_today)
+        self._write(data, path)
+
+    @staticmethod
+    def _write(data: dict, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, path)
+
+    def start_run(self) -> None:
+        """Rolls the quota day and decays acceptance history by one run (cron: once per process)."""
+        self._roll_day()
+        self._decay()
+
+    def _roll_day(self) -> None:
+        today = dt.datetime.now(dt.timezone.utc).date().isoformat()
+        if self.day != today:
+            self.day = today
+            self.requests_today = 0
+
+    def _decay(self) -> None:
+        for stats in self.buckets.values():
+            for k in stats:
+                stats[k] *= STATS_DECAY
+
+    def record(self, bucket: tuple, outcome: str) -> None:
+        """Records how one requested question for `bucket` ended (quota is counted via spend())."""
+        if outcome not in OUTCOMES:
+            raise ValueError(f"unknown outcome: {outcome}")
+        stats = self.buckets.setdefault(bucket_key(bucket), {o: 0.0 for o in OUTCOMES})
+        stats[outcome] = stats.get(outcome, 0.0) + 1
+
+    def spend(self, n: int = 1) -> None:
+        """Counts Groq requests against today's quota."""
+        self.requests_today += n
+
+    def acceptance(self, bucket: tuple) -> float:
+        stats = self.buckets.get(bucket_key(bucket), {})
+        accepted = stats.get("accepted", 0.0)
+        total = sum(stats.values())
+        rate = (accepted + PRIOR_ACCEPT * PRIOR_WEIGHT) / (total + PRIOR_WEIGHT)
+        return max(MIN_ACCEPT, rate)
+
+    def remaining_quota(self) -> int:
+        return max(0, DAILY_REQUEST_QUOTA - self.requests_today)
+
+# ─────────────────────────────────────────────────────────────
+# APPORTIONMENT
+# ─────────────────────────────────────────────────────────────
+def largest_remainder(weights: dict, total: int, caps: Optional[dict] = None) -> dict:
+    """
+    Hamilton apportionment of `total` integer seats by `weights`, honouring
+    optional per-key `caps`. Seats freed by capped keys are re-apportioned
+    among the rest. Sum of the result is min(total, sum(caps)).
+    """
+    alloc = {k: 0 for k in weights}
+    open_keys = [k for k, w in weights.items() if w > 0 and (caps is None or caps.get(k, 0) > 0)]
+    left = total
+    while left > 0 and open_keys:
+        w_sum = sum(weights[k] for k in open_keys)
+        quotas = {k: left * weights[k] / w_sum for k in open_keys}
+        share = {k: math.floor(q) for k, q in quotas.items()}
+        rest = left - sum(share.values())
+        for k in sorted(open_keys, key=lambda k: quotas[k] - share[k], reverse=True)[:rest]:
+            share[k] += 1
+        left = 0
+        still_open = []
+        for k in open_keys:
+            room = caps[k] - alloc[k] if caps is not None else share[k]
+            take = min(share[k], room)
+            alloc[k] += take
+            left += share[k] - take
+            if caps is None or alloc[k] < caps[k]:
+                still_open.append(k)
+        if left and len(still_open) == len(open_keys):
+            break
+        open_keys = still_open
+    return alloc
+
+
+def run_budget(state: SchedulerState, max_per_run: int, now: Optional[dt.datetime] = None,
+               interval_minutes: float = RUN_INTERVAL_MINUTES) -> int:
+    """
+    Requests this run may spend: remaining daily quota spread over the runs
+    left today, one run every `interval_minutes`.
+    """
+    now = now or dt.datetime.now(dt.timezone.utc)
+    midnight = (now + dt.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    runs_left = max(1, math.ceil((midnight - now).total_seconds() / (interval_minutes * 60)))
+    return min(max_per_run, math.ceil(state.remaining_quota() / runs_left))
+
+
+def plan_queue(inventory: dict, buckets: list, target: int, budget: int, state: SchedulerState) -> tuple:
+    """
+    Apportions `budget` question slots. Returns (queue, plan) where queue is a
+    list of buckets (one per requested question) and plan maps
+    bucket -> (actual, deficit, acceptance, slots).
+    """
+    deficits = {b: max(0, target - inventory.get(b, 0)) for b in buckets}
+    if not any(deficits.values()):
+        # Every bucket is at target: keep growing evenly rather than idling.
+        deficits = {b: 1 for b in buckets}
+    accept = {b: state.acceptance(b) for b in buckets}
+    weights = {b: deficits[b] / accept[b] for b in buckets}
+    caps = {b: math.ceil(deficits[b] / accept[b]) for b in buckets}
+    alloc = largest_remainder(weights, budget, caps)
+
+    plan = {b: (inventory.get(b, 0), deficits[b], accept[b], alloc[b]) for b in buckets}
+    queue = [b for b in buckets for _ in range(alloc[b])]
+    return queue, plan
@@ -53,12 +53,45 @@ BEGIN
     END IF;
 END $$;
 
+-- Add content_hash for batched dedup (idempotent). sha256 of the normalized
+-- question_text. dedup.normalize_text() in the harvester is canonical; the
+-- backfill below mirrors it with the same explicit ASCII whitespace class
+-- (not \s, whose Unicode coverage differs from Python's str.split()).
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'sat_question_bank' AND column_name = 'content_hash') THEN
+        ALTER TABLE sat_question_bank
+            ADD COLUMN content_hash TEXT;
+    END IF;
+END $$;
+
+-- Backfill legacy rows. Only the oldest row of any duplicate group gets the
+-- hash so the UNIQUE index below can still be built; later copies stay NULL.
+WITH ranked AS (
+    SELECT id,
+           encode(sha256(convert_to(lower(btrim(regexp_replace(question_text, '[ \t\n\r\f\v]+', ' ', 'g'))), 'UTF8')), 'hex') AS h,
+           ROW_NUMBER() OVER (
+               PARTITION BY lower(btrim(regexp_replace(question_text, '[ \t\n\r\f\v]+', ' ', 'g')))
+               ORDER BY created_at, id
+           ) AS rn
+    FROM sat_question_bank
+    WHERE content_hash IS NULL
+)
+UPDATE sat_question_bank q
+   SET content_hash = ranked.h
+  FROM ranked
+ WHERE q.id = ranked.id
+   AND ranked.rn = 1
+   AND NOT EXISTS (SELECT 1 FROM sat_question_bank x WHERE x.content_hash = ranked.h);
+
 -- ── 3. Indexes ────────────────────────────────────────────────
 CREATE INDEX IF NOT EXISTS idx_sat_module      ON sat_question_bank(module);
 CREATE INDEX IF NOT EXISTS idx_sat_domain      ON sat_question_bank(domain);
 CREATE INDEX IF NOT EXISTS idx_sat_difficulty  ON sat_question_bank(difficulty);
 CREATE INDEX IF NOT EXISTS idx_sat_is_spr      ON sat_question_bank(is_spr);
 CREATE INDEX IF NOT EXISTS idx_sat_domain_diff ON sat_question_bank(domain, difficulty);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_sat_content_hash ON sat_question_bank(content_hash);
 
 -- ── 4. Row Level Security ─────────────────────────────────────
 ALTER TABLE sat_question_bank ENABLE ROW LEVEL SECURITY;
@@ -130,3 +163,153 @@ CREATE OR REPLACE VIEW view_inventory AS
     FROM sat_question_bank
     GROUP BY module, domain, difficulty
     ORDER BY module, domain, difficulty;
+
+-- ── 7. Per-bucket inventory (module × domain × difficulty × is_spr) ──
+-- build_target_queue reads this instead of scanning every row, so the
+-- harvester's startup cost stays constant as the bank grows. At most 26
+-- rows come back, well under the PostgREST row cap.
+CREATE OR REPLACE VIEW view_bucket_inventory AS
+    SELECT
+        module,
+        domain,
+        difficulty,
+        is_spr,
+        COUNT(*) AS question_count
+    FROM sat_question_bank
+    GROUP BY module, domain, difficulty, is_spr;
+
+CREATE INDEX IF NOT EXISTS idx_sat_bucket ON sat_question_bank(module, domain, difficulty, is_spr);
+
+-- ── 8. Source passages (referenced by harvested rows) ─────────
+-- The harvester used to copy a 3 KB raw JSON/HTML blob into
+-- raw_original_text on every row. Passages are now stored once here and
+-- referenced via sat_question_bank.source_ref.
+CREATE TABLE IF NOT EXISTS source_passages (
+    id              TEXT PRIMARY KEY,                 -- "<source>:<sha1 prefix>"
+    source          TEXT NOT NULL,                    -- crossref | openlibrary | gutendex
+    passage_text    TEXT NOT NULL,
+    created_at      TIMESTAMPTZ DEFAULT now()
+);
+
+ALTER TABLE source_passages ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow public read access" ON source_passages;
+CREATE POLICY "Allow public read access" ON source_passages
+    FOR SELECT TO anon, authenticated USING (true);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'sat_question_bank' AND column_name = 'source_ref') THEN
+        ALTER TABLE sat_question_bank
+            ADD COLUMN source_ref TEXT;
+    END IF;
+END $$;
+
+-- ── 9. Bulk tag repair RPC ────────────────────────────────────
+-- Called by scraper.auto_repair_untagged with one JSON array of
+-- {id, module, domain, difficulty, raw_original_text?}. Each row is updated
+-- in its own sub-transaction so one CHECK violation doesn't roll back the
+-- rest; failed ids are returned to the caller, and so are ids that matched
+-- no row (deleted since they were fetched) instead of counting as updated.
+--
+-- There is no UPDATE policy on sat_question_bank for anon / authenticated,
+-- so the function runs as its owner (SECURITY DEFINER) with a fixed
+-- search_path, and only service_role may call it.
+CREATE OR REPLACE FUNCTION bulk_update_tags(payload JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+    r       RECORD;
+    updated INTEGER := 0;
+    failed  JSONB := '[]'::jsonb;
+    missing JSONB := '[]'::jsonb;
+BEGIN
+    FOR r IN
+        SELECT * FROM jsonb_to_recordset(payload)
+            AS p(id UUID, module TEXT, domain TEXT, difficulty TEXT, raw_original_text TEXT)
+    LOOP
+        BEGIN
+            UPDATE sat_question_bank
+               SET module            = r.module,
+                   domain            = r.domain,
+                   difficulty        = r.difficulty,
+                   raw_original_text = COALESCE(raw_original_text, r.raw_original_text)
+             WHERE id = r.id;
+            IF FOUND THEN
+                updated := updated + 1;
+            ELSE
+                missing := missing || to_jsonb(r.id::text);
+            END IF;
+        EXCEPTION WHEN check_violation OR not_null_violation THEN
+            failed := failed || to_jsonb(r.id::text);
+        END;
+    END LOOP;
+    RETURN jsonb_build_object('updated', updated, 'failed', failed, 'missing', missing);
+END $$;
+
+REVOKE ALL ON FUNCTION bulk_update_tags(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION bulk_update_tags(JSONB) TO service_role;
+
+-- ── 10. Pre-assembled test forms (assemble_forms.py) ──────────
+-- One row per module form: a compact JSON array of the items the session
+-- page renders. A family is one section's Module 1 + both Module 2 forms
+-- (no shared items). Starting a test is one fetch on idx_forms_pick:
+--   section = ? AND path = 'm1' AND active AND pick >= random()
+--   ORDER BY pick LIMIT 1
+-- and Module 2 is fetched by (family, path).
+CREATE TABLE IF NOT EXISTS sat_test_forms (
+    id          TEXT PRIMARY KEY,                 -- "<batch>-<section>-<n>-<path>"
+    batch       TEXT NOT NULL,                    -- UTC timestamp of the assembly run
+    section     TEXT NOT NULL CHECK (section IN ('rw', 'math')),
+    path        TEXT NOT NULL CHECK (path IN ('m1', 'm2_higher', 'm2_lower')),
+    family      TEXT NOT NULL,
+    pick        DOUBLE PRECISION NOT NULL,        -- uniform [0, 1): random form via the index
+    active      BOOLEAN NOT NULL DEFAULT FALSE,
+    items       JSONB NOT NULL,
+    blueprint   JSONB,                            -- target vs actual difficulty mix
+    created_at  TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_forms_pick   ON sat_test_forms(section, path, active, pick);
+CREATE INDEX IF NOT EXISTS idx_forms_family ON sat_test_forms(family, path);
+
+ALTER TABLE sat_test_forms ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow public read access" ON sat_test_forms;
+CREATE POLICY "Allow public read access" ON sat_test_forms
+    FOR SELECT TO anon, authenticated USING (true);
+
+-- ── 11. Change tracking for the incremental export (export_bank.py) ──
+-- created_at never moves, so a repaired row would be missed by a
+-- created_at watermark. updated_at starts at created_at and is bumped by
+-- trigger on every UPDATE; the export pages on (updated_at, id).
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'sat_question_bank' AND column_name = 'updated_at') THEN
+        ALTER TABLE sat_question_bank
+            ADD COLUMN updated_at TIMESTAMPTZ;
+        UPDATE sat_question_bank SET updated_at = COALESCE(created_at, now());
+        ALTER TABLE sat_question_bank
+            ALTER COLUMN updated_at SET DEFAULT now(),
+            ALTER COLUMN updated_at SET NOT NULL;
+    END IF;
+END $$;
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_sat_touch_updated_at ON sat_question_bank;
+CREATE TRIGGER trg_sat_touch_updated_at
+    BEFORE UPDATE ON sat_question_bank
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_sat_updated ON sat_question_bank(updated_at, id);
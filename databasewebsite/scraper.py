@@ -5,20 +5,64 @@ Runs every 15 min via GitHub Actions.
 Uses Groq's free API (Llama 3.3-70b) — 14,400 req/day free, no credit card.
 
 Per run:
-  1. Reads sat_question_bank to compute per-bucket deficits (self-balancing).
-  2. Builds a 25-question queue weighted toward thinnest domain/difficulty buckets.
+  1. Reads per-bucket counts from view_bucket_inventory to compute deficits (self-balancing).
+  2. Builds a request queue (scheduler.py) apportioned to bucket deficits,
+     observed acceptance rates and the remaining daily Groq quota.
   3. Calls Groq API (llama-3.3-70b-versatile) to synthesize + entity-swap each question.
-  4. Validates JSON schema and inserts into Supabase.
+  4. Validates JSON schema, dedups on content_hash and bulk-inserts into Supabase.
+
+Generation runs on a small thread pool (HARVEST_CONCURRENCY workers) paced by a
+single shared token bucket (GROQ_RPM), while the main thread drains finished
+questions into Supabase. Both knobs are environment-configurable.
+
+Clients come from backends.make_clients(): SUPABASE_BACKEND / GROQ_BACKEND
+select live, offline (fakes.py) or record/replay backends, and DRY_RUN=true
+drops every write (see bench.py for the offline throughput benchmark).
+
+Groq calls go through groq_client.AdaptiveGroq (applied by make_clients()),
+which paces on the x-ratelimit-* response headers, retries 429s / 5xx with
+jittered backoff and trips a circuit breaker on sustained failure; the
+generation functions here make one call and treat any exception as final.
+Generation prompts come from prompts.py: a fixed, cacheable system message
+plus a compact per-slot user message with token-budgeted source text.
+
+Every run ends with a machine-readable report from metrics.py (stage
+timings, tokens, retries, 429s, per-bucket outcomes and rejection reasons)
+in .cache/run_report.json, appended to .cache/run_history.jsonl.
+
+  python scraper.py            # one cron run (main)
+  python scraper.py --daemon   # long-running harvester (daemon.py)
 """
 
+from __future__ import annotations
+
 import os
 import json
 import logging
+import math
 import random
+import threading
 import time
-from typing import Optional
-from supabase import create_client, Client
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Optional
+
+from backends import DRY_RUN, make_clients
+from corpus import SourceCorpus, publish_passages
+from dedup import content_hash, dedup_batch
+from llm_cache import LLM_CACHE_NEGATIVE_TTL, LLMCache
+from local_classifier import load_or_train
+from metrics import metrics
+from near_dup import NearDupIndex
+from prompts import generation_messages
+from ratelimit import TokenBucket
+from routing import CLASSIFY_CACHE_MODEL, MODEL_GENERATE, classify_tiered, routing_summary
+from salvage import JSON_SALVAGE, REASKABLE_FIELDS, answer_in_options, invalid_fields, parse_counted, reask_field, recovery_summary, salvage_items
+from scheduler import DAILY_REQUEST_QUOTA, RUN_INTERVAL_MINUTES, SchedulerState, plan_queue, run_budget
+
+if TYPE_CHECKING:
+    from groq import Groq
+    from supabase import Client
 
 # ─────────────────────────────────────────────────────────────
 # CONFIG
@@ -26,14 +70,17 @@ from groq import Groq
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger(__name__)
 
-SUPABASE_URL = os.environ["NEXT_PUBLIC_SUPABASE_URL"]
-SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ["NEXT_PUBLIC_SUPABASE_ANON_KEY"]
-GROQ_API_KEY = os.environ["GROQ_API_KEY"]
+QUESTIONS_PER_RUN = int(os.environ.get("QUESTIONS_PER_RUN", "25"))   # 25q × 96 runs/day = 2,400/day
+MODEL = MODEL_GENERATE
+AUTO_REPAIR_PROMPT_VERSION = "auto_repair-batch-v2"   # bump when the repair prompt changes
 
-QUESTIONS_PER_RUN = 25        # 25q × 96 runs/day = 2,400/day
-MODEL = "llama-3.3-70b-versatile"
+# ── Pipeline concurrency / pacing ───────────────────────────
+HARVEST_CONCURRENCY = int(os.environ.get("HARVEST_CONCURRENCY", "4"))  # parallel Groq generations
+GROQ_RPM = float(os.environ.get("GROQ_RPM", "28"))                     # shared budget (free tier: 30 rpm)
+INSERT_BATCH_SIZE = int(os.environ.get("INSERT_BATCH_SIZE", "25"))     # validated rows per bulk upsert
+GENERATION_BATCH_SIZE = int(os.environ.get("GENERATION_BATCH_SIZE", "3"))  # questions per Groq request (prompts.py)
 
-# ── Rotation Endpoints for Pagination Strategy ──────────────
+# ── Rotation Endpoints for Pagination Strategy (prefetched by corpus.py) ──
 EXTERNAL_SOURCES = [
     "https://api.crossref.org/works?query=science&select=title,abstract&rows=10&offset=",
     "https://openlibrary.org/search.json?q=history&limit=10&page=",
@@ -83,125 +130,103 @@ TARGET_PER_BUCKET = 500  # Long-term target; drives deficit weighting
 # ─────────────────────────────────────────────────────────────
 # SELF-BALANCING QUEUE BUILDER
 # ─────────────────────────────────────────────────────────────
-def build_target_queue(supabase: Client) -> list:
-    log.info("Querying inventory for self-balancing analysis…")
-
+def read_inventory(supabase: Client) -> dict:
+    """
+    Per-bucket row counts from the server-side aggregate `view_bucket_inventory`.
+    One small grouped result regardless of bank size (no full-table transfer,
+    no PostgREST row-cap truncation). Returns {(module, domain, difficulty, is_spr): count}.
+    """
     existing: dict = {}
     try:
-        rows = supabase.table("sat_question_bank").select("module, domain, difficulty, is_spr").execute()
-        for r in rows.data:
+        rows = supabase.table("view_bucket_inventory").select("module, domain, difficulty, is_spr, question_count").execute()
+        for r in rows.data or []:
             key = (r["module"], r["domain"], r["difficulty"], bool(r.get("is_spr", False)))
-            existing[key] = existing.get(key, 0) + 1
+            existing[key] = existing.get(key, 0) + int(r["question_count"])
     except Exception as e:
-        log.warning(f"Could not read inventory (table may be empty): {e}")
-
-    # Score each bucket by deficit — emptier = higher weight
-    scores = []
-    for bucket in ALL_BUCKETS:
-        module, domain, difficulty, is_spr = bucket
-        actual = existing.get(bucket, 0)
-        deficit = max(0, TARGET_PER_BUCKET - actual) + 1
-        scores.append((module, domain, difficulty, is_spr, deficit))
-        log.info(f"  {module} | {domain} | {difficulty} | SPR={is_spr} → {actual} (deficit {deficit})")
-
-    total_deficit = sum(s[4] for s in scores)
-    queue = []
-    for module, domain, difficulty, is_spr, deficit in scores:
-        slots = max(1, round((deficit / total_deficit) * QUESTIONS_PER_RUN))
-        for _ in range(slots):
-            queue.append((module, domain, difficulty, is_spr))
+        log.warning(f"Could not read inventory (view_bucket_inventory missing or table empty): {e}")
+    return existing
 
-    random.shuffle(queue)
-    queue = queue[:QUESTIONS_PER_RUN]
-    while len(queue) < QUESTIONS_PER_RUN:
-        queue.append(random.choice(queue))
+def build_target_queue(supabase: Client, state: SchedulerState, existing: Optional[dict] = None,
+                       interval_minutes: float = RUN_INTERVAL_MINUTES) -> list:
+    """
+    One entry per question requested this run. Slots are apportioned by the
+    quota-aware scheduler (largest-remainder on deficit / acceptance rate) and
+    capped by the remaining daily Groq request budget, spread over runs
+    `interval_minutes` apart. `existing` skips the inventory query (the
+    daemon keeps its own counts).
+    """
+    if existing is None:
+        log.info("Querying inventory for self-balancing analysis…")
+        existing = read_inventory(supabase)
+    # Quota is counted in requests; each request carries GENERATION_BATCH_SIZE questions.
+    requests = run_budget(state, math.ceil(QUESTIONS_PER_RUN / GENERATION_BATCH_SIZE),
+                          interval_minutes=interval_minutes)
+    budget = min(QUESTIONS_PER_RUN, requests * GENERATION_BATCH_SIZE)
+    queue, plan = plan_queue(existing, ALL_BUCKETS, TARGET_PER_BUCKET, budget, state)
+
+    for (module, domain, difficulty, is_spr), (actual, deficit, accept, slots) in plan.items():
+        log.info(f"  {module} | {domain} | {difficulty} | SPR={is_spr} → {actual} "
+                 f"(deficit {deficit}, accept {accept:.0%}) → {slots} slots")
 
-    log.info(f"Queue built: {len(queue)} questions across {len(set(queue))} unique buckets.")
+    random.shuffle(queue)
+    log.info(f"Queue built: {len(queue)} questions across {len(set(queue))} unique buckets "
+             f"(daily quota left {state.remaining_quota()}/{DAILY_REQUEST_QUOTA}).")
     return queue
 
-# ─────────────────────────────────────────────────────────────
-# PROMPT BUILDER
-# ─────────────────────────────────────────────────────────────
-def build_prompt(module: str, domain: str, difficulty: str, is_spr: bool, raw_source: str) -> str:
-    domain_display = domain.replace("_", " ")
-    module_display = "Math" if module == "Math" else "Reading_Writing"
-    spr_note = (
-        "This is a Student-Produced Response (SPR / grid-in). NO multiple-choice options. "
-        "Set is_spr=true and options=null. The student writes a numeric answer."
-    ) if is_spr else (
-        "This has 4 multiple-choice options (A, B, C, D). Set is_spr=false. "
-        "Provide exactly 4 distinct, plausible options."
-    )
-
-    return f"""You are a Digital SAT question writer and copyright-sanitization engine.
-
-Generate ONE brand-new Digital SAT question with EXACTLY these attributes:
-  Section   : {module_display}
-  Domain    : {domain}
-  Difficulty: {difficulty}
-  {spr_note}
-
-You are forced to output a JSON object. For the 'module', 'domain', and 'difficulty' keys, you MUST pick exactly one string from the following allowed lists. DO NOT invent your own categories. If you use spaces, the system will crash.
-
-ALLOWED MODULES: "Math", "Reading_Writing"
-ALLOWED DOMAINS: "Heart_of_Algebra", "Advanced_Math", "Problem_Solving_Data", "Geometry_Trigonometry", "Information_Ideas", "Craft_Structure", "Expression_Ideas", "Standard_English"
-ALLOWED DIFFICULTIES: "Easy", "Medium", "Hard"
-
-Here is some raw inspirational source material scraped from the web:
-[RAW_SOURCE_START]
-{raw_source}
-[RAW_SOURCE_END]
-
-RULES:
-1. Synthesize a question inspired by the math/logic or reading topic of the RAW_SOURCE if applicable, but do a strict Entity Swap.
-2. Use completely fictional names, places, companies, scenarios — no real text from the source.
-3. Keep all math/logic/grammar mechanics identical to real College Board style.
-4. Difficulty must match: Easy=single-step, Medium=2-3 steps, Hard=multi-concept or trap.
-5. For RW questions, include a short passage (2-4 sentences) in question_text before the question.
-
-Respond with ONLY a valid JSON object — no markdown, no extra text:
-{{
-  "module": "{module_display}",
-  "domain": "{domain}",
-  "difficulty": "{difficulty}",
-  "is_spr": {str(is_spr).lower()},
-  "question_text": "<full question text>",
-  "options": {("null" if is_spr else '["<option A>", "<option B>", "<option C>", "<option D>"]')},
-  "correct_answer": "<exact correct option text OR numeric value for SPR>",
-  "rationale": "<1-2 sentence explanation>"
-}}"""
-
 # ─────────────────────────────────────────────────────────────
 # GROQ GENERATION (Entity Swap / Synthesis)
 # ─────────────────────────────────────────────────────────────
-def generate_question(client: Groq, module: str, domain: str, difficulty: str, is_spr: bool, seed_page: int, raw_source: str) -> Optional[dict]:
-    # We pass the seed_page implicitly into the prompt to ensure the LLM starts from a randomized trajectory
-    prompt = build_prompt(module, domain, difficulty, is_spr, raw_source) + f"\n\nRandomization Seed Offset: {seed_page}"
-    for attempt in range(3):
-        try:
+def generate_batch(client: Groq, buckets: list, sources: list) -> list:
+    """
+    Asks for len(buckets) questions in one completion. Returns a list aligned
+    with `buckets`; each element is the raw dict for that slot or None if the
+    model skipped / mangled it. A bad element never discards its neighbours.
+    `slot` may come back as a number or a numeric string; an item without one
+    takes its array position. Whether its tags match the slot is checked in
+    validate().
+    """
+    messages = generation_messages(buckets, sources)
+    try:
+        with metrics.timer("groq_generate"):
             response = client.chat.completions.create(
                 model=MODEL,
-                messages=[{"role": "user", "content": prompt}],
+                messages=messages,
                 response_format={"type": "json_object"},
                 temperature=0.8,
-                max_tokens=1024,
+                max_tokens=min(8000, 900 * len(buckets)),
             )
-            raw = response.choices[0].message.content.strip()
-            return json.loads(raw)
-        except json.JSONDecodeError as e:
-            log.error(f"JSON parse error (attempt {attempt+1}): {e}")
-            return None
-        except Exception as e:
-            err = str(e)
-            if "rate_limit" in err.lower() or "429" in err:
-                wait = 10 * (2 ** attempt)  # 10s, 20s, 40s
-                log.warning(f"Rate limit hit (attempt {attempt+1}). Waiting {wait}s…")
-                time.sleep(wait)
-            else:
-                log.error(f"Groq error: {e}")
-                return None
-    log.error("All retries exhausted.")
-    return None
+    except Exception as e:     # retries and backoff already happened in groq_client.AdaptiveGroq
+        metrics.inc("groq_errors")
+        log.error(f"Groq error: {e}")
+        return [None] * len(buckets)
+    metrics.record_usage(response)
+    raw = response.choices[0].message.content.strip()
+    parsed = parse_counted(raw)
+    items = parsed.get("questions") if parsed is not None else salvage_items(raw)
+    if parsed is None and items:
+        # Cut off mid-array (e.g. max_tokens): keep every question that did complete
+        metrics.inc("salvage_items_recovered", len(items))
+        log.warning(f"Salvaged {len(items)}/{len(buckets)} complete questions from a truncated batch response")
+    elif parsed is None:
+        metrics.inc("json_errors")
+        log.error(f"Batch JSON parse error: unrecoverable response ({len(raw)} chars)")
+        return [None] * len(buckets)
+
+    out = [None] * len(buckets)
+    if not isinstance(items, list):
+        return out
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        slot = item.pop("slot", pos)
+        try:
+            slot = int(slot)
+        except (TypeError, ValueError):
+            metrics.inc("slot_unparseable")
+            continue
+        if 0 <= slot < len(buckets) and out[slot] is None:
+            out[slot] = item
+    return out
 
 # ─────────────────────────────────────────────────────────────
 # VALIDATION
@@ -214,179 +239,523 @@ VALID_DOMAINS = {
 VALID_DIFFS = {"Easy", "Medium", "Hard"}
 
 def validate(data: dict, exp_module: str, exp_domain: str, exp_diff: str, exp_spr: bool) -> Optional[dict]:
-    if not isinstance(data, dict): return None
-    # Pin to expected values if Groq drifts
-    data["module"]     = data.get("module")     if data.get("module")     in VALID_MODULES else exp_module
-    data["domain"]     = data.get("domain")     if data.get("domain")     in VALID_DOMAINS else exp_domain
-    data["difficulty"] = data.get("difficulty") if data.get("difficulty") in VALID_DIFFS   else exp_diff
-    if not data.get("question_text") or not data.get("correct_answer"): return None
+    bucket = (exp_module, exp_domain, exp_diff, exp_spr)
+    if not isinstance(data, dict):
+        metrics.reject(bucket, "not_an_object")
+        return None
+    # Pin to expected values if Groq drifts off the enums; a valid tag for
+    # another bucket (e.g. an RW item in a Math slot) would be credited to the
+    # wrong bucket in the inventory and the scheduler's acceptance stats.
+    for key, allowed, expected in (("module", VALID_MODULES, exp_module), ("domain", VALID_DOMAINS, exp_domain),
+                                   ("difficulty", VALID_DIFFS, exp_diff)):
+        if data.get(key) not in allowed:
+            metrics.inc(f"pinned_{key}")
+            data[key] = expected
+        elif data[key] != expected:
+            metrics.reject(bucket, f"wrong_{key}")
+            log.warning(f"Item tagged {key}={data[key]!r} for a {expected!r} slot — skipping.")
+            return None
+    if not data.get("question_text") or not data.get("correct_answer"):
+        metrics.reject(bucket, "missing_text_or_answer")
+        return None
     is_spr = bool(data.get("is_spr", exp_spr))
+    if is_spr != bool(exp_spr):
+        metrics.reject(bucket, "wrong_is_spr")
+        log.warning(f"Item is_spr={is_spr} for an is_spr={bool(exp_spr)} slot — skipping.")
+        return None
     data["is_spr"] = is_spr
     if is_spr:
         data["options"] = None
     else:
         opts = data.get("options")
         if not isinstance(opts, list) or len(opts) != 4:
+            metrics.reject(bucket, "bad_options")
             log.warning("Options malformed — skipping.")
             return None
+        if not answer_in_options(data["correct_answer"], opts):
+            metrics.reject(bucket, "answer_not_in_options")
+            log.warning("Correct answer is not one of the options — skipping.")
+            return None
     data["source_method"] = "Automated_Pipeline"
     data.pop("id", None)
     return data
 
 # ─────────────────────────────────────────────────────────────
-# MAIN EXECUTION CORE
+# NEAR-DUPLICATE INDEX
 # ─────────────────────────────────────────────────────────────
-def main():
-    print("--- STARTING HARVESTER RUN ---")
-    
-    # 1. DYNAMIC PAGINATION
-    seed = random.randint(1, 1000)
-    target_url = random.choice(EXTERNAL_SOURCES) + str(seed)
-    print(f"Targeting URL: {target_url}")
-
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    groq_client = Groq(api_key=GROQ_API_KEY)
-
-    queue = build_target_queue(supabase)
-    log.info(f"Processing {len(queue)} questions based on current inventory deficits…")
+def load_near_dup_index(supabase: Client) -> NearDupIndex:
+    """Loads the on-disk MinHash index and pulls in rows added since the last run."""
+    started = time.monotonic()
+    index = NearDupIndex.load()
+    try:
+        index.sync(supabase)
+    except Exception as e:
+        log.warning(f"Near-dup index sync failed ({e}); using {len(index)} cached rows.")
+    log.info(f"Near-dup index ready: {len(index)} rows in {time.monotonic() - started:.1f}s")
+    return index
+
+# ─────────────────────────────────────────────────────────────
+# CONCURRENT PIPELINE
+# ─────────────────────────────────────────────────────────────
+def generation_attempts() -> int:
+    """
+    Requests sent to the generation model so far (AdaptiveGroq counts every
+    attempt, 429s and retries included, as Groq's daily quota does).
+    """
+    return metrics.snapshot().get(f"groq_attempts:{MODEL}", 0)
+
+
+def _recover_and_validate(groq_client: Groq, limiter: TokenBucket, data: dict, bucket: tuple) -> Optional[dict]:
+    """
+    validate(), but a question whose only defect is one re-askable field
+    (options / correct_answer) first gets a short follow-up request for
+    just that field instead of being thrown away.
+    """
+    bad = invalid_fields(data, bucket[3])
+    if JSON_SALVAGE and len(bad) == 1 and bad[0] in REASKABLE_FIELDS:
+        metrics.observe("rate_wait", limiter.acquire())
+        reask_field(groq_client, MODEL, data, bad[0])
+    with metrics.timer("validate"):
+        return validate(data, *bucket)
 
-    inserted = 0
-    skipped  = 0
 
-    # Fetch raw source snippet
-    import urllib.request
+def _generate_and_validate(groq_client: Groq, limiter: TokenBucket, chunk: list, passages: list) -> list:
+    """
+    Stage 1+2 (worker thread): wait for a rate token, generate every question
+    in `chunk` (one request, one source passage per question), validate each
+    on its own. Returns [(bucket, validated_or_None), …] aligned with `chunk`.
+    """
+    metrics.observe("rate_wait", limiter.acquire())
+    raws = generate_batch(groq_client, chunk, [p["text"] for p in passages])
+    results = []
+    for bucket, data, passage in zip(chunk, raws, passages):
+        if not data:
+            metrics.reject(bucket, "generation_failed")
+            validated = None
+        else:
+            validated = _recover_and_validate(groq_client, limiter, data, bucket)
+        if validated:
+            validated["source_ref"] = passage["id"]
+        results.append((bucket, validated))
+    return results
+
+
+def flush_batch(supabase: Client, batch: list) -> list:
+    """
+    Stage 3 (main thread): dedup a batch of validated questions and bulk-write it.
+
+    One IN lookup on content_hash covers the whole batch, and one upsert with
+    ignore_duplicates writes it. If the bulk write is rejected (e.g. one row
+    trips a CHECK constraint) the batch is retried row-by-row so the good
+    rows still land. Returns one outcome per input row, in order:
+    "accepted", "duplicate" or "insert_failed".
+    """
+    if not batch:
+        return []
+    rows, _ = dedup_batch(batch)
+
+    # 2. DUPLICATE AVOIDANCE — one round trip for the whole batch
     try:
-        req = urllib.request.Request(target_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
-            raw_html = response.read()[:3000].decode("utf-8", errors="ignore")
+        hashes = [r["content_hash"] for r in rows]
+        with metrics.timer("dedup_lookup"):
+            existing = supabase.table("sat_question_bank").select("content_hash").in_("content_hash", hashes).execute()
+        known = {r["content_hash"] for r in (existing.data or [])}
     except Exception as e:
-        log.warning(f"Could not scrape target URL: {e}. Passing empty raw text.")
-        raw_html = "(Simulated random conceptual math or reading text due to network block)"
+        metrics.inc("dedup_lookup_errors")
+        log.warning(f"Batch dedup lookup failed ({e}); relying on the unique index.")
+        known = set()
+    fresh = [r for r in rows if r["content_hash"] not in known]
+
+    written: set = set()
+    failed: set = set()
+    if fresh:
+        try:
+            with metrics.timer("insert"):
+                res = supabase.table("sat_question_bank").upsert(fresh, on_conflict="content_hash", ignore_duplicates=True).execute()
+            written = {r["content_hash"] for r in (res.data or [])}
+        except Exception as e:
+            metrics.inc("insert_fallbacks")
+            log.warning(f"Bulk insert of {len(fresh)} rows failed ({e}); isolating per row…")
+            for r in fresh:
+                try:
+                    with metrics.timer("insert_row"):
+                        res = supabase.table("sat_question_bank").upsert(r, on_conflict="content_hash", ignore_duplicates=True).execute()
+                    written.update(x["content_hash"] for x in (res.data or []))
+                except Exception as row_err:
+                    failed.add(r["content_hash"])
+                    metrics.reject((r["module"], r["domain"], r["difficulty"], r["is_spr"]), f"db:{getattr(row_err, 'code', None) or 'error'}")
+                    log.error(f"  ✗ Insert failed ({r['domain']} | {r['difficulty']}): {row_err}")
+        print(f"Successfully Synthesized: {len(written)}/{len(fresh)} new rows in batch")
+
+    first = {id(r) for r in fresh}
+    outcomes = []
+    for r in batch:
+        if id(r) in first and r["content_hash"] in written:
+            outcomes.append("accepted")
+        elif id(r) in first and r["content_hash"] in failed:
+            outcomes.append("insert_failed")
+        else:
+            outcomes.append("duplicate")
+    return outcomes
 
-    for i, (module, domain, difficulty, is_spr) in enumerate(queue):
-        # Generate question using the LLM Entity Swap
-        data = generate_question(groq_client, module, domain, difficulty, is_spr, seed + i, raw_html)
-        validated = validate(data, module, domain, difficulty, is_spr) if data else None
 
-        if validated:
-            validated['raw_original_text'] = raw_html
-            q_text = validated['question_text']
-            # 2. DUPLICATE AVOIDANCE
+def run_pipeline(supabase: Client, groq_client: Groq, queue: list, passages: list,
+                 near_dups: Optional[NearDupIndex] = None, state: Optional[SchedulerState] = None,
+                 limiter: Optional[TokenBucket] = None, inventory: Optional[dict] = None,
+                 inventory_lock: Optional[threading.Lock] = None) -> tuple:
+    """
+    `passages` is aligned with `queue` (one source passage per question).
+    Runs generation/validation on HARVEST_CONCURRENCY worker threads and drains
+    results into Supabase in INSERT_BATCH_SIZE batches. A single token bucket
+    replaces the old per-item sleeps, so throughput is bounded by GROQ_RPM.
+    Each worker request asks for GENERATION_BATCH_SIZE questions; every item is
+    validated on its own. Accepted questions are screened against the
+    near-duplicate index first, and every question's outcome is fed back to
+    the scheduler state. A long-lived caller passes its own `limiter` (so the
+    rate budget carries across runs) and `inventory`, which is bumped per
+    accepted question under `inventory_lock` if other threads read it.
+    Returns (inserted, skipped).
+    """
+    limiter = limiter or TokenBucket(GROQ_RPM, burst=HARVEST_CONCURRENCY)
+    tally = {}
+    pending: list = []          # (bucket, validated, near-dup key) awaiting a bulk write
+    started = time.monotonic()
+
+    def record(bucket: tuple, outcome: str) -> None:
+        tally[outcome] = tally.get(outcome, 0) + 1
+        metrics.outcome(bucket, outcome)
+        if state is not None and not DRY_RUN:     # dry-run rows were dropped: no evidence either way
+            state.record(bucket, outcome)
+        if inventory is not None and outcome == "accepted":
+            with inventory_lock or nullcontext():
+                inventory[bucket] = inventory.get(bucket, 0) + 1
+
+    def flush() -> None:
+        outcomes = flush_batch(supabase, [row for _, row, _ in pending])
+        for (bucket, _, key), outcome in zip(pending, outcomes):
+            record(bucket, outcome)
+            if near_dups is None:
+                continue
+            if outcome == "accepted":    # index only rows that now exist in the bank
+                near_dups.confirm(key)
+            else:
+                near_dups.discard(key)
+        pending.clear()
+
+    def handle(bucket: tuple, validated: Optional[dict]) -> None:
+        if not validated:
+            record(bucket, "invalid")
+            return
+        key = content_hash(validated["question_text"])
+        if near_dups is not None:
+            with metrics.timer("near_dup"):
+                match, sig = near_dups.check(validated["question_text"], validated.get("options"))
+            if match:
+                log.info(f"  ~ Near-duplicate of {match[0]} (J≈{match[1]:.2f}) — skipped")
+                record(bucket, "near_duplicate")
+                return
+            near_dups.stage(key, sig)
+        pending.append((bucket, validated, key))
+        if len(pending) >= INSERT_BATCH_SIZE:
+            flush()
+
+    usage_before = metrics.snapshot()
+    attempts_before = generation_attempts()
+    chunks = [queue[i:i + GENERATION_BATCH_SIZE] for i in range(0, len(queue), GENERATION_BATCH_SIZE)]
+    log.info(f"Pipeline: {HARVEST_CONCURRENCY} workers @ {GROQ_RPM:g} req/min, "
+             f"{GENERATION_BATCH_SIZE} questions/request ({len(chunks)} requests)")
+    with ThreadPoolExecutor(max_workers=HARVEST_CONCURRENCY, thread_name_prefix="groq") as pool:
+        futures = {
+            pool.submit(_generate_and_validate, groq_client, limiter, chunk,
+                        passages[i * GENERATION_BATCH_SIZE:(i + 1) * GENERATION_BATCH_SIZE]): chunk
+            for i, chunk in enumerate(chunks)
+        }
+        for fut in as_completed(futures):
             try:
-                # Check if exact question already exists to avoid throwing raw database constraints
-                existing = supabase.table("sat_question_bank").select("id").eq("question_text", q_text).limit(1).execute()
-                if existing.data and len(existing.data) > 0:
-                    skipped += 1
-                    continue
-                
-                # Insert the deduplicated payload
-                supabase.table("sat_question_bank").insert(validated).execute()
-                print(f"Successfully Synthesized: {domain} | {difficulty}")
-                inserted += 1
+                results = fut.result()
             except Exception as e:
-                log.error(f"  ✗ Insert failed: {e}")
-                skipped += 1
-        else:
-            skipped += 1
+                log.error(f"  ✗ Generation worker crashed: {e}")
+                results = [(bucket, None) for bucket in futures[fut]]
+                for bucket in futures[fut]:
+                    metrics.reject(bucket, "worker_crashed")
+            for bucket, validated in results:
+                handle(bucket, validated)
+
+    flush()
+    usage = metrics.snapshot()
+    n_requests = usage.get("requests", 0) - usage_before.get("requests", 0)
+    if state is not None:
+        state.spend(generation_attempts() - attempts_before)
+    elapsed = time.monotonic() - started
+    log.info(f"Pipeline drained {len(queue)} items in {elapsed:.1f}s ({len(queue) / max(elapsed, 1e-9) * 60:.1f} items/min)")
+    log.info(f"Outcomes: {tally}")
+    inserted = tally.get("accepted", 0)
+    n_tokens = sum(usage.get(k, 0) - usage_before.get(k, 0) for k in ("prompt_tokens", "completion_tokens"))
+    recovery = recovery_summary(metrics.snapshot())
+    log.info(f"Recovery: {recovery['parse_recovered']}/{recovery['parse_attempts']} malformed responses parsed, "
+             f"{recovery['items_salvaged']} questions salvaged from truncated batches, "
+             f"{recovery['reask_recovered']}/{recovery['reask_attempts']} single-field re-asks fixed")
+    log.info(f"Yield @ N={GENERATION_BATCH_SIZE}: {inserted / max(n_requests, 1):.2f} accepted/request, "
+             f"{inserted / max(n_tokens, 1) * 1000:.2f} accepted/1k tokens ({n_requests} requests, {n_tokens} tokens)")
+    return inserted, len(queue) - inserted
+
+# ─────────────────────────────────────────────────────────────
+# MAIN EXECUTION CORE
+# ─────────────────────────────────────────────────────────────
+def main(supabase: Optional[Client] = None, groq_client: Optional[Groq] = None):
+    print("--- STARTING HARVESTER RUN ---" + (" (DRY RUN — no writes)" if DRY_RUN else ""))
+
+    metrics.reset()
 
-        time.sleep(random.uniform(2.0, 3.5))
+    if supabase is None or groq_client is None:
+        supabase, groq_client = make_clients()
+
+    state = SchedulerState.load()
+    with metrics.timer("plan"):
+        queue = build_target_queue(supabase, state)
+    log.info(f"Processing {len(queue)} questions based on current inventory deficits…")
+
+    # 1. SOURCE MATERIAL — prefetch (pooled), fall back to the cached corpus offline
+    with metrics.timer("corpus"):
+        corpus = SourceCorpus.load()
+        corpus.refresh(EXTERNAL_SOURCES)
+        passages = corpus.sample(len(queue))
+        publish_passages(supabase, passages)
+
+    with metrics.timer("near_dup_sync"):
+        near_dups = load_near_dup_index(supabase)
+    inserted, skipped = run_pipeline(supabase, groq_client, queue, passages, near_dups, state)
+    try:
+        if not DRY_RUN:   # dry-run rows were never written; don't remember them as existing
+            near_dups.save()
+        corpus.save()
+    except OSError as e:
+        log.warning(f"Could not persist local caches: {e}")
 
     print(f"RUN COMPLETE. Successfully injected {inserted} new questions into Supabase. Skipped {skipped} duplicates.")
 
     # ── AUTO-REPAIR SWEEP ────────────────────────────────────
     # After every harvest run, scan the entire DB for rows with
     # broken domain tags or missing raw_original_text and fix them.
-    auto_repair_untagged(supabase, groq_client)
+    state.spend(auto_repair_untagged(supabase, groq_client))
+    if DRY_RUN:
+        state.save_spend()
+    else:
+        state.save()
+
+    metrics.write({
+        "dry_run": DRY_RUN, "model": MODEL, "queued": len(queue),
+        "generation_batch_size": GENERATION_BATCH_SIZE, "concurrency": HARVEST_CONCURRENCY, "groq_rpm": GROQ_RPM,
+        "daily_quota_left": state.remaining_quota(),
+        "recovery": recovery_summary(metrics.snapshot()),
+        "routing": routing_summary(metrics.snapshot()),
+    })
 
 
 # ─────────────────────────────────────────────────────────────
 # AUTO-REPAIR: Fix rows with invalid tags or missing raw text
 # ─────────────────────────────────────────────────────────────
-def auto_repair_untagged(supabase: Client, groq_client: Groq):
-    """
-    Automatically called at the end of every scraper run.
-    Finds questions whose domain is NOT in the strict Enum list
-    and re-classifies them via Groq.
-    """
-    print("--- AUTO-REPAIR SWEEP STARTING ---")
+def _quoted(values) -> str:
+    return ",".join(f'"{v}"' for v in sorted(values))
+
+
+# PostgREST filter selecting only rows whose tags fall outside the enums
+BROKEN_ROWS_FILTER = (
+    f"module.not.in.({_quoted(VALID_MODULES)}),"
+    f"domain.not.in.({_quoted(VALID_DOMAINS)}),"
+    f"difficulty.not.in.({_quoted(VALID_DIFFS)})"
+)
+REPAIR_MAX_ROWS = int(os.environ.get("REPAIR_MAX_ROWS", "300"))          # broken rows handled per run
+REPAIR_CLASSIFY_BATCH = int(os.environ.get("REPAIR_CLASSIFY_BATCH", "20"))  # questions per classification prompt
+REPAIR_TEXT_CHARS = 1200                                                   # per-question truncation in the prompt
+BACKFILL_RAW_TEXT = "[Auto-backfilled] Original question text before entity swap was not captured for this legacy row."
+
+
+def build_classify_batch_prompt(rows: list) -> str:
+    items = "\n".join(
+        json.dumps({"id": str(r["id"]), "text": (r.get("question_text") or "")[:REPAIR_TEXT_CHARS]}, ensure_ascii=False)
+        for r in rows
+    )
+    return f"""You are a strict database evaluation engine.
+Below are {len(rows)} SAT questions, one JSON object per line. Categorize EACH one using EXACTLY these Allowed Enums.
+DO NOT make up your own tags. Pick the single best match for every question.
 
-    # Fetch ALL rows — we'll filter client-side for broken tags
-    try:
-        response = supabase.table("sat_question_bank") \
-            .select("id, module, domain, difficulty, question_text, raw_original_text") \
-            .limit(1000) \
-            .execute()
-        rows = response.data or []
-    except Exception as e:
-        log.error(f"Auto-repair: could not fetch rows: {e}")
-        return
+ALLOWED MODULES: "Math", "Reading_Writing"
+ALLOWED DOMAINS:
+  For Math: "Heart_of_Algebra", "Advanced_Math", "Problem_Solving_Data", "Geometry_Trigonometry"
+  For Reading_Writing: "Information_Ideas", "Craft_Structure", "Expression_Ideas", "Standard_English"
+ALLOWED DIFFICULTIES: "Easy", "Medium", "Hard"
 
-    broken = [r for r in rows if r.get("domain") not in VALID_DOMAINS or r.get("module") not in VALID_MODULES]
+QUESTIONS:
+{items}
 
-    if not broken:
-        print("Auto-repair: All rows have valid tags. Nothing to fix.")
-        return
+Respond in plain JSON only (no markdown), with one result per question id. "confidence" is your probability (0-1) that all three tags are right:
+{{"results": [{{"id": "<id>", "module": "<module>", "domain": "<domain>", "difficulty": "<difficulty>", "confidence": <0-1>}}]}}"""
 
-    # Cap at 20 repairs per run to stay within the 10-min GitHub Actions timeout.
-    # Over successive 15-min cron runs, all broken rows will eventually be fixed.
-    REPAIR_BATCH_SIZE = 10
-    batch = broken[:REPAIR_BATCH_SIZE]
-    print(f"Auto-repair: Found {len(broken)} rows with invalid tags. Repairing batch of {len(batch)}…")
 
-    repaired = 0
-    failed = 0
+def _tags_valid(tags: dict) -> bool:
+    return tags.get("module") in VALID_MODULES and tags.get("domain") in VALID_DOMAINS and tags.get("difficulty") in VALID_DIFFS
 
-    for row in batch:
-        rid = row["id"]
-        qtext = row.get("question_text", "")
 
-        repair_prompt = f"""You are a strict database evaluation engine.
-Below is a SAT question. Categorize it using EXACTLY these Allowed Enums.
-DO NOT make up your own tags. Pick the single best match.
+def classify_batch(groq_client: Groq, rows: list, model: str = MODEL, tier: str = "escalate") -> dict:
+    """One Groq request tagging every row in `rows`. Returns {id: tags} (tags may be invalid)."""
+    resp = groq_client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": build_classify_batch_prompt(rows)}],
+        temperature=0.1,
+        max_tokens=70 * len(rows) + 100,
+        response_format={"type": "json_object"}
+    )
+    metrics.record_usage(resp, prefix=f"repair_{tier}_")
+    results = (parse_counted(resp.choices[0].message.content.strip()) or {}).get("results") or []
+    wanted = {str(r["id"]) for r in rows}
+    return {str(t["id"]): t for t in results if isinstance(t, dict) and str(t.get("id")) in wanted}
 
-ALLOWED MODULES: "Math", "Reading_Writing"
-ALLOWED DOMAINS:
-  For Math: "Heart_of_Algebra", "Advanced_Math", "Problem_Solving_Data", "Geometry_Trigonometry"
-  For Reading_Writing: "Information_Ideas", "Craft_Structure", "Expression_Ideas", "Standard_English"
-ALLOWED DIFFICULTIES: "Easy", "Medium", "Hard"
 
-QUESTION TEXT:
-{qtext}
+def bulk_update_tags(supabase: Client, updates: list) -> tuple:
+    """
+    Writes all tag fixes with one RPC (bulk_update_tags in schema.sql, which
+    isolates per-row constraint failures). Falls back to per-row updates if
+    the function isn't deployed. Returns (updated, failed_ids); ids that no
+    longer match a row (deleted meanwhile) are neither.
+    """
+    if not updates:
+        return 0, []
+    try:
+        res = supabase.rpc("bulk_update_tags", {"payload": updates}).execute()
+        missing = list(res.data.get("missing") or [])
+        if missing:
+            metrics.inc("repair_missing", len(missing))
+            log.warning(f"  ~ {len(missing)} repaired rows no longer exist: {missing[:5]}")
+        return int(res.data["updated"]), list(res.data.get("failed") or [])
+    except Exception as e:
+        log.warning(f"bulk_update_tags RPC unavailable ({e}); updating row by row.")
+    updated, failed = 0, []
+    for u in updates:
+        payload = {k: u[k] for k in ("module", "domain", "difficulty")}
+        if u.get("raw_original_text"):
+            payload["raw_original_text"] = u["raw_original_text"]
+        try:
+            res = supabase.table("sat_question_bank").update(payload).eq("id", u["id"]).execute()
+        except Exception as row_err:
+            log.error(f"  ✗ Update failed for ID {u['id']}: {row_err}")
+            failed.append(u["id"])
+            continue
+        if res.data:
+            updated += 1
+        else:
+            metrics.inc("repair_missing")
+            log.warning(f"  ~ Row {u['id']} no longer exists")
+    return updated, failed
 
-Respond in plain JSON only (no markdown):
-{{"module": "<module>", "domain": "<domain>", "difficulty": "<difficulty>"}}"""
 
-        try:
-            resp = groq_client.chat.completions.create(
-                model=MODEL,
-                messages=[{"role": "user", "content": repair_prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"}
-            )
-            tags = json.loads(resp.choices[0].message.content.strip())
-            m = tags.get("module")
-            d = tags.get("domain")
-            df = tags.get("difficulty")
-
-            if m in VALID_MODULES and d in VALID_DOMAINS and df in VALID_DIFFS:
-                update = {"module": m, "domain": d, "difficulty": df}
-                # Also backfill raw_original_text if it's missing
-                if not row.get("raw_original_text"):
-                    update["raw_original_text"] = f"[Auto-backfilled] Original question text before entity swap was not captured for this legacy row."
-                supabase.table("sat_question_bank").update(update).eq("id", rid).execute()
-                print(f"  ✓ Repaired ID {rid}: {m} | {d} | {df}")
-                repaired += 1
-            else:
-                log.warning(f"  ✗ Groq returned invalid tags for ID {rid}: {m} | {d} | {df}")
-                failed += 1
-        except Exception as e:
-            log.error(f"  ✗ Repair failed for ID {rid}: {e}")
-            failed += 1
+def auto_repair_untagged(supabase: Client, groq_client: Groq, limiter: Optional[TokenBucket] = None) -> int:
+    """
+    Automatically called at the end of every scraper run.
+    Finds questions whose tags are NOT in the strict Enum lists (filtered
+    server-side) and re-classifies them REPAIR_CLASSIFY_BATCH at a time per
+    Groq request, small model first (routing.py). Each returned tag set is
+    validated on its own, and all fixes are written back in one bulk RPC.
+    Returns the number of attempts sent to the generation model, which is
+    what its daily quota has to be charged.
+    """
+    print("--- AUTO-REPAIR SWEEP STARTING ---")
+    attempts_before = generation_attempts()
 
-        time.sleep(1.5)  # Rate limit buffer
+    try:
+        with metrics.timer("repair_fetch"):
+            response = supabase.table("sat_question_bank") \
+                .select("id, module, domain, difficulty, question_text, raw_original_text") \
+                .or_(BROKEN_ROWS_FILTER) \
+                .limit(REPAIR_MAX_ROWS) \
+                .execute()
+        broken = response.data or []
+    except Exception as e:
+        metrics.inc("repair_fetch_errors")
+        log.error(f"Auto-repair: could not fetch rows: {e}")
+        return 0
 
+    if not broken:
+        print("Auto-repair: All rows have valid tags. Nothing to fix.")
+        return 0
+
+    print(f"Auto-repair: Repairing {len(broken)} rows with invalid tags, {REPAIR_CLASSIFY_BATCH} per Groq request…")
+    metrics.inc("repair_rows", len(broken))
+
+    cache = LLMCache(read_only=DRY_RUN)
+    local_model = load_or_train(supabase)
+    tags_by_id: dict = {}
+    local_guesses: dict = {}
+    uncached = []
+    local_hits = 0
+    for row in broken:
+        if local_model is not None:
+            pred = local_model.predict(row.get("question_text", ""))
+            if pred["confident"]:
+                tags_by_id[str(row["id"])] = {k: pred[k] for k in ("module", "domain", "difficulty")}
+                local_hits += 1
+                continue
+            local_guesses[str(row["id"])] = pred
+        tags = cache.get(CLASSIFY_CACHE_MODEL, AUTO_REPAIR_PROMPT_VERSION, row.get("question_text", ""))
+        if tags is None:
+            uncached.append(row)
+        else:
+            tags_by_id[str(row["id"])] = tags
+
+    # Small model first, doubtful rows escalated (routing.py); each tier has its own rate budget
+    results, _ = classify_tiered(
+        uncached, lambda model, tier, chunk: classify_batch(groq_client, chunk, model, tier),
+        batch_size=REPAIR_CLASSIFY_BATCH, generation_limiter=limiter, local_guesses=local_guesses)
+    for row in uncached:
+        tags = results.get(str(row["id"]))
+        if tags is None:
+            continue
+        cache.put(CLASSIFY_CACHE_MODEL, AUTO_REPAIR_PROMPT_VERSION, row.get("question_text", ""), tags,
+                  None if _tags_valid(tags) else LLM_CACHE_NEGATIVE_TTL)
+        tags_by_id[str(row["id"])] = tags
+
+    updates = []
+    failed = 0
+    for row in broken:
+        rid = str(row["id"])
+        tags = tags_by_id.get(rid)
+        if tags is None or not _tags_valid(tags):
+            log.warning(f"  ✗ No valid tags for ID {rid}: {tags}")
+            failed += 1
+            continue
+        update = {"id": rid, "module": tags["module"], "domain": tags["domain"], "difficulty": tags["difficulty"]}
+        # Also backfill raw_original_text if it's missing
+        if not row.get("raw_original_text"):
+            update["raw_original_text"] = BACKFILL_RAW_TEXT
+        updates.append(update)
+
+    with metrics.timer("repair_update"):
+        repaired, write_failed = bulk_update_tags(supabase, updates)
+    failed += len(write_failed)
+    metrics.inc("repair_fixed", repaired)
+    metrics.inc("repair_failed", failed)
+    metrics.inc("repair_local", local_hits)
+    metrics.inc("repair_cached", len(broken) - local_hits - len(uncached))
+
+    tiers = routing_summary(metrics.snapshot())
     print(f"--- AUTO-REPAIR COMPLETE: Fixed {repaired}, Failed {failed} ---")
+    print(f"Model tiers: {tiers['requests']['classify']} {tiers['models']['classify']} requests, "
+          f"{tiers['requests']['escalate']} escalated to {tiers['models']['escalate']} {tiers['escalated']}, "
+          f"agreement {tiers['agreement']}")
+    print(f"Classification cache: {cache.stats()}")
+    if local_model is not None:
+        print(f"Local classifier: {local_hits}/{len(broken)} rows tagged without an LLM call")
+    cache.close()
+    return generation_attempts() - attempts_before
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="SAT question harvester")
+    parser.add_argument("--daemon", action="store_true",
+                        help="run continuously with warm clients and a localhost status endpoint")
+    if parser.parse_args().daemon:
+        import daemon
+        daemon.run()
+    else:
+        main()
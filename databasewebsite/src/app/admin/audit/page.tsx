@@ -11,6 +11,7 @@ interface AuditRow {
     options: string[] | null;
     correct_answer: string;
     raw_original_text: string | null;
+    source_ref: string | null;
     created_at: string;
 }
 
@@ -23,12 +24,27 @@ export default async function AdminAuditPage() {
 
     const { data, error } = await supabase
         .from('sat_question_bank')
-        .select('id, module, domain, difficulty, source_method, question_text, options, correct_answer, raw_original_text, created_at')
+        .select('id, module, domain, difficulty, source_method, question_text, options, correct_answer, raw_original_text, source_ref, created_at')
         .order('created_at', { ascending: false })
         .limit(100);
 
     const rows: AuditRow[] = data || [];
 
+    // Harvested rows reference a shared passage in source_passages (source_ref has
+    // no foreign key, so resolve it with a second fetch). Legacy rows carry the
+    // text inline in raw_original_text.
+    const refs = Array.from(new Set(rows.map((r) => r.source_ref).filter((r): r is string => !!r)));
+    const passages = new Map<string, string>();
+    if (refs.length > 0) {
+        const { data: passageRows } = await supabase
+            .from('source_passages')
+            .select('id, passage_text')
+            .in('id', refs);
+        for (const p of passageRows || []) passages.set(p.id, p.passage_text);
+    }
+    const sourceText = (row: AuditRow): string | null =>
+        (row.source_ref && passages.get(row.source_ref)) || row.raw_original_text;
+
     const tagColor = (source: string) =>
         source === 'Admin_Dropzone'
             ? { bg: '#E6D5F8', border: '#7C4DFF' }
@@ -101,6 +117,7 @@ export default async function AdminAuditPage() {
             {/* ── Comparison Cards ─────────────────────────────── */}
             {rows.map((row) => {
                 const sc = tagColor(row.source_method || 'Automated_Pipeline');
+                const source = sourceText(row);
                 return (
                     <div key={row.id} style={{
                         border: '1px solid #D0D0C8', borderRadius: '12px',
@@ -151,14 +168,14 @@ export default async function AdminAuditPage() {
                                 }}>
                                     Original Raw Source
                                 </p>
-                                {row.raw_original_text ? (
+                                {source ? (
                                     <p style={{
                                         fontSize: '0.82rem', lineHeight: 1.65, color: '#333',
                                         fontFamily: "'Courier New', monospace",
                                         whiteSpace: 'pre-wrap', wordBreak: 'break-word',
                                     }}>
-                                        {row.raw_original_text.substring(0, 500)}
-                                        {row.raw_original_text.length > 500 ? '…' : ''}
+                                        {source.substring(0, 500)}
+                                        {source.length > 500 ? '…' : ''}
                                     </p>
                                 ) : (
                                     <p style={{ fontSize: '0.82rem', color: '#C0392B', fontStyle: 'italic' }}>
@@ -130,7 +130,52 @@ const supabaseKey = process.env.NEXT_PUBLIC_SUPABASE_ANON_KEY || "";
 const isConfigured = supabaseUrl && supabaseKey;
 const supabase = isConfigured ? createClient(supabaseUrl, supabaseKey) : null;
 
-async function fetchQuestions(stage: Stage, module1Score?: number, seenIds?: Set<string>): Promise<Question[]> {
+// ─── Pre-assembled forms (assemble_forms.py → sat_test_forms) ──
+// Module 1 is a random active form; Module 2 comes from the same family
+// (no shared items), on the higher or lower path.
+const ROUTING_THRESHOLD_PCT = 65;
+type FormPath = "m1" | "m2_higher" | "m2_lower";
+
+async function fetchAssembledForm(stage: Stage, module1Score: number | undefined, families: Record<string, string>): Promise<Question[] | null> {
+    if (!supabase) return null;
+    const cfg = STAGE_CONFIG[stage];
+    const isFirstModule = stage === 1 || stage === 3;
+    const path: FormPath = isFirstModule ? "m1" : ((module1Score ?? 0) >= ROUTING_THRESHOLD_PCT ? "m2_higher" : "m2_lower");
+
+    let row: { family: string; items: Question[] } | null = null;
+    if (isFirstModule) {
+        const pickFrom = (min: number) => supabase
+            .from('sat_test_forms')
+            .select('family, items')
+            .eq('section', cfg.subject)
+            .eq('path', path)
+            .eq('active', true)
+            .gte('pick', min)
+            .order('pick')
+            .limit(1);
+        let res = await pickFrom(Math.random());
+        if (!res.error && (!res.data || res.data.length === 0)) res = await pickFrom(0); // wrapped past the last form
+        if (res.error) { console.warn("Form fetch failed:", res.error); return null; }
+        row = res.data?.[0] ?? null;
+    } else {
+        const family = families[cfg.subject];
+        if (!family) return null;
+        const res = await supabase
+            .from('sat_test_forms')
+            .select('family, items')
+            .eq('family', family)
+            .eq('path', path)
+            .limit(1);
+        if (res.error) { console.warn("Form fetch failed:", res.error); return null; }
+        row = res.data?.[0] ?? null;
+    }
+    if (!row || !Array.isArray(row.items) || row.items.length < cfg.count) return null;
+
+    families[cfg.subject] = row.family;
+    return row.items.slice(0, cfg.count);
+}
+
+async function fetchQuestions(stage: Stage, module1Score?: number, seenIds?: Set<string>, families?: Record<string, string>): Promise<Question[]> {
     if (!supabase) {
         throw new Error("Supabase credentials missing. Check environment variables.");
     }
@@ -138,6 +183,12 @@ async function fetchQuestions(stage: Stage, module1Score?: number, seenIds?: Set
     const isMath = cfg.subject === "math";
     const total = cfg.count;
 
+    if (families) {
+        const form = await fetchAssembledForm(stage, module1Score, families);
+        if (form) return form;
+    }
+
+    // Fallback: no assembled form available — sample the bank directly
     let data, error;
 
     if (isMath) {
@@ -194,6 +245,7 @@ export default function BluebookSession() {
     const [timerHidden, setTimerHidden] = useState(false);
     const [desmosOpen, setDesmosOpen] = useState(false);
     const [seenIds, setSeenIds] = useState<Set<string>>(new Set());
+    const formFamilies = useRef<Record<string, string>>({});
 
     const [moduleCorrectCounts, setModuleCorrectCounts] = useState<Record<number, number>>({});
     const [moduleWeightedScores, setModuleWeightedScores] = useState<Record<number, number>>({});
@@ -214,7 +266,7 @@ export default function BluebookSession() {
         setFreeText({});
         setMarked(new Set());
         try {
-            const qs = await fetchQuestions(s, routingVal, currentSeenIds);
+            const qs = await fetchQuestions(s, routingVal, currentSeenIds, formFamilies.current);
             setQuestions(qs);
         } catch (err: any) {
             console.error("Fetch Failure - Falling back to local bank:", err);
@@ -293,7 +345,8 @@ export default function BluebookSession() {
     const handleNextModule = () => {
         const next = (stage + 1) as Stage;
         if (next > 4) { setPhase("complete"); return; }
-        const accuracyPct = Math.round(((moduleCorrectCounts[stage] || 0) / STAGE_CONFIG[stage].count) * 100);
+        // Unrounded so form routing agrees with the >= 0.65 path test used for scoring
+        const accuracyPct = ((moduleCorrectCounts[stage] || 0) / STAGE_CONFIG[stage].count) * 100;
         setStage(next);
 
         const newSeen = new Set(seenIds);
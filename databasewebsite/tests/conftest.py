@@ -0,0 +1,49 @@
+"""
+Shared fixtures. The harvester modules are flat scripts in databasewebsite/,
+so that directory goes on sys.path. Everything runs offline: fakes.FakeGroq
+and fakes.SQLiteSupabase stand in for the network clients, and every cache /
+state path points into a throwaway directory (bench._isolate) before any
+pipeline module is imported, so a test run never touches .cache/.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import _isolate  # noqa: E402
+
+_WORKDIR = tempfile.mkdtemp(prefix="harvester-tests-")
+atexit.register(shutil.rmtree, _WORKDIR, ignore_errors=True)
+_isolate(_WORKDIR)
+os.environ.update({
+    "EXPORT_DIR": os.path.join(_WORKDIR, "export"),
+    "RUN_REPORT_PATH": os.path.join(_WORKDIR, "run_report.json"),
+    "RUN_HISTORY_PATH": os.path.join(_WORKDIR, "run_history.jsonl"),
+    "FAKE_GROQ_LATENCY": "0",
+})
+
+from fakes import FakeGroq, SQLiteSupabase  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+@pytest.fixture
+def supabase():
+    return SQLiteSupabase()
+
+
+@pytest.fixture
+def groq():
+    return FakeGroq(latency=0.0, seed=7)
@@ -0,0 +1,39 @@
+from collections import Counter
+
+import pytest
+
+from assemble_forms import (DIFFICULTY_BLUEPRINTS, DOMAIN_BLUEPRINTS, MODULE_LENGTHS, PATHS, cell_targets)
+from scheduler import largest_remainder
+
+CASES = [(section, path) for section in MODULE_LENGTHS for path in PATHS]
+
+
+@pytest.mark.parametrize("section, path", CASES)
+def test_cells_fill_the_module(section, path):
+    cells = cell_targets(section, path)
+    assert sum(cells.values()) == MODULE_LENGTHS[section]
+    assert all(k > 0 for k in cells.values())
+
+
+@pytest.mark.parametrize("section, path", CASES)
+def test_both_margins_are_exact(section, path):
+    n = MODULE_LENGTHS[section]
+    cells = cell_targets(section, path)
+    by_diff, by_domain = Counter(), Counter()
+    for (domain, difficulty), k in cells.items():
+        by_diff[difficulty] += k
+        by_domain[domain] += k
+    assert {d: by_diff[d] for d in DIFFICULTY_BLUEPRINTS[path]} == largest_remainder(DIFFICULTY_BLUEPRINTS[path], n)
+    assert {d: by_domain[d] for d in DOMAIN_BLUEPRINTS[section]} == largest_remainder(DOMAIN_BLUEPRINTS[section], n)
+
+
+def test_paths_differ_in_difficulty():
+    hard = {path: sum(k for (_, d), k in cell_targets("math", path).items() if d == "Hard") for path in PATHS}
+    assert hard["m2_lower"] < hard["m1"] < hard["m2_higher"]
+
+
+def test_only_known_domains_and_difficulties():
+    for section, path in CASES:
+        for domain, difficulty in cell_targets(section, path):
+            assert domain in DOMAIN_BLUEPRINTS[section]
+            assert difficulty in DIFFICULTY_BLUEPRINTS[path]
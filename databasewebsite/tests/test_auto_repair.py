@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import routing
+import scraper
+from bench import bank_rows, broken_rows
+from fakes import SQLiteSupabase, StandInError
+from ratelimit import TokenBucket
+from scraper import auto_repair_untagged, bulk_update_tags
+
+FIX = {"module": "Math", "domain": "Advanced_Math", "difficulty": "Hard"}
+
+
+class NoRPC(SQLiteSupabase):
+    """A project where schema.sql's bulk_update_tags was never deployed."""
+
+    def rpc(self, fn, params=None):
+        raise StandInError(f"Could not find the function public.{fn}", "PGRST202")
+
+
+def _seed_broken(db, n: int = 3) -> list:
+    db.seed("sat_question_bank", broken_rows(n, random.Random(5)), checked=False)
+    return [r["id"] for r in db.table("sat_question_bank").select("id").order("id").execute().data]
+
+
+def _tags(db, rid) -> dict:
+    row = db.table("sat_question_bank").select("module, domain, difficulty").eq("id", rid).execute().data[0]
+    return dict(row)
+
+
+@pytest.mark.parametrize("backend", [SQLiteSupabase, NoRPC], ids=["rpc", "row_by_row"])
+def test_bulk_update_contract(backend, fresh_metrics):
+    db = backend()
+    good, bad, gone = _seed_broken(db)
+    db.table("sat_question_bank").delete().eq("id", gone).execute()
+    before = _tags(db, bad)
+    updated, failed = bulk_update_tags(db, [dict(FIX, id=good), dict(FIX, id=bad, domain="Algebra"),
+                                            dict(FIX, id=gone)])
+    assert (updated, failed) == (1, [bad])          # the deleted row is neither updated nor failed
+    assert fresh_metrics.snapshot()["repair_missing"] == 1
+    assert _tags(db, good) == FIX
+    assert _tags(db, bad) == before                 # the rejected row is left as it was
+
+
+def test_bulk_update_nothing_to_do():
+    assert bulk_update_tags(NoRPC(), []) == (0, [])
+
+
+@pytest.mark.parametrize("backend", [SQLiteSupabase, NoRPC], ids=["rpc", "row_by_row"])
+def test_auto_repair_fixes_broken_rows(backend, groq, monkeypatch):
+    monkeypatch.setattr(routing, "GROQ_RPM", 60_000)
+    monkeypatch.setattr(routing, "GROQ_RPM_CLASSIFY", 60_000)
+    routing.reset_limiters()
+    db = backend()
+    db.seed("sat_question_bank", bank_rows(5, random.Random(4)))
+    _seed_broken(db, 8)
+    attempts = auto_repair_untagged(db, groq, TokenBucket(60_000, burst=10))
+    left = db.table("sat_question_bank").select("id", count="exact").or_(scraper.BROKEN_ROWS_FILTER).limit(1).execute()
+    assert left.count == 0
+    assert db.count() == 13
+    assert attempts >= 0
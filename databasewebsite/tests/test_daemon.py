@@ -0,0 +1,78 @@
+import random
+import threading
+
+import pytest
+
+import scraper
+from bench import bank_rows, seed_corpus
+from daemon import Harvester
+from ratelimit import TokenBucket
+
+
+class LockedDict(dict):
+    """An inventory that fails the test if it is touched without the daemon's lock."""
+
+    def __init__(self, lock, *args):
+        super().__init__(*args)
+        self.lock = lock
+        self.unlocked = []
+
+    def _check(self, op):
+        if not self.lock.locked():
+            self.unlocked.append(op)
+
+    def __setitem__(self, key, value):
+        self._check("set")
+        super().__setitem__(key, value)
+
+    def values(self):
+        self._check("values")
+        return super().values()
+
+
+@pytest.fixture
+def harvester(supabase, groq, monkeypatch):
+    rng = random.Random(9)
+    supabase.seed("sat_question_bank", bank_rows(30, rng))
+    seed_corpus(rng, 50)
+    monkeypatch.setattr(scraper, "EXTERNAL_SOURCES", [])
+    h = Harvester(supabase, groq, cycle_seconds=900)
+    h.limiter = TokenBucket(60_000, burst=10)
+    h.refresh_inventory()
+    h._due.update(inventory=float("inf"), corpus=float("inf"), repair=float("inf"))
+    h.inventory = LockedDict(h._lock, h.inventory)
+    return h
+
+
+def test_cycle_bumps_inventory_under_the_lock(harvester):
+    before = sum(dict.values(harvester.inventory))
+    harvester.cycle()
+    accepted = harvester.totals["accepted"]
+    assert accepted > 0
+    assert sum(dict.values(harvester.inventory)) == before + accepted
+    assert harvester.status()["inventory_rows"] == before + accepted
+    assert harvester.inventory.unlocked == []
+
+
+def test_status_is_consistent_while_a_cycle_runs(harvester):
+    errors, snapshots = [], []
+    done = threading.Event()
+
+    def poll():
+        while not done.is_set():
+            try:
+                snapshots.append(harvester.status())
+            except Exception as e:      # e.g. "dictionary changed size during iteration"
+                errors.append(e)
+    poller = threading.Thread(target=poll)
+    poller.start()
+    try:
+        harvester.cycle()
+        harvester.cycle()
+    finally:
+        done.set()
+        poller.join()
+    assert errors == [] and snapshots
+    rows = [s["inventory_rows"] for s in snapshots]
+    assert rows == sorted(rows)                     # counts only ever grow within a window
+    assert harvester.inventory.unlocked == []
@@ -0,0 +1,31 @@
+from dedup import content_hash, dedup_batch, normalize_text
+
+
+def test_normalize_collapses_ascii_whitespace_and_case():
+    assert normalize_text("  What IS\t2 +\n\n 2?\r\n") == "what is 2 + 2?"
+    assert normalize_text("a\fb\vc") == "a b c"
+
+
+def test_normalize_leaves_unicode_spaces_alone():
+    # Postgres' regexp class in schema.sql is ASCII-only; the two must agree
+    assert normalize_text("a\u00a0b") == "a\u00a0b"
+    assert normalize_text("a\u3000 b") == "a\u3000 b"
+
+
+def test_normalize_handles_empty():
+    assert normalize_text("") == ""
+    assert normalize_text(None) == ""
+
+
+def test_content_hash_is_stable_across_formatting():
+    assert content_hash("What is x?") == content_hash("  what   IS\nx?  ")
+    assert content_hash("What is x?") != content_hash("What is y?")
+    assert len(content_hash("q")) == 64
+
+
+def test_dedup_batch_keeps_first_and_stamps_hashes():
+    rows = [{"question_text": "Q one", "n": 1}, {"question_text": "q  ONE", "n": 2}, {"question_text": "Q two"}]
+    unique, dropped = dedup_batch(rows)
+    assert dropped == 1
+    assert [r.get("n") for r in unique] == [1, None]
+    assert all(r["content_hash"] == content_hash(r["question_text"]) for r in rows)
@@ -0,0 +1,95 @@
+import pytest
+
+import export_bank
+from export_bank import export, fetch_changes, load_manifest, read_shard, shard_key
+
+
+def _row(i: int, difficulty: str = "Easy") -> dict:
+    return {"module": "Math", "domain": "Heart_of_Algebra", "difficulty": difficulty, "is_spr": True,
+            "question_text": f"What is {i} + {i}?", "correct_answer": str(2 * i),
+            "rationale": f"{i} doubled.", "raw_original_text": f"source {i}"}
+
+
+@pytest.fixture(autouse=True)
+def no_settle(monkeypatch):
+    monkeypatch.setattr(export_bank, "EXPORT_SETTLE_SECONDS", 0)
+
+
+def _fetched(monkeypatch) -> list:
+    """Records every page export() pulls."""
+    pages = []
+    real = export_bank.fetch_changes
+
+    def spy(*args, **kwargs):
+        for page in real(*args, **kwargs):
+            pages.append(page)
+            yield page
+    monkeypatch.setattr(export_bank, "fetch_changes", spy)
+    return pages
+
+
+def test_full_export_writes_every_row(supabase, tmp_path):
+    supabase.seed("sat_question_bank", [_row(i) for i in range(7)] + [_row(i, "Hard") for i in range(7, 9)])
+    manifest = export(supabase, str(tmp_path))
+    assert manifest["rows"] == 9
+    assert set(manifest["shards"]) == {"Math__Heart_of_Algebra__Easy", "Math__Heart_of_Algebra__Hard"}
+    rows = read_shard("Math__Heart_of_Algebra__Easy", str(tmp_path), heavy=True)
+    assert len(rows) == 7 and all(r["raw_original_text"] for r in rows)
+    assert "raw_original_text" not in read_shard("Math__Heart_of_Algebra__Easy", str(tmp_path))[0]
+
+
+def test_delta_fetches_only_rows_after_the_watermark(supabase, tmp_path, monkeypatch):
+    supabase.seed("sat_question_bank", [_row(i) for i in range(5)])
+    first = export(supabase, str(tmp_path))
+    assert first["watermark"] is not None
+
+    supabase.seed("sat_question_bank", [_row(i) for i in range(5, 7)])
+    pages = _fetched(monkeypatch)
+    second = export(supabase, str(tmp_path))
+    assert sum(len(p) for p in pages) == 2
+    assert second["rows"] == 7
+    assert second["watermark"] > first["watermark"]
+
+
+def test_no_changes_keeps_the_cursor(supabase, tmp_path, monkeypatch):
+    supabase.seed("sat_question_bank", [_row(i) for i in range(4)])
+    first = export(supabase, str(tmp_path))
+    pages = _fetched(monkeypatch)
+    again = export(supabase, str(tmp_path))
+    assert pages == []
+    assert again["watermark"] == first["watermark"]
+    assert load_manifest(str(tmp_path))["watermark"] == first["watermark"]
+
+
+def test_retag_moves_row_between_shards(supabase, tmp_path):
+    supabase.seed("sat_question_bank", [_row(i) for i in range(4)])
+    export(supabase, str(tmp_path))
+    moved = supabase.table("sat_question_bank").select("*").eq("question_text", "What is 0 + 0?").execute().data[0]
+    supabase.table("sat_question_bank").update({"difficulty": "Medium"}).eq("id", moved["id"]).execute()
+
+    manifest = export(supabase, str(tmp_path))
+    assert manifest["shards"]["Math__Heart_of_Algebra__Easy"]["rows"] == 3
+    assert [r["id"] for r in read_shard("Math__Heart_of_Algebra__Medium", str(tmp_path))] == [moved["id"]]
+
+
+def test_fetch_changes_pages_in_keyset_order(supabase):
+    supabase.seed("sat_question_bank", [_row(i) for i in range(7)])
+    cutoff = supabase.now()
+    pages = list(fetch_changes(supabase, None, cutoff, page_size=3))
+    assert [len(p) for p in pages] == [3, 3, 1]
+    keys = [(r["updated_at"], r["id"]) for p in pages for r in p]
+    assert keys == sorted(keys) and len(set(keys)) == 7
+
+    rest = list(fetch_changes(supabase, list(keys[2]), cutoff, page_size=3))
+    assert [(r["updated_at"], r["id"]) for p in rest for r in p] == keys[3:]
+
+
+def test_rows_inside_the_settle_window_wait(supabase, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_bank, "EXPORT_SETTLE_SECONDS", 3600)
+    supabase.seed("sat_question_bank", [_row(1)])
+    manifest = export(supabase, str(tmp_path))
+    assert manifest["watermark"] is None and not manifest["shards"]
+
+
+def test_shard_key_is_filesystem_safe():
+    assert shard_key({"module": "Math", "domain": "a/b c", "difficulty": None}) == "Math__a_b_c__unknown"
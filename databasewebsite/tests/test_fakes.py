@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from fakes import StandInError, completion, prompt_kind
+
+
+def _row(**overrides) -> dict:
+    row = {"module": "Math", "domain": "Heart_of_Algebra", "difficulty": "Easy", "is_spr": True,
+           "question_text": "What is 1 + 1?", "correct_answer": "2", "content_hash": "h1"}
+    row.update(overrides)
+    return row
+
+
+def test_sqlite_enforces_schema_checks(supabase):
+    with pytest.raises(StandInError) as err:
+        supabase.table("sat_question_bank").insert(_row(domain="Algebra")).execute()
+    assert err.value.code == "23514"
+    with pytest.raises(StandInError) as err:
+        supabase.table("sat_question_bank").insert(_row(correct_answer=None)).execute()
+    assert err.value.code == "23502"
+
+
+def test_sqlite_unique_content_hash_and_ignore_duplicates(supabase):
+    supabase.table("sat_question_bank").insert(_row()).execute()
+    with pytest.raises(StandInError) as err:
+        supabase.table("sat_question_bank").insert(_row(question_text="Other")).execute()
+    assert err.value.code == "23505"
+    res = supabase.table("sat_question_bank").upsert(
+        [_row(question_text="Other"), _row(content_hash="h2")], on_conflict="content_hash", ignore_duplicates=True
+    ).execute()
+    assert [r["content_hash"] for r in res.data] == ["h2"]
+    assert supabase.count() == 2
+
+
+def test_sqlite_bulk_write_is_all_or_nothing(supabase):
+    with pytest.raises(StandInError):
+        supabase.table("sat_question_bank").insert([_row(), _row(content_hash="h2", domain="Algebra")]).execute()
+    assert supabase.count() == 0
+
+
+def test_sqlite_filters(supabase):
+    supabase.seed("sat_question_bank", [_row(), _row(content_hash="h2", difficulty="Hard"),
+                                        _row(content_hash="h3", domain="Algebra")], checked=False)
+    table = supabase.table
+    assert len(table("sat_question_bank").select("id").in_("difficulty", ["Hard"]).execute().data) == 1
+    broken = table("sat_question_bank").select("id").or_('domain.not.in.("Heart_of_Algebra")').execute().data
+    assert len(broken) == 1
+    counted = table("sat_question_bank").select("id", count="exact").eq("module", "Math").limit(1).execute()
+    assert counted.count == 3 and len(counted.data) == 1
+
+
+def test_update_touches_updated_at(supabase):
+    row = supabase.table("sat_question_bank").insert(_row()).execute().data[0]
+    supabase.table("sat_question_bank").update({"difficulty": "Hard"}).eq("id", row["id"]).execute()
+    # The trigger fires after the UPDATE, so read the row back rather than trusting RETURNING
+    updated = supabase.table("sat_question_bank").select("*").eq("id", row["id"]).execute().data[0]
+    assert updated["updated_at"] > row["updated_at"]
+
+
+def test_fake_groq_answers_batch_generation(groq):
+    prompt = ("Slot 0: Section Math | Domain Advanced_Math | Difficulty Hard | multiple\n"
+              "Slot 1: Section Reading_Writing | Domain Craft_Structure | Difficulty Easy | SPR\n")
+    assert prompt_kind(prompt) == "generate_batch"
+    content = groq.chat.completions.create(model="m", messages=[{"role": "user", "content": prompt}])
+    items = json.loads(content.choices[0].message.content)["questions"]
+    assert [(q["slot"], q["domain"], q["is_spr"]) for q in items] == [(0, "Advanced_Math", False),
+                                                                      (1, "Craft_Structure", True)]
+    assert groq.requests == 1
+
+
+def test_completion_shape():
+    resp = completion('{"a": 1}', "m", prompt_tokens=10)
+    assert resp.choices[0].message.content == '{"a": 1}'
+    assert resp.usage.total_tokens == 10 + resp.usage.completion_tokens
@@ -0,0 +1,78 @@
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from fakes import completion, fake_question
+from metrics import bucket_key
+from scraper import generate_batch, validate
+
+MATH = ("Math", "Heart_of_Algebra", "Easy", False)
+RW = ("Reading_Writing", "Craft_Structure", "Medium", False)
+SPR = ("Math", "Advanced_Math", "Hard", True)
+BUCKETS = [MATH, RW, SPR]
+SOURCES = ["passage one", "passage two", "passage three"]
+
+
+class Scripted:
+    """A groq-shaped client that always answers `content`."""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: list, **kwargs):
+        return completion(self.content, model)
+
+
+def _item(bucket: tuple, seed: int, **extra) -> dict:
+    return dict(fake_question(random.Random(seed), *bucket), **extra)
+
+
+def _generate(items: list) -> list:
+    return generate_batch(Scripted(json.dumps({"questions": items})), BUCKETS, SOURCES)
+
+
+def test_items_land_in_their_slots_whatever_the_order():
+    out = _generate([_item(SPR, 3, slot=2), _item(MATH, 1, slot=0), _item(RW, 2, slot=1)])
+    assert [(q["domain"], "slot" in q) for q in out] == [("Heart_of_Algebra", False), ("Craft_Structure", False),
+                                                          ("Advanced_Math", False)]
+
+
+def test_numeric_string_slots_are_coerced():
+    out = _generate([_item(SPR, 3, slot="2"), _item(MATH, 1, slot=" 0 "), _item(RW, 2, slot=1.0)])
+    assert [q["domain"] for q in out] == ["Heart_of_Algebra", "Craft_Structure", "Advanced_Math"]
+
+
+def test_missing_slot_falls_back_to_position():
+    out = _generate([_item(MATH, 1), _item(RW, 2)])
+    assert [q and q["domain"] for q in out] == ["Heart_of_Algebra", "Craft_Structure", None]
+
+
+def test_bad_slots_never_displace_good_items(fresh_metrics):
+    out = _generate([_item(MATH, 1, slot=0), _item(RW, 2, slot=0), _item(RW, 4, slot=7),
+                     _item(RW, 5, slot="second"), "not an object", _item(SPR, 3, slot=2)])
+    assert [q and q["domain"] for q in out] == ["Heart_of_Algebra", None, "Advanced_Math"]
+    assert fresh_metrics.snapshot()["slot_unparseable"] == 1
+
+
+def test_validate_accepts_an_item_that_matches_its_slot():
+    q = validate(_item(SPR, 3), *SPR)
+    assert q["is_spr"] is True and q["options"] is None
+
+
+def test_validate_pins_off_enum_tags():
+    q = validate(_item(MATH, 1, domain="Algebra", difficulty="Moderate"), *MATH)
+    assert (q["domain"], q["difficulty"]) == ("Heart_of_Algebra", "Easy")
+
+
+@pytest.mark.parametrize("item, reason", [
+    (_item(RW, 2), "wrong_module"),                              # an RW item in a Math slot
+    (_item(MATH, 1, domain="Advanced_Math"), "wrong_domain"),
+    (_item(MATH, 1, difficulty="Hard"), "wrong_difficulty"),
+    (_item(MATH, 1, is_spr=True), "wrong_is_spr"),
+])
+def test_validate_rejects_items_tagged_for_another_bucket(item, reason, fresh_metrics):
+    assert validate(item, *MATH) is None
+    assert fresh_metrics.buckets[bucket_key(MATH)][f"reason:{reason}"] == 1
@@ -0,0 +1,142 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import groq_client
+from fakes import FakeRateLimitError, completion
+from groq_client import AdaptiveGroq, CircuitOpenError, is_retryable
+
+COOLDOWN = 0.05
+GEN, CLASSIFY = "llama-3.3-70b-versatile", "llama-3.1-8b-instant"
+
+
+class APIError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"Error code: {status}")
+        self.status_code = status
+
+
+class Scripted:
+    """A groq-shaped client that replays `outcomes` (an exception to raise or a string to answer)."""
+
+    def __init__(self):
+        self.outcomes = []
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: list, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "{}"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return completion(outcome, model)
+
+
+@pytest.fixture
+def inner():
+    return Scripted()
+
+
+@pytest.fixture
+def client(inner, monkeypatch):
+    monkeypatch.setattr(groq_client.random, "uniform", lambda a, b: 0.0)     # no backoff sleeps
+    return AdaptiveGroq(inner, max_retries=0, breaker_threshold=2, breaker_cooldown=COOLDOWN)
+
+
+def call(client, model: str = GEN):
+    return client.chat.completions.create(model=model, messages=[{"role": "user", "content": "hi"}])
+
+
+def fail(client, inner, exc, model: str = GEN):
+    inner.outcomes.append(exc)
+    with pytest.raises(type(exc)):
+        call(client, model)
+
+
+def trip(client, inner, model: str = GEN):
+    for _ in range(client.breaker_threshold):
+        fail(client, inner, APIError(503), model)
+
+
+def test_retryable_classification():
+    assert is_retryable(APIError(429)) and is_retryable(APIError(503))
+    assert not is_retryable(APIError(400)) and not is_retryable(ValueError("x"))
+    assert is_retryable(FakeRateLimitError())
+
+
+def test_retries_then_succeeds(inner, monkeypatch, fresh_metrics):
+    monkeypatch.setattr(groq_client.random, "uniform", lambda a, b: 0.0)
+    client = AdaptiveGroq(inner, max_retries=2, breaker_threshold=5, breaker_cooldown=COOLDOWN)
+    inner.outcomes += [APIError(503), FakeRateLimitError(), '{"ok": true}']
+    assert call(client).choices[0].message.content == '{"ok": true}'
+    counters = fresh_metrics.snapshot()
+    assert counters["retries"] == 2 and counters["rate_limited"] == 1
+    assert counters[f"groq_attempts:{GEN}"] == 3
+
+
+def test_opens_after_threshold_and_fails_fast(client, inner, fresh_metrics):
+    fail(client, inner, APIError(503))
+    call(client)                           # a success in between resets the count
+    trip(client, inner)
+    calls = inner.calls
+    with pytest.raises(CircuitOpenError):
+        call(client)
+    assert inner.calls == calls
+    assert client.stats()["breaker_open"] == [GEN]
+    assert fresh_metrics.snapshot()["groq_breaker_opened"] == 1
+
+
+def test_breaker_is_per_model(client, inner):
+    trip(client, inner, CLASSIFY)
+    with pytest.raises(CircuitOpenError):
+        call(client, CLASSIFY)
+    assert call(client, GEN) is not None
+
+
+def test_probe_success_closes(client, inner):
+    trip(client, inner)
+    time.sleep(COOLDOWN * 1.5)
+    call(client)
+    call(client)
+    assert client.stats()["breaker_open"] == []
+
+
+def test_probe_failure_reopens_with_doubled_cooldown(client, inner):
+    trip(client, inner)
+    time.sleep(COOLDOWN * 1.5)
+    fail(client, inner, APIError(503))
+    assert client._limits(GEN).cooldown == pytest.approx(2 * COOLDOWN)
+    time.sleep(COOLDOWN * 1.2)
+    with pytest.raises(CircuitOpenError):
+        call(client)
+
+
+def test_only_one_probe_at_a_time(client, inner):
+    trip(client, inner)
+    time.sleep(COOLDOWN * 1.5)
+    assert client._admit(GEN) is True
+    with pytest.raises(CircuitOpenError):
+        call(client)
+
+
+def test_probe_answered_with_400_closes(client, inner):
+    trip(client, inner)
+    time.sleep(COOLDOWN * 1.5)
+    fail(client, inner, APIError(400))
+    assert call(client) is not None
+    assert client.stats()["breaker_open"] == []
+
+
+def test_probe_ending_in_local_error_lets_the_next_call_probe(client, inner):
+    trip(client, inner)
+    time.sleep(COOLDOWN * 1.5)
+    fail(client, inner, KeyError("boom"))
+    assert call(client) is not None
+    assert client.stats()["breaker_open"] == []
+
+
+def test_non_retryable_errors_do_not_count_towards_opening(client, inner):
+    for _ in range(5):
+        fail(client, inner, APIError(400))
+    assert call(client) is not None
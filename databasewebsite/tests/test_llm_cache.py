@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache
+
+TAGS = {"module": "Math", "domain": "Advanced_Math", "difficulty": "Hard"}
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", c)
+    return c
+
+
+def _rows(path: str) -> dict:
+    with sqlite3.connect(path) as db:
+        return {k: (exp, acc) for k, exp, acc in db.execute("SELECT key, expires_at, last_access FROM entries")}
+
+
+def test_hit_ignores_whitespace_and_case(tmp_path, clock):
+    cache = LLMCache(str(tmp_path / "c.sqlite3"))
+    cache.put("m", "v1", "What is  x?", TAGS)
+    assert cache.get("m", "v1", "  what is x? ") == TAGS
+    assert cache.get("m", "v2", "What is x?") is None      # new prompt version misses
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "hit_rate": 0.5}
+
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite3")
+    cache = LLMCache(path, ttl=100)
+    cache.put("m", "v1", "long", TAGS)
+    cache.put("m", "v1", "short", {"error": "invalid"}, ttl=10)
+    clock.now += 50
+    assert cache.get("m", "v1", "short") is None
+    assert cache.get("m", "v1", "long") == TAGS
+    assert len(_rows(path)) == 1                             # the expired entry was dropped on read
+    clock.now += 51
+    assert cache.get("m", "v1", "long") is None
+
+
+def test_evicts_least_recently_used_past_max_entries(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(llm_cache, "EVICT_CHECK_EVERY", 1)
+    cache = LLMCache(str(tmp_path / "c.sqlite3"), max_entries=3)
+    for text in ("a", "b", "c"):
+        clock.now += 1
+        cache.put("m", "v1", text, TAGS)
+    clock.now += 1
+    assert cache.get("m", "v1", "a") == TAGS                 # "a" is now the most recent
+    clock.now += 1
+    cache.put("m", "v1", "d", TAGS)
+    assert cache.get("m", "v1", "b") is None
+    assert all(cache.get("m", "v1", t) == TAGS for t in ("a", "c", "d"))
+    assert cache.evictions == 1
+
+
+def test_close_trims_to_max_entries(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite3")
+    cache = LLMCache(path, max_entries=2)
+    for text in ("a", "b", "c", "d"):
+        clock.now += 1
+        cache.put("m", "v1", text, TAGS)
+    cache.close()
+    assert len(_rows(path)) == 2
+
+
+def test_read_only_never_writes(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite3")
+    writer = LLMCache(path, ttl=100, max_entries=1)
+    writer.put("m", "v1", "fresh", TAGS)
+    writer.put("m", "v1", "stale", TAGS, ttl=1)
+    before = _rows(path)
+
+    clock.now += 50
+    reader = LLMCache(path, ttl=100, max_entries=1, read_only=True)
+    assert reader.get("m", "v1", "fresh") == TAGS
+    assert reader.get("m", "v1", "stale") is None
+    reader.put("m", "v1", "new", TAGS)
+    reader.close()
+    assert _rows(path) == before      # no expiry DELETE, no last_access bump, no eviction, no insert
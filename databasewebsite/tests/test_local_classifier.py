@@ -0,0 +1,65 @@
+import os
+import random
+import time
+
+import pytest
+
+import local_classifier
+from bench import bank_rows
+from local_classifier import LocalClassifier, load_or_train
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Counts trips to the bank for training rows."""
+    calls = []
+    real = local_classifier.fetch_training_rows
+
+    def spy(supabase):
+        calls.append(1)
+        return real(supabase)
+    monkeypatch.setattr(local_classifier, "fetch_training_rows", spy)
+    return calls
+
+
+def _age(path: str, hours: float) -> None:
+    then = time.time() - hours * 3600
+    os.utime(path, (then, then))
+
+
+def test_trains_and_saves_when_the_bank_is_big_enough(supabase, tmp_path, fetches):
+    supabase.seed("sat_question_bank", bank_rows(400, random.Random(1)))
+    path = str(tmp_path / "model.json")
+    model = load_or_train(supabase, path=path)
+    assert isinstance(model, LocalClassifier) and os.path.exists(path)
+    assert {"module", "domain", "difficulty", "confident"} <= set(model.predict("Solve 3x + 4 = 19 for x."))
+    assert load_or_train(supabase, path=path) is not None
+    assert len(fetches) == 1                         # the fresh model was reused
+
+
+def test_failed_retrain_waits_max_age_before_retrying(supabase, tmp_path, fetches):
+    supabase.seed("sat_question_bank", bank_rows(20, random.Random(1)))
+    path = str(tmp_path / "model.json")
+    assert load_or_train(supabase, max_age_hours=24, path=path) is None
+    assert os.path.exists(path + ".tried")
+    assert load_or_train(supabase, max_age_hours=24, path=path) is None
+    assert len(fetches) == 1                         # no second page-through of the bank
+
+    _age(path + ".tried", 25)
+    supabase.seed("sat_question_bank", bank_rows(400, random.Random(2)))
+    assert load_or_train(supabase, max_age_hours=24, path=path) is not None
+    assert len(fetches) == 2
+    assert not os.path.exists(path + ".tried")
+
+
+def test_stale_model_is_kept_when_retraining_fails(supabase, tmp_path, fetches):
+    supabase.seed("sat_question_bank", bank_rows(400, random.Random(1)))
+    path = str(tmp_path / "model.json")
+    load_or_train(supabase, path=path)
+    _age(path, 48)
+    supabase.table("sat_question_bank").delete().neq("module", "").execute()
+    model = load_or_train(supabase, max_age_hours=24, path=path)
+    assert isinstance(model, LocalClassifier)
+    assert os.path.exists(path + ".tried")
+    assert isinstance(load_or_train(supabase, max_age_hours=24, path=path), LocalClassifier)
+    assert len(fetches) == 2                         # the stale model is used until the marker ages out
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from fakes import completion
+from metrics import RunMetrics, percentile, to_prometheus
+
+MATH = ("Math", "Heart_of_Algebra", "Easy", False)
+BIG, SMALL = "llama-3.3-70b-versatile", "llama-3.1-8b-instant"
+
+
+@pytest.fixture
+def run():
+    m = RunMetrics()
+    m.record_usage(completion("x" * 400, BIG, prompt_tokens=1000, completion_tokens=500))
+    m.record_usage(completion("x" * 400, BIG, prompt_tokens=1000, completion_tokens=500))
+    m.record_usage(completion("{}", SMALL, prompt_tokens=2000, completion_tokens=100), prefix="repair_classify_")
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        m.observe("groq_generate", seconds)
+    m.outcome(MATH, "accepted")
+    m.outcome(MATH, "accepted")
+    m.outcome(MATH, "invalid")
+    m.reject(MATH, "wrong_domain")
+    m.inc("retries", 3)
+    return m
+
+
+def test_percentile_is_nearest_rank():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert [percentile(values, p) for p in (0, 10, 50, 51, 99, 100)] == [1, 1, 5, 6, 10, 10]
+    assert percentile([4, 8, 15, 16], 50) == 8 and percentile([], 50) == 0.0
+
+
+def test_report_totals_and_per_accepted(run):
+    r = run.report({"model": BIG})
+    assert (r["accepted"], r["requests"], r["model"]) == (2, 2, BIG)
+    assert r["tokens"] == {"prompt": 2000, "completion": 1000, "total": 3000, "cached_prompt": 0}
+    assert r["per_accepted"]["requests"] == 1.0 and r["per_accepted"]["tokens"] == 1500.0
+    assert r["counters"]["repair_classify_requests"] == 1 and r["counters"]["retries"] == 3
+    assert r["stages"]["groq_generate"] == {"n": 4, "p50_ms": 200.0, "p99_ms": 400.0, "total_s": 1.0}
+    assert r["buckets"] == {"Math|Heart_of_Algebra|Easy|0": {"accepted": 2, "invalid": 1,
+                                                                  "reason:wrong_domain": 1}}
+
+
+def test_each_model_is_priced_at_its_own_rate(run):
+    r = run.report()
+    generation = (2000 * 0.59 + 1000 * 0.79) / 1e6
+    repair = (2000 * 0.05 + 100 * 0.08) / 1e6
+    assert r["estimated_usd"] == pytest.approx(generation + repair, abs=1e-6)
+    assert r["per_accepted"]["estimated_usd"] == pytest.approx(generation / 2, abs=1e-6)
+
+
+def test_empty_run_reports_no_ratios():
+    r = RunMetrics().report()
+    assert r["accepted"] == 0 and r["per_accepted"] == {"requests": None, "tokens": None, "estimated_usd": None}
+    assert "harvester_tokens_per_accepted" not in to_prometheus(r)
+
+
+def test_prometheus_exposition(run):
+    text = to_prometheus(run.report())
+    lines = text.splitlines()
+    assert 'harvester_counter{name="retries"} 3' in lines
+    assert 'harvester_stage_seconds_count{stage="groq_generate"} 4' in lines
+    assert 'harvester_stage_seconds{stage="groq_generate",quantile="0.99"} 0.400000' in lines
+    bucket = 'module="Math",domain="Heart_of_Algebra",difficulty="Easy",is_spr="0"'
+    assert f'harvester_bucket_outcomes{{{bucket},outcome="accepted"}} 2' in lines
+    assert f'harvester_bucket_rejections{{{bucket},reason="wrong_domain"}} 1' in lines
+    assert "harvester_tokens_per_accepted 1500.0" in lines
+    assert text.endswith("\n")
+    samples = [ln for ln in lines if not ln.startswith("#")]
+    assert all(len(ln.rsplit(" ", 1)) == 2 for ln in samples)
+
+
+def test_write_produces_report_history_and_textfile(run, tmp_path):
+    paths = {"path": str(tmp_path / "r" / "report.json"), "history_path": str(tmp_path / "r" / "history.jsonl"),
+             "prom_path": str(tmp_path / "prom" / "harvester.prom")}
+    run.write(**paths)
+    run.write(**paths)
+    with open(paths["path"]) as f:
+        assert json.load(f)["accepted"] == 2
+    with open(paths["history_path"]) as f:
+        history = [json.loads(line) for line in f]
+    assert len(history) == 2 and history[0]["outcomes"] == {"accepted": 2, "invalid": 1}
+    with open(paths["prom_path"]) as f:
+        assert "harvester_run_duration_seconds" in f.read()
@@ -0,0 +1,74 @@
+from near_dup import NearDupIndex, signature, similarity
+
+STEM = ("A botanist measured the height of 40 sunflower seedlings each morning for three weeks and "
+        "recorded the growth in a table. Based on the table, which choice best describes how the "
+        "average daily growth changed between the first and the third week of the study?")
+OPTIONS = ["It doubled", "It halved", "It stayed the same", "It tripled"]
+UNRELATED = ("The function f is defined by f(x) = 3x^2 - 12x + 7. For what value of x does f reach its "
+             "minimum, and what is the minimum value of f on the real numbers?")
+
+
+def test_signature_ignores_whitespace_and_numbers():
+    assert signature(STEM, OPTIONS) == signature(STEM, OPTIONS)
+    variant = "  " + STEM.replace("40", "25").replace(" and ", "\n and  ") + "\n"
+    assert similarity(signature(STEM, OPTIONS), signature(variant, OPTIONS)) == 1.0
+
+
+def test_similarity_separates_paraphrase_from_unrelated():
+    edited = STEM.replace("sunflower", "tomato")
+    assert similarity(signature(STEM), signature(edited)) > 0.8
+    assert similarity(signature(STEM), signature(UNRELATED)) < 0.2
+
+
+def test_catches_light_edit():
+    index = NearDupIndex()
+    index.add("orig", STEM, OPTIONS)
+    match = index.query(STEM.replace("sunflower", "tomato"), OPTIONS)
+    assert match is not None and match[0] == "orig"
+
+
+def test_does_not_catch_unrelated_question():
+    index = NearDupIndex()
+    index.add("orig", STEM, OPTIONS)
+    assert index.query(UNRELATED) is None
+
+
+def test_does_not_catch_same_template_with_new_content():
+    index = NearDupIndex()
+    index.add("orig", STEM, OPTIONS)
+    other = ("A chemist heated 12 samples of copper sulfate solution in a water bath and logged the "
+             "temperature every minute. Which statement about the cooling curve after the bath was "
+             "removed is best supported by the data?")
+    assert index.query(other) is None
+
+
+def test_staged_rows_are_checked_but_not_indexed_until_confirmed():
+    index = NearDupIndex()
+    match, sig = index.check(STEM, OPTIONS)
+    assert match is None
+    index.stage("new", sig)
+    assert len(index) == 0
+    assert index.check(STEM, OPTIONS)[0][0] == "new"
+
+    index.confirm("new")
+    assert len(index) == 1 and "new" in index.local_keys
+    assert index.query(STEM, OPTIONS)[0] == "new"
+
+
+def test_discarded_rows_stop_matching():
+    index = NearDupIndex()
+    _, sig = index.check(STEM, OPTIONS)
+    index.stage("dropped", sig)
+    index.discard("dropped")
+    assert index.check(STEM, OPTIONS)[0] is None
+    assert len(index) == 0
+
+
+def test_save_load_roundtrip(tmp_path):
+    index = NearDupIndex()
+    index.add("orig", STEM, OPTIONS)
+    index.add("other", UNRELATED)
+    index.save(str(tmp_path))
+    loaded = NearDupIndex.load(str(tmp_path))
+    assert len(loaded) == 2
+    assert loaded.query(STEM, OPTIONS)[0] == "orig"
@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+import scraper
+from dedup import content_hash
+from fakes import SQLiteSupabase, StandInError, fake_question
+from ratelimit import TokenBucket
+from scraper import flush_batch
+
+MATH = ("Math", "Heart_of_Algebra", "Easy", False)
+
+
+def _questions(n: int, seed: int = 1, bucket: tuple = MATH) -> list:
+    rng = random.Random(seed)
+    return [dict(fake_question(rng, *bucket), source_method="Automated_Pipeline") for _ in range(n)]
+
+
+class CountingSupabase(SQLiteSupabase):
+    """Counts requests per table so round trips can be asserted."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def table(self, name: str):
+        self.requests += 1
+        return super().table(name)
+
+
+@pytest.fixture
+def db():
+    return CountingSupabase()
+
+
+def test_flush_writes_a_batch_in_two_round_trips(db):
+    batch = _questions(5)
+    assert flush_batch(db, batch) == ["accepted"] * 5
+    assert db.requests == 2             # one IN lookup, one upsert
+    assert db.count() == 5
+    stored = db.table("sat_question_bank").select("content_hash").execute().data
+    assert {r["content_hash"] for r in stored} == {content_hash(q["question_text"]) for q in batch}
+
+
+def test_flush_skips_rows_already_in_the_bank(db):
+    first = _questions(3)
+    flush_batch(db, [dict(q) for q in first])
+    again = [dict(first[1], question_text="  " + first[1]["question_text"].upper())] + _questions(1, seed=2)
+    assert flush_batch(db, again) == ["duplicate", "accepted"]
+    assert db.count() == 4
+
+
+def test_flush_drops_in_batch_repeats(db):
+    q = _questions(1)[0]
+    assert flush_batch(db, [dict(q), dict(q)]) == ["accepted", "duplicate"]
+    assert db.count() == 1
+
+
+def test_flush_relies_on_the_unique_index_when_the_lookup_fails(db, monkeypatch, fresh_metrics):
+    existing = _questions(1)[0]
+    flush_batch(db, [dict(existing)])
+    original_table = db.table
+
+    def failing_lookup(name):
+        query = original_table(name)
+        query.in_ = lambda *a, **k: (_ for _ in ()).throw(StandInError("timeout", "57014"))
+        return query
+    monkeypatch.setattr(db, "table", failing_lookup)
+    outcomes = flush_batch(db, [dict(existing)] + _questions(1, seed=3))
+    assert outcomes == ["duplicate", "accepted"]     # ignore_duplicates absorbed the known row
+    assert fresh_metrics.snapshot()["dedup_lookup_errors"] == 1
+    assert db.count() == 2
+
+
+def test_flush_isolates_a_bad_row(db, fresh_metrics):
+    batch = _questions(3)
+    batch[1]["domain"] = "Algebra"      # trips the valid_domain CHECK, rejecting the bulk upsert
+    assert flush_batch(db, batch) == ["accepted", "insert_failed", "accepted"]
+    assert db.count() == 2
+    assert fresh_metrics.snapshot()["insert_fallbacks"] == 1
+
+
+def test_flush_empty_batch_makes_no_requests(db):
+    assert flush_batch(db, []) == []
+    assert db.requests == 0
+
+
+def _passages(n: int) -> list:
+    return [{"id": f"test:{i}", "text": f"Source passage number {i} about linear equations and rates."} for i in range(n)]
+
+
+def test_run_pipeline_writes_accepted_rows_in_bulk(db, groq, monkeypatch):
+    monkeypatch.setattr(scraper, "INSERT_BATCH_SIZE", 4)
+    flushed = []
+    real_flush = scraper.flush_batch
+    monkeypatch.setattr(scraper, "flush_batch", lambda sb, batch: flushed.append(len(batch)) or real_flush(sb, batch))
+    queue = [MATH, ("Reading_Writing", "Craft_Structure", "Medium", False)] * 5
+    inventory: dict = {}
+    inserted, skipped = scraper.run_pipeline(db, groq, queue, _passages(len(queue)),
+                                             limiter=TokenBucket(60_000, burst=10), inventory=inventory)
+    assert inserted + skipped == len(queue)
+    assert inserted == db.count() == sum(inventory.values()) > 0
+    assert all(n <= 4 for n in flushed) and sum(flushed) >= inserted
+    sources = {r["source_ref"] for r in db.table("sat_question_bank").select("source_ref").execute().data}
+    assert sources <= {p["id"] for p in _passages(len(queue))}
+
+
+def test_run_pipeline_indexes_only_written_rows(db, groq, monkeypatch):
+    from near_dup import NearDupIndex
+
+    real_flush = scraper.flush_batch
+
+    def flaky_flush(sb, batch):
+        # The first row of every batch "fails" at the database
+        return ["insert_failed"] + real_flush(sb, batch[1:]) if batch else []
+    monkeypatch.setattr(scraper, "flush_batch", flaky_flush)
+    index = NearDupIndex()
+    queue = [MATH] * 6
+    inserted, _ = scraper.run_pipeline(db, groq, queue, _passages(len(queue)), near_dups=index,
+                                       limiter=TokenBucket(60_000, burst=10))
+    stored = {r["content_hash"] for r in db.table("sat_question_bank").select("content_hash").execute().data}
+    assert inserted == len(stored) > 0
+    assert set(index.ids) == index.local_keys == stored     # confirmed rows only
+    assert index._staged == {}                              # failures and duplicates were discarded
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from fakes import fake_question
+from prompts import (GENERATION_SYSTEM_PROMPT, estimate_tokens, generation_messages, prompt_breakdown,
+                     trim_to_tokens)
+
+PASSAGE = ("The committee met on Tuesday. It reviewed three proposals for the new library. "
+           "The second proposal, which added a reading garden, won by a wide margin! "
+           "Construction begins next spring?")
+
+
+def test_estimate_tokens_roughly_tracks_words():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("The cat sat.") == 4
+    assert estimate_tokens("12345") == 2                     # digits group in threes
+    assert estimate_tokens("internationalization") == 4     # long words split
+
+
+def test_short_text_is_returned_whole():
+    assert trim_to_tokens("  One short sentence.  ", budget=50) == "One short sentence."
+    assert trim_to_tokens(None, budget=5) == ""
+
+
+def test_trims_on_a_sentence_boundary():
+    out = trim_to_tokens(PASSAGE, budget=22)
+    assert out == "The committee met on Tuesday. It reviewed three proposals for the new library."
+    assert trim_to_tokens(PASSAGE, budget=21) == "The committee met on Tuesday."
+
+
+def test_one_long_sentence_falls_back_to_whole_words():
+    sentence = " ".join(["alpha"] * 40) + "."
+    out = trim_to_tokens(sentence, budget=10)
+    assert out.endswith("…") and set(out[:-1].split()) == {"alpha"}
+    assert estimate_tokens(out) <= 10
+
+
+@pytest.mark.parametrize("budget", [1, 5, 17, 60, 120])
+def test_never_exceeds_the_budget(budget):
+    rng = random.Random(budget)
+    for _ in range(20):
+        text = " ".join(fake_question(rng, "Reading_Writing", "Craft_Structure", "Hard", False)["question_text"]
+                        for _ in range(4))
+        out = trim_to_tokens(text, budget)
+        assert estimate_tokens(out) <= budget
+        assert text.split()[:len(out.rstrip("…").split())] == out.rstrip("…").split()     # a prefix, in whole words
+
+
+def test_messages_share_a_fixed_system_prefix():
+    buckets = [("Math", "Advanced_Math", "Hard", True), ("Reading_Writing", "Craft_Structure", "Easy", False)]
+    a = generation_messages(buckets, [PASSAGE, PASSAGE], budget=20)
+    b = generation_messages(buckets[:1], ["Something else entirely."], budget=20)
+    assert a[0] == b[0] == {"role": "system", "content": GENERATION_SYSTEM_PROMPT}
+    user = a[1]["content"]
+    assert "Slot 0: Section Math | Domain Advanced_Math | Difficulty Hard | SPR" in user
+    assert "Slot 1: Section Reading_Writing | Domain Craft_Structure | Difficulty Easy | multiple choice" in user
+    assert user.count("[1] The committee met on Tuesday.") == 1 and "garden" not in user
+    counts = prompt_breakdown(a)
+    assert counts["total"] == counts["system"] + counts["user"]
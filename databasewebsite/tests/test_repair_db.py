@@ -0,0 +1,109 @@
+import json
+import os
+import random
+
+import pytest
+
+import repair_db
+import routing
+from backends import DryRunSupabase
+from bench import bank_rows, broken_rows
+from fakes import FakeGroq, SQLiteSupabase
+from llm_cache import LLMCache
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    rng = random.Random(3)
+    db = SQLiteSupabase()
+    db.seed("sat_question_bank", bank_rows(5, rng))
+    db.seed("sat_question_bank", broken_rows(12, rng), checked=False)
+    monkeypatch.setattr(repair_db, "supabase", db)
+    monkeypatch.setattr(repair_db, "groq_client", FakeGroq(latency=0.0, seed=7))
+    monkeypatch.setattr(repair_db, "cache", LLMCache(str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(repair_db, "local_model", None)
+    monkeypatch.setattr(repair_db, "CHECKPOINT_PATH", str(tmp_path / "ckpt" / "repair_checkpoint.json"))
+    monkeypatch.setattr(routing, "GROQ_RPM", 60_000)
+    monkeypatch.setattr(routing, "GROQ_RPM_CLASSIFY", 60_000)
+    routing.reset_limiters()
+    return db
+
+
+@pytest.fixture
+def seen(monkeypatch):
+    """Ids passed to repair_row, and what it returned."""
+    calls = []
+    real = repair_db.repair_row
+
+    def spy(row):
+        ok = real(row)
+        calls.append((row["id"], ok))
+        return ok
+    monkeypatch.setattr(repair_db, "repair_row", spy)
+    return calls
+
+
+def _broken(db) -> list:
+    return db.table("sat_question_bank").select("id").or_(repair_db.BROKEN_ROWS_FILTER).order("id").execute().data
+
+
+def _checkpoint(mode: str) -> dict:
+    with open(repair_db._checkpoint_path(mode)) as f:
+        return json.load(f)
+
+
+def test_walk_fixes_every_broken_row_and_removes_its_checkpoint(db, seen):
+    repair_db.stream_repair(page_size=5)
+    assert len(seen) == 12 and all(ok for _, ok in seen)
+    assert _broken(db) == []
+    assert not os.path.exists(repair_db._checkpoint_path("broken"))
+
+
+def test_interrupted_walk_resumes_after_the_last_row(db, seen, monkeypatch):
+    real = repair_db.repair_row
+
+    def crash_on_fifth(row):
+        if len(seen) == 4:
+            raise KeyboardInterrupt
+        return real(row)
+    monkeypatch.setattr(repair_db, "repair_row", crash_on_fifth)
+    with pytest.raises(KeyboardInterrupt):
+        repair_db.stream_repair(page_size=5)
+    ckpt = _checkpoint("broken")
+    assert (ckpt["scanned"], ckpt["fixed"], ckpt["last_id"]) == (4, 4, seen[-1][0])
+    assert not os.path.exists(repair_db._checkpoint_path("all"))      # each mode has its own file
+
+    resumed_from = len(seen)
+    monkeypatch.setattr(repair_db, "repair_row", real)
+    repair_db.stream_repair(page_size=5)
+    ids = [rid for rid, _ in seen]
+    assert len(ids) == len(set(ids)) == 12                              # nothing skipped, nothing repeated
+    assert all(rid > ckpt["last_id"] for rid in ids[resumed_from:])
+    assert _broken(db) == []
+
+
+def test_checkpoint_from_another_filter_is_ignored(db, seen):
+    path = repair_db._checkpoint_path("broken")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    last = _broken(db)[-1]["id"]
+    with open(path, "w") as f:
+        json.dump({"mode": "broken", "filter": "domain.eq.Old", "last_id": last,
+                   "scanned": 99, "fixed": 99, "failed": 0}, f)
+    repair_db.stream_repair(page_size=5)
+    assert len(seen) == 12
+
+
+def test_dry_run_counts_dropped_updates_as_fixed_and_leaves_the_checkpoint(db, seen, monkeypatch):
+    monkeypatch.setattr(repair_db, "DRY_RUN", True)
+    monkeypatch.setattr(repair_db, "supabase", DryRunSupabase(db))
+    path = repair_db._checkpoint_path("broken")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    saved = {"mode": "broken", "filter": repair_db.BROKEN_ROWS_FILTER, "last_id": _broken(db)[3]["id"],
+             "scanned": 4, "fixed": 4, "failed": 0}
+    with open(path, "w") as f:
+        json.dump(saved, f)
+
+    repair_db.stream_repair(page_size=5)
+    assert len(seen) == 8 and all(ok for _, ok in seen)
+    assert len(_broken(db)) == 12                   # nothing was written
+    assert _checkpoint("broken") == saved           # neither advanced nor removed
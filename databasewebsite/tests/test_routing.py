@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+import routing
+from ratelimit import TokenBucket
+from routing import MODEL_CLASSIFY, MODEL_ESCALATE, classify_tiered, escalation_reason, routing_summary
+
+TAGS = {"module": "Math", "domain": "Advanced_Math", "difficulty": "Hard", "confidence": 0.9}
+
+
+def _guess(domain: str, confidence: float) -> dict:
+    return {"module": "Math", "domain": domain, "difficulty": "Hard", "confidence": confidence, "confident": False}
+
+
+@pytest.mark.parametrize("tags, guess, reason", [
+    (None, None, "invalid"),
+    (dict(TAGS, domain="Algebra"), None, "invalid"),
+    (dict(TAGS, difficulty="Moderate"), None, "invalid"),
+    (dict(TAGS, domain="Craft_Structure"), None, "inconsistent"),
+    (dict(TAGS, confidence=0.5), None, "low_confidence"),
+    (dict(TAGS, confidence="high"), None, "low_confidence"),
+    (TAGS, None, None),
+    (TAGS, _guess("Advanced_Math", 0.99), None),
+    (TAGS, _guess("Heart_of_Algebra", 0.4), None),          # a weak local guess doesn't dispute
+    (TAGS, _guess("Heart_of_Algebra", "n/a"), None),
+    (TAGS, _guess("Heart_of_Algebra", 0.8), "disputed"),
+])
+def test_escalation_reason(tags, guess, reason):
+    assert escalation_reason(tags, guess) == reason
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    """Both tiers answer instantly; the small model always agrees with itself."""
+    monkeypatch.setattr(routing, "GROQ_RPM", 60_000)
+    monkeypatch.setattr(routing, "GROQ_RPM_CLASSIFY", 60_000)
+    routing.reset_limiters()
+    calls = {MODEL_CLASSIFY: 0, MODEL_ESCALATE: 0}
+
+    def classify(model, tier, chunk):
+        calls[model] += len(chunk)
+        return {str(r["id"]): dict(TAGS) for r in chunk}
+    yield classify, calls
+    routing.reset_limiters()
+
+
+def _escalated(tiers, guesses: dict, n: int) -> float:
+    classify, calls = tiers
+    rows = [{"id": i, "question_text": f"q{i}"} for i in range(n)]
+    final, _ = classify_tiered(rows, classify, batch_size=10, local_guesses=guesses,
+                               generation_limiter=TokenBucket(60_000, burst=10), rng=random.Random(0))
+    assert len(final) == n
+    return calls[MODEL_ESCALATE] / n
+
+
+def test_weak_local_disagreement_escalates_only_the_audit_sample(tiers, fresh_metrics):
+    # What the repair path hands over: guesses the local model wasn't confident enough to use
+    rng = random.Random(1)
+    guesses = {str(i): _guess("Heart_of_Algebra", rng.uniform(0.3, routing.ROUTING_DISPUTE_MIN - 0.01))
+               for i in range(400)}
+    rate = _escalated(tiers, guesses, 400)
+    assert rate <= 2 * routing.ROUTING_AUDIT_RATE
+    assert "disputed" not in routing_summary(fresh_metrics.snapshot())["escalated"]
+
+
+def test_confident_local_disagreement_escalates(tiers, fresh_metrics):
+    guesses = {str(i): _guess("Heart_of_Algebra", 0.85) for i in range(50)}
+    assert _escalated(tiers, guesses, 50) == 1.0
+    assert routing_summary(fresh_metrics.snapshot())["escalated"] == {"disputed": 50}
+
+
+def test_dispute_floor_is_configurable(tiers, monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_AUDIT_RATE", 0.0)
+    monkeypatch.setattr(routing, "ROUTING_DISPUTE_MIN", 0.0)
+    guesses = {str(i): _guess("Heart_of_Algebra", 0.1) for i in range(20)}
+    assert _escalated(tiers, guesses, 20) == 1.0
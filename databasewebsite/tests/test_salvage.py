@@ -0,0 +1,111 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from fakes import completion
+from salvage import (answer_in_options, invalid_fields, parse_counted, parse_lenient, reask_field,
+                     salvage_items)
+
+QUESTION = {"question_text": "What is 2 + 2?", "options": ["3", "4", "5", "6"], "correct_answer": "4",
+            "is_spr": False}
+
+
+class Scripted:
+    """A groq-shaped client that always answers `content`."""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model: str, messages: list, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        return completion(self.content, model)
+
+
+@pytest.mark.parametrize("raw, how", [
+    ('{"a": 1}', "strict"),
+    ('```json\n{"a": 1}\n```', "fenced"),
+    ('Sure! Here it is:\n{"a": 1}\nAnything else?', "extracted"),
+    ('{"a": 1, "b": [1, 2,],}', "trailing_commas"),
+])
+def test_parse_lenient_repairs(raw, how):
+    obj, got = parse_lenient(raw)
+    assert got == how
+    assert obj["a"] == 1
+
+
+@pytest.mark.parametrize("raw", [None, "", "no json here", '{"a": 1', "[1, 2]"])
+def test_parse_lenient_gives_up_on_unrecoverable(raw):
+    assert parse_lenient(raw) == (None, "failed")
+
+
+def test_parse_counted_counts_repairs(fresh_metrics):
+    assert parse_counted('```\n{"a": 1}\n```') == {"a": 1}
+    assert parse_counted("garbage") is None
+    counters = fresh_metrics.snapshot()
+    assert counters["salvage_parse_attempts"] == 2
+    assert counters["salvage_parse_recovered"] == 1
+
+
+def test_salvage_items_keeps_complete_items_of_a_truncated_batch():
+    full = json.dumps({"questions": [{"slot": 0, "q": "a"}, {"slot": 1, "q": "b"}, {"slot": 2, "q": "c"}]})
+    truncated = full[:full.index('{"slot": 2') + 12]
+    assert [i["slot"] for i in salvage_items(truncated)] == [0, 1]
+    assert salvage_items('{"other": []}') == []
+
+
+def test_invalid_fields():
+    assert invalid_fields(QUESTION, False) == []
+    assert invalid_fields({**QUESTION, "options": ["3", "4", "5"]}, False) == ["options"]
+    assert invalid_fields({**QUESTION, "correct_answer": "7"}, False) == ["correct_answer"]
+    assert invalid_fields({**QUESTION, "correct_answer": ""}, False) == ["correct_answer"]
+    assert invalid_fields({"question_text": "x", "correct_answer": "12", "is_spr": True}, True) == []
+    assert invalid_fields("not a dict", False) == ["*"]
+
+
+def test_answer_in_options_ignores_surrounding_whitespace():
+    assert answer_in_options(" 4 ", ["3", "4"])
+    assert not answer_in_options("4.0", ["3", "4"])
+
+
+def test_reask_options_with_fake_groq_keeps_the_answer(groq):
+    data = {**QUESTION, "options": ["4", "5"]}
+    assert reask_field(groq, "llama-3.3-70b-versatile", data, "options")
+    assert len(data["options"]) == 4
+    assert answer_in_options(data["correct_answer"], data["options"])
+
+
+def test_reask_answer_with_fake_groq_picks_an_option(groq, fresh_metrics):
+    data = {**QUESTION, "correct_answer": "seven"}
+    assert reask_field(groq, "llama-3.3-70b-versatile", data, "correct_answer")
+    assert data["correct_answer"] in data["options"]
+    assert fresh_metrics.snapshot()["reask_recovered"] == 1
+
+
+def test_reask_rejects_options_that_drop_the_answer(fresh_metrics):
+    data = {**QUESTION, "options": ["4"]}
+    client = Scripted('{"options": ["1", "2", "3", "5"]}')
+    assert not reask_field(client, "m", data, "options")
+    assert data["options"] == ["4"]
+    assert fresh_metrics.snapshot()["reask_options_rejected"] == 1
+    assert '"options"' not in client.prompts[0].split("QUESTION:\n", 1)[1].split("\n", 1)[0]
+
+
+def test_reask_rejects_an_answer_outside_the_options():
+    data = {**QUESTION, "correct_answer": ""}
+    assert not reask_field(Scripted('{"correct_answer": "9"}'), "m", data, "correct_answer")
+    assert data["correct_answer"] == ""
+
+
+def test_reask_accepts_any_value_for_grid_in():
+    data = {"question_text": "x?", "correct_answer": "", "is_spr": True, "options": None}
+    assert reask_field(Scripted('{"correct_answer": 12}'), "m", data, "correct_answer")
+    assert data["correct_answer"] == "12"
+
+
+def test_reask_survives_unparseable_reply():
+    data = dict(QUESTION)
+    assert not reask_field(Scripted("sorry, no"), "m", data, "options")
+    assert data == QUESTION
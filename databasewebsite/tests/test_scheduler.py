@@ -0,0 +1,79 @@
+import math
+
+import pytest
+
+from scheduler import SchedulerState, largest_remainder, plan_queue
+
+A = ("Math", "Heart_of_Algebra", "Easy", False)
+B = ("Math", "Advanced_Math", "Hard", False)
+C = ("Reading_Writing", "Craft_Structure", "Medium", False)
+
+
+def test_largest_remainder_hits_total_exactly():
+    alloc = largest_remainder({"a": 1, "b": 1, "c": 1}, 10)
+    assert sum(alloc.values()) == 10
+    assert sorted(alloc.values()) == [3, 3, 4]
+
+
+def test_largest_remainder_rounds_by_remainder():
+    # quotas 4.5 / 3.3 / 2.2: the floors leave one seat, it goes to the largest remainder
+    assert largest_remainder({"a": 45, "b": 33, "c": 22}, 10) == {"a": 5, "b": 3, "c": 2}
+
+
+def test_largest_remainder_skips_zero_weights():
+    alloc = largest_remainder({"a": 0, "b": 2, "c": 1}, 6)
+    assert alloc == {"a": 0, "b": 4, "c": 2}
+
+
+def test_largest_remainder_reapportions_capped_seats():
+    alloc = largest_remainder({"a": 10, "b": 3, "c": 1}, 10, caps={"a": 2, "b": 10, "c": 10})
+    assert alloc == {"a": 2, "b": 6, "c": 2}
+
+
+def test_largest_remainder_stops_at_sum_of_caps():
+    alloc = largest_remainder({"a": 1, "b": 1}, 50, caps={"a": 3, "b": 4})
+    assert alloc == {"a": 3, "b": 4}
+
+
+@pytest.mark.parametrize("total", [0, 1, 7, 100])
+def test_largest_remainder_sum_matches_contract(total):
+    caps = {"a": 5, "b": 0, "c": 20}
+    alloc = largest_remainder({"a": 3, "b": 5, "c": 1}, total, caps=caps)
+    assert sum(alloc.values()) == min(total, sum(caps.values()))
+    assert all(alloc[k] <= caps[k] for k in caps)
+
+
+def test_plan_queue_funds_deficits_only():
+    state = SchedulerState()
+    queue, plan = plan_queue({A: 10, B: 4, C: 0}, [A, B, C], target=10, budget=12, state=state)
+    assert len(queue) == 12
+    assert plan[A][3] == 0
+    assert plan[C][3] > plan[B][3] > 0
+
+
+def test_plan_queue_caps_each_bucket_at_its_deficit_over_acceptance():
+    state = SchedulerState()
+    _, plan = plan_queue({A: 9, B: 9}, [A, B], target=10, budget=100, state=state)
+    for b in (A, B):
+        actual, deficit, accept, slots = plan[b]
+        assert slots == math.ceil(deficit / accept)
+
+
+def test_plan_queue_weights_by_acceptance():
+    state = SchedulerState()
+    for _ in range(30):
+        state.record(A, "invalid")
+        state.record(B, "accepted")
+    _, plan = plan_queue({A: 0, B: 0}, [A, B], target=50, budget=20, state=state)
+    assert plan[A][2] < plan[B][2]
+    assert plan[A][3] > plan[B][3]
+
+
+def test_plan_queue_keeps_growing_when_every_bucket_is_full():
+    queue, _ = plan_queue({A: 10, B: 10}, [A, B], target=10, budget=4, state=SchedulerState())
+    assert sorted(queue) == sorted([A, A, B, B])
+
+
+def test_record_rejects_unknown_outcome():
+    with pytest.raises(ValueError):
+        SchedulerState().record(A, "exploded")